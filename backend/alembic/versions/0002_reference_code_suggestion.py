@@ -0,0 +1,30 @@
+"""Add ocr_info_clothes.reference_code_suggestion
+
+Revision ID: 0002_reference_code_suggestion
+Revises: 0001_initial
+Create Date: 2026-10-19
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_reference_code_suggestion"
+down_revision: str | None = "0001_initial"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "ocr_info_clothes",
+        sa.Column("reference_code_suggestion", sa.String(length=64), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("ocr_info_clothes", "reference_code_suggestion")
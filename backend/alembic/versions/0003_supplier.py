@@ -0,0 +1,40 @@
+"""Add supplier registry
+
+Revision ID: 0003_supplier
+Revises: 0002_reference_code_suggestion
+Create Date: 2026-10-19
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_supplier"
+down_revision: str | None = "0002_reference_code_suggestion"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "supplier",
+        sa.Column("cif_supplier", sa.String(length=32), primary_key=True, nullable=False),
+        sa.Column("name_supplier", sa.String(length=255), nullable=True),
+        sa.Column("canonical_prefix", sa.String(length=16), nullable=True),
+        sa.Column("name_variants", sa.JSON(), nullable=True),
+        sa.Column("settings", sa.JSON(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("supplier")
@@ -0,0 +1,53 @@
+"""Idempotent webhook ingestion
+
+Revision ID: 0004_idempotency
+Revises: 0003_supplier
+Create Date: 2026-10-19
+
+Note: the unique `(source_channel, source_message_id)` constraint fails if the
+table already holds duplicated deliveries; deduplicate them before upgrading.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_idempotency"
+down_revision: str | None = "0003_supplier"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("data_ocr_invoice") as batch_op:
+        batch_op.create_unique_constraint(
+            "uq_invoice_source_message", ["source_channel", "source_message_id"]
+        )
+
+    op.create_table(
+        "idempotency_record",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("scope", sa.String(length=64), nullable=False),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=False),
+        sa.Column("response", sa.JSON(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+        ),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("scope", "idempotency_key", name="uq_idempotency_scope_key"),
+    )
+    op.create_index("ix_idempotency_record_expires_at", "idempotency_record", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_idempotency_record_expires_at", table_name="idempotency_record")
+    op.drop_table("idempotency_record")
+
+    with op.batch_alter_table("data_ocr_invoice") as batch_op:
+        batch_op.drop_constraint("uq_invoice_source_message", type_="unique")
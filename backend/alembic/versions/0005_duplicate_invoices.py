@@ -0,0 +1,56 @@
+"""Duplicate supplier invoice detection
+
+Revision ID: 0005_duplicate_invoices
+Revises: 0004_idempotency
+Create Date: 2026-10-19
+
+Note: the partial unique index on `(cif_supplier, num_invoice)` fails if the
+table already holds duplicated invoices; link or remove them before upgrading.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_duplicate_invoices"
+down_revision: str | None = "0004_idempotency"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("data_ocr_invoice") as batch_op:
+        batch_op.add_column(sa.Column("duplicate_of_invoice_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_data_ocr_invoice_duplicate_of",
+            "data_ocr_invoice",
+            ["duplicate_of_invoice_id"],
+            ["id"],
+            ondelete="SET NULL",
+        )
+    op.create_index(
+        "ix_data_ocr_invoice_duplicate_of_invoice_id", "data_ocr_invoice", ["duplicate_of_invoice_id"], unique=False
+    )
+    op.create_index(
+        "ix_data_ocr_invoice_invoice_file_sha256", "data_ocr_invoice", ["invoice_file_sha256"], unique=False
+    )
+    op.create_index(
+        "uq_invoice_supplier_number",
+        "data_ocr_invoice",
+        ["cif_supplier", "num_invoice"],
+        unique=True,
+        sqlite_where=sa.text("duplicate_of_invoice_id IS NULL AND cif_supplier <> 'UNKNOWN'"),
+        postgresql_where=sa.text("duplicate_of_invoice_id IS NULL AND cif_supplier <> 'UNKNOWN'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_invoice_supplier_number", table_name="data_ocr_invoice")
+    op.drop_index("ix_data_ocr_invoice_invoice_file_sha256", table_name="data_ocr_invoice")
+    op.drop_index("ix_data_ocr_invoice_duplicate_of_invoice_id", table_name="data_ocr_invoice")
+    with op.batch_alter_table("data_ocr_invoice") as batch_op:
+        batch_op.drop_constraint("fk_data_ocr_invoice_duplicate_of", type_="foreignkey")
+        batch_op.drop_column("duplicate_of_invoice_id")
@@ -0,0 +1,51 @@
+"""Monthly price observation rollups
+
+Revision ID: 0006_price_rollups
+Revises: 0005_duplicate_invoices
+Create Date: 2026-10-19
+
+Also indexes `price_observation.created_at` for the compaction job.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_price_rollups"
+down_revision: str | None = "0005_duplicate_invoices"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "price_observation_monthly",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("reference_code", sa.String(length=64), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("min_price", sa.Float(), nullable=False),
+        sa.Column("max_price", sa.Float(), nullable=False),
+        sa.Column("sum_price", sa.Float(), nullable=False),
+        sa.Column("sketch", sa.JSON(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+        ),
+        sa.UniqueConstraint("reference_code", "month", name="uq_price_rollup_reference_month"),
+    )
+    op.create_index(
+        "ix_price_observation_monthly_reference_code", "price_observation_monthly", ["reference_code"], unique=False
+    )
+    op.create_index("ix_price_observation_created_at", "price_observation", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_price_observation_created_at", table_name="price_observation")
+    op.drop_index("ix_price_observation_monthly_reference_code", table_name="price_observation_monthly")
+    op.drop_table("price_observation_monthly")
@@ -0,0 +1,38 @@
+"""Partition key for invoice lines
+
+Revision ID: 0007_line_partition_key
+Revises: 0006_price_rollups
+Create Date: 2026-10-19
+
+Adds `ocr_info_clothes.invoice_created_at` (copy of the invoice's `created_at`),
+backfilled from `data_ocr_invoice`. Quarter partitioning itself is opt-in and
+Postgres-only: `python -m scripts.partitions enable` (see `app/db/partitioning.py`).
+Downgrading requires un-partitioned tables.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_line_partition_key"
+down_revision: str | None = "0006_price_rollups"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("ocr_info_clothes") as batch_op:
+        batch_op.add_column(sa.Column("invoice_created_at", sa.DateTime(), nullable=True))
+    op.execute(
+        "UPDATE ocr_info_clothes SET invoice_created_at = "
+        "(SELECT created_at FROM data_ocr_invoice WHERE data_ocr_invoice.id = ocr_info_clothes.invoice_id) "
+        "WHERE invoice_created_at IS NULL"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("ocr_info_clothes") as batch_op:
+        batch_op.drop_column("invoice_created_at")
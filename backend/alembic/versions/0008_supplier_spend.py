@@ -0,0 +1,64 @@
+"""Supplier spend summaries per quarter
+
+Revision ID: 0008_supplier_spend
+Revises: 0007_line_partition_key
+Create Date: 2026-10-19
+
+Tables start empty: fill them once with `python -m scripts.rebuild_supplier_spend`.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_supplier_spend"
+down_revision: str | None = "0007_line_partition_key"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "supplier_spend_quarterly",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("cif_supplier", sa.String(length=32), nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("quarter", sa.Integer(), nullable=False),
+        sa.Column("invoice_count", sa.Integer(), nullable=False),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("line_count", sa.Integer(), nullable=False),
+        sa.Column("units", sa.Integer(), nullable=False),
+        sa.Column("flagged_lines", sa.Integer(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+        ),
+        sa.UniqueConstraint("cif_supplier", "year", "quarter", name="uq_supplier_spend_quarter"),
+    )
+    op.create_table(
+        "supplier_spend_invoice",
+        sa.Column(
+            "invoice_id",
+            sa.Integer(),
+            sa.ForeignKey("data_ocr_invoice.id", ondelete="CASCADE"),
+            primary_key=True,
+            nullable=False,
+        ),
+        sa.Column("cif_supplier", sa.String(length=32), nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("quarter", sa.Integer(), nullable=False),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("line_count", sa.Integer(), nullable=False),
+        sa.Column("units", sa.Integer(), nullable=False),
+        sa.Column("flagged_lines", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("supplier_spend_invoice")
+    op.drop_table("supplier_spend_quarterly")
@@ -0,0 +1,77 @@
+"""Bank movements and cash-register closings imported from CSV
+
+Revision ID: 0009_bank_cash_imports
+Revises: 0008_supplier_spend
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_bank_cash_imports"
+down_revision: str | None = "0008_supplier_spend"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "bank_movement",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("fecha", sa.Date(), nullable=False),
+        sa.Column("descripcion", sa.Text(), nullable=False),
+        sa.Column("importe", sa.Float(), nullable=False),
+        sa.Column("saldo", sa.Float(), nullable=True),
+        sa.Column("referencia_1", sa.String(length=255), nullable=True),
+        sa.Column("referencia_2", sa.String(length=255), nullable=True),
+        sa.Column("identificacion", sa.String(length=64), nullable=True),
+        sa.Column("especificacion", sa.String(length=255), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+        ),
+        sa.UniqueConstraint("fingerprint", name="uq_bank_movement_fingerprint"),
+    )
+    op.create_index("ix_bank_movement_fecha", "bank_movement", ["fecha"], unique=False)
+    op.create_index("ix_bank_movement_identificacion", "bank_movement", ["identificacion"], unique=False)
+
+    op.create_table(
+        "cash_closing",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("fecha", sa.Date(), nullable=False),
+        sa.Column("caja", sa.String(length=32), nullable=False),
+        sa.Column("numero", sa.String(length=32), nullable=True),
+        sa.Column("empleado", sa.String(length=128), nullable=True),
+        sa.Column("ventas_totales", sa.Float(), nullable=True),
+        sa.Column("venta_efectivo", sa.Float(), nullable=True),
+        sa.Column("entrada", sa.Float(), nullable=True),
+        sa.Column("salida", sa.Float(), nullable=True),
+        sa.Column("calculado", sa.Float(), nullable=True),
+        sa.Column("declarado", sa.Float(), nullable=True),
+        sa.Column("descuadre", sa.Float(), nullable=True),
+        sa.Column("retirado", sa.Float(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+        ),
+        sa.UniqueConstraint("fingerprint", name="uq_cash_closing_fingerprint"),
+    )
+    op.create_index("ix_cash_closing_fecha", "cash_closing", ["fecha"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_cash_closing_fecha", table_name="cash_closing")
+    op.drop_table("cash_closing")
+    op.drop_index("ix_bank_movement_identificacion", table_name="bank_movement")
+    op.drop_index("ix_bank_movement_fecha", table_name="bank_movement")
+    op.drop_table("bank_movement")
@@ -0,0 +1,34 @@
+"""Materialized quarterly close report
+
+Revision ID: 0010_quarterly_report
+Revises: 0009_bank_cash_imports
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_quarterly_report"
+down_revision: str | None = "0009_bank_cash_imports"
+branch_labels: str | None = None
+depends_on: str | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "quarterly_report",
+        sa.Column("year", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("quarter", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("generated_at", sa.DateTime(), nullable=True),
+        sa.Column("invalidated_at", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("quarterly_report")
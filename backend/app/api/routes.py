@@ -8,6 +8,7 @@ This module defines the FastAPI endpoints for:
 - Managing invoice lines and reference codes.
 - Upserting and reading the Montcau article master.
 - Exporting invoice lines to a Montcau-compatible import payload.
+- Importing and classifying bank movements / cash-register closings (CSV exports).
 
 Security:
 - Write endpoints use `AuthDep` (API key required by default when configured).
@@ -16,47 +17,186 @@ Security:
 
 import hashlib
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
-from fastapi.responses import FileResponse
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
+from fastapi.responses import FileResponse, PlainTextResponse
+from sqlalchemy import delete, select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.api.schemas import (
+    AmbiguousMatchOut,
+    ArticleMatchOut,
     ArticleOut,
     ArticleUpsert,
+    BankClassificationOut,
+    BankClassifyRequest,
+    CashReconciliationOut,
     ClothesLineCreate,
     ClothesLineOut,
+    CsvImportOut,
     InvoiceCreate,
+    InvoiceMatchesOut,
     InvoiceOut,
     InvoiceStatusUpdate,
     IngestInvoiceOcr,
     IngestLineOcr,
     LineSetReference,
     ProcessInvoiceResult,
+    QuarterlyReportOut,
+    ReferenceBatchNormalize,
+    ReferenceBatchNormalizeOut,
+    SupplierOut,
+    SupplierSpendOut,
+    SupplierUpsert,
 )
-from app.db.models import DataOcrInvoice, ImportacionArticulosMontcau, OcrInfoClothes, PriceObservation
-from app.db.session import get_db
+from app.db.models import (
+    DataOcrInvoice,
+    ImportacionArticulosMontcau,
+    OcrInfoClothes,
+    PriceObservation,
+    Supplier,
+    SupplierSpendQuarterly,
+)
+from app.db.partitioning import line_partition_filter, observation_partition_filter
+from app.db.session import DbRunner, get_db, get_db_runner, get_primary_db, pool_stats, statement_cache_stats
+from app.db.statements import article_by_reference, invoice_lines
 from app.settings import get_settings
 from app.api.deps import AuthDep, AuthReadDep, read_upload_limited, validate_upload
-from app.services.ocr import OcrService
+from app.services.bank_classifier import BankMovement, classify_movements
+from app.services.bulk_insert import insert_lines, insert_price_observations, observation_rows
+from app.services.cash_reconciliation import reconcile_cash
+from app.services.csv_import import ImportResult, import_bank_csv, import_cash_csv
+from app.services.duplicates import DuplicateMatch, find_duplicate_invoice
+from app.services.idempotency import find_replay, idempotency_key_for, remember_response
+from app.services.line_diff import diff_lines
+from app.services.metrics import ARTICLE_UPSERTS, PRICE_FLAGS, REGISTRY
+from app.services.ocr import OcrService, ParsedInvoice, ParsedLine
+from app.services.payment_matching import match_quarter
 from app.services.pricing import apply_price_decision, evaluate_price
-from app.services.reference_code import generate_reference_code, normalize_reference_code
+from app.services.quarterly_report import cached_report, materialize_report, report_csv
+from app.services.reference_code import generate_reference_code, normalize_reference_code, normalize_reference_codes
+from app.services.reference_match import find_reference_candidates, get_reference_index, register_reference
 from app.services.storage import save_invoice_upload
+from app.services.supplier_spend import refresh_invoice_spend
+from app.services.suppliers import (
+    normalize_invoice_references,
+    resolve_supplier_prefix,
+    upsert_supplier,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def _record_price_flag(flag: str, reference_code: str | None) -> None:
+    """Count a price flag and log it (the log line is subject to sampling)."""
+    PRICE_FLAGS.inc(flag=flag)
+    logger.info("price_flag", extra={"flag": flag, "reference_code": reference_code})
+
+
+def _match_reference(db: Session, line: OcrInfoClothes, taken: set[str] | None = None) -> None:
+    """Link or suggest a master reference when the line's reference is unknown.
+
+    Uses the warm fuzzy index (see `services/reference_match`). In `auto_link`
+    mode a unique close candidate replaces `reference_code` (origin `fuzzy`);
+    otherwise the best candidate is stored in `reference_code_suggestion`.
+    `taken` holds references already used by sibling lines of the same invoice.
+    """
+    settings = get_settings()
+    if settings.reference_match_mode == "off" or not line.reference_code:
+        return
+    index = get_reference_index(db)
+    if line.reference_code in index:
+        return
+    candidates = index.candidates(line.reference_code, max_distance=settings.reference_match_max_distance, limit=2)
+    if not candidates:
+        return
+
+    best = candidates[0]
+    unique = len(candidates) == 1 or candidates[1].distance > best.distance
+    if (
+        settings.reference_match_mode == "auto_link"
+        and unique
+        and best.distance <= settings.reference_match_auto_link_max_distance
+        and best.reference_code not in (taken or ())
+    ):
+        line.reference_code = best.reference_code
+        line.reference_code_origin = "fuzzy"
+        return
+    line.reference_code_suggestion = best.reference_code
+
+
+def _invoice_by_source_message(
+    db: Session, source_channel: str | None, source_message_id: str | None
+) -> DataOcrInvoice | None:
+    """Return the invoice created from a given webhook message, if any."""
+    if not source_channel or not source_message_id:
+        return None
+    q = select(DataOcrInvoice).where(
+        DataOcrInvoice.source_channel == source_channel,
+        DataOcrInvoice.source_message_id == source_message_id,
+    )
+    return db.scalars(q).first()
+
+
+def _invoice_result(db: Session, invoice: DataOcrInvoice, *, articles_upserted: int) -> ProcessInvoiceResult:
+    """Build a `ProcessInvoiceResult` from the stored invoice and its lines."""
+    saved_lines = invoice_lines(db, invoice)
+    return ProcessInvoiceResult(invoice=invoice, lines=saved_lines, articles_upserted=articles_upserted)
+
+
+def _handle_duplicate(
+    db: Session,
+    match: DuplicateMatch,
+    response: Response,
+    candidate: DataOcrInvoice,
+) -> ProcessInvoiceResult:
+    """Apply `EMMO_DUPLICATE_INVOICE_POLICY` to an invoice that duplicates `match.invoice`.
+
+    - `reject`: 409, nothing is stored.
+    - `merge`: the original invoice (and its lines) is returned unchanged.
+    - `link`: `candidate` is stored header-only with `status=duplicate` and
+      `duplicate_of_invoice_id` set; no lines, observations or article upserts.
+
+    Sets `X-Duplicate-Of` on the response for `merge` and `link`.
+    """
+    original = match.invoice
+    policy = get_settings().duplicate_invoice_policy
+    if policy == "merge":
+        response.headers["X-Duplicate-Of"] = str(original.id)
+        return _invoice_result(db, original, articles_upserted=0)
+    if policy == "link":
+        candidate.status = "duplicate"
+        candidate.duplicate_of_invoice_id = original.id
+        db.add(candidate)
+        db.flush()
+        db.refresh(candidate)
+        response.headers["X-Duplicate-Of"] = str(original.id)
+        return _invoice_result(db, candidate, articles_upserted=0)
+    raise HTTPException(
+        status_code=409,
+        detail=f"Duplicate invoice: matches invoice {original.id} by {match.reason}",
+    )
+
+
 @router.get("/health")
 def health():
     """Basic liveness check."""
     return {"status": "ok"}
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(_: None = AuthReadDep):
+    """Prometheus text exposition of this worker's metrics."""
+    if not get_settings().metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @router.get("/health/db")
 def health_db(db: Session = Depends(get_db)):
     """Database connectivity check.
@@ -70,11 +210,28 @@ def health_db(db: Session = Depends(get_db)):
     return {"status": "ok", "db": value}
 
 
+@router.get("/health/db/pools")
+def health_db_pools(_: None = AuthReadDep):
+    """Connection pool status per engine (`primary`, `read`, `async`)."""
+    return pool_stats()
+
+
+@router.get("/health/db/statement-cache")
+def health_db_statement_cache(_: None = AuthReadDep):
+    """Compiled-statement cache per engine (entries/capacity) and lookups by result since start."""
+    return statement_cache_stats()
+
+
 @router.post("/invoices", response_model=InvoiceOut)
 def create_invoice(payload: InvoiceCreate, db: Session = Depends(get_db), _: None = AuthDep):
     invoice = DataOcrInvoice(**payload.model_dump())
     db.add(invoice)
-    db.commit()
+    try:
+        refresh_invoice_spend(db, invoice)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Duplicate invoice (cif_supplier, num_invoice)")
     db.refresh(invoice)
     return invoice
 
@@ -131,6 +288,7 @@ def update_invoice_status(
     if payload.clear_error:
         invoice.last_error_code = None
         invoice.last_error_message = None
+    refresh_invoice_spend(db, invoice)
     db.commit()
     db.refresh(invoice)
     return invoice
@@ -179,20 +337,24 @@ def add_invoice_line(
         raise HTTPException(status_code=404, detail="Invoice not found")
 
     line = OcrInfoClothes(invoice_id=invoice_id, **payload.model_dump())
+    prefix = resolve_supplier_prefix(db, cif_supplier=line.cif_supplier, name_supplier=line.name_supplier)
     if line.reference_code:
         line.reference_code_raw = line.reference_code
         if get_settings().enforce_reference_code_prefix:
             line.reference_code = normalize_reference_code(
                 name_supplier=line.name_supplier,
                 reference_code=line.reference_code,
+                prefix=prefix,
             )
         if line.reference_code_origin is None:
             line.reference_code_origin = "manual"
+        _match_reference(db, line)
     if line.reference_code is None and get_settings().auto_reference_code:
         line.reference_code = generate_reference_code(
             name_supplier=line.name_supplier,
             description=line.description,
             num_invoice=line.num_invoice,
+            prefix=prefix,
         )
         if line.reference_code:
             line.reference_code_origin = "auto"
@@ -212,15 +374,13 @@ def add_invoice_line(
 
     article = None
     if line.reference_code:
-        q = select(ImportacionArticulosMontcau).where(
-            ImportacionArticulosMontcau.reference_code == line.reference_code
-        )
-        article = db.scalars(q).first()
+        article = article_by_reference(db, line.reference_code)
         decision = evaluate_price(db=db, line=line, article=article)
         apply_price_decision(line, decision)
         if decision.flag:
-            logger.info("price_flag", extra={"flag": decision.flag, "reference_code": line.reference_code})
+            _record_price_flag(decision.flag, line.reference_code)
     try:
+        refresh_invoice_spend(db, invoice)
         db.commit()
     except IntegrityError:
         db.rollback()
@@ -248,7 +408,11 @@ def set_line_reference(
 
     line.reference_code_raw = payload.reference_code
     line.reference_code = (
-        normalize_reference_code(name_supplier=line.name_supplier, reference_code=payload.reference_code)
+        normalize_reference_code(
+            name_supplier=line.name_supplier,
+            reference_code=payload.reference_code,
+            prefix=resolve_supplier_prefix(db, cif_supplier=line.cif_supplier, name_supplier=line.name_supplier),
+        )
         if get_settings().enforce_reference_code_prefix
         else payload.reference_code
     )
@@ -260,10 +424,7 @@ def set_line_reference(
         raise HTTPException(status_code=409, detail="Duplicate reference_code for this invoice")
 
     # Upsert minimal article now that we have a reference
-    q = select(ImportacionArticulosMontcau).where(
-        ImportacionArticulosMontcau.reference_code == line.reference_code
-    )
-    article = db.scalars(q).first()
+    article = article_by_reference(db, line.reference_code)
     if article is None:
         article = ImportacionArticulosMontcau(
             reference_code=line.reference_code,
@@ -273,6 +434,7 @@ def set_line_reference(
         )
         db.add(article)
         db.commit()
+        register_reference(db, article.reference_code)
 
     if line.price is not None and line.reference_code:
         try:
@@ -294,7 +456,13 @@ def set_line_reference(
 
 
 @router.post("/ingest/invoice", response_model=ProcessInvoiceResult)
-def ingest_invoice_ocr(payload: IngestInvoiceOcr, db: Session = Depends(get_db), _: None = AuthDep):
+def ingest_invoice_ocr(
+    payload: IngestInvoiceOcr,
+    response: Response,
+    db: Session = Depends(get_db),
+    _: None = AuthDep,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
     """Ingest a pre-parsed OCR payload (e.g., WhatsApp/Telegram integration).
 
     The request is expected to contain the already extracted invoice header and
@@ -308,6 +476,13 @@ def ingest_invoice_ocr(payload: IngestInvoiceOcr, db: Session = Depends(get_db),
       `reference_code` are present.
     - Evaluates pricing rules and updates `price_flag` accordingly.
 
+    Idempotency: retries with the same `Idempotency-Key` header (or the same
+    `source_channel` + `source_message_id`) replay the first response and set
+    `Idempotent-Replayed: true`, without touching lines, pricing or articles.
+
+    Duplicates: a `(cif_supplier, num_invoice)` already stored is handled by
+    `EMMO_DUPLICATE_INVOICE_POLICY` (reject/merge/link) before any line work.
+
     Args:
         payload: Invoice header and lines extracted by OCR.
         db: SQLAlchemy session.
@@ -316,99 +491,142 @@ def ingest_invoice_ocr(payload: IngestInvoiceOcr, db: Session = Depends(get_db),
         The saved invoice, its saved lines, and the number of articles upserted.
     """
 
-    with db.begin():
-        invoice = DataOcrInvoice(
-            cif_supplier=payload.cif_supplier,
-            name_supplier=payload.name_supplier,
-            tel_number_supplier=payload.tel_number_supplier,
-            email_supplier=payload.email_supplier,
-            num_invoice=payload.num_invoice,
-            total_invoice_amount=payload.total_invoice_amount,
-            invoice_type=payload.invoice_type,
-            optional_fields=payload.optional_fields,
-            raw_text=payload.raw_text,
-            source_channel=payload.source_channel,
-            source_thread_id=payload.source_thread_id,
-            source_message_id=payload.source_message_id,
-            status="draft",
-        )
-        db.add(invoice)
-        db.flush()
+    key = idempotency_key_for(
+        idempotency_key,
+        source_channel=payload.source_channel,
+        source_message_id=payload.source_message_id,
+    )
 
-        out_lines: list[OcrInfoClothes] = []
-        for ln in payload.lines:
-            line = OcrInfoClothes(invoice_id=invoice.id, **ln.model_dump())
-            if line.reference_code:
-                line.reference_code_raw = line.reference_code
-                if get_settings().enforce_reference_code_prefix:
-                    line.reference_code = normalize_reference_code(
+    try:
+        with db.begin():
+            if key:
+                replay = find_replay(db, scope="ingest_invoice", key=key)
+                if replay is not None:
+                    response.headers["Idempotent-Replayed"] = "true"
+                    return replay
+                existing = _invoice_by_source_message(db, payload.source_channel, payload.source_message_id)
+                if existing is not None:
+                    # Stored response already evicted: rebuild it from the saved rows.
+                    response.headers["Idempotent-Replayed"] = "true"
+                    return _invoice_result(db, existing, articles_upserted=0)
+
+            header = dict(
+                cif_supplier=payload.cif_supplier,
+                name_supplier=payload.name_supplier,
+                tel_number_supplier=payload.tel_number_supplier,
+                email_supplier=payload.email_supplier,
+                num_invoice=payload.num_invoice,
+                total_invoice_amount=payload.total_invoice_amount,
+                invoice_type=payload.invoice_type,
+                optional_fields=payload.optional_fields,
+                raw_text=payload.raw_text,
+                source_channel=payload.source_channel,
+                source_thread_id=payload.source_thread_id,
+                source_message_id=payload.source_message_id,
+            )
+            duplicate = find_duplicate_invoice(db, cif_supplier=payload.cif_supplier, num_invoice=payload.num_invoice)
+            if duplicate is not None:
+                result = _handle_duplicate(db, duplicate, response, DataOcrInvoice(**header))
+                if key:
+                    remember_response(db, scope="ingest_invoice", key=key, response=result.model_dump(mode="json"))
+                return result
+
+            invoice = DataOcrInvoice(**header, status="draft")
+            db.add(invoice)
+            db.flush()
+
+            out_lines: list[OcrInfoClothes] = []
+            taken: set[str] = set()
+            for ln in payload.lines:
+                line = OcrInfoClothes(invoice_id=invoice.id, **ln.model_dump())
+                prefix = resolve_supplier_prefix(db, cif_supplier=line.cif_supplier, name_supplier=line.name_supplier)
+                if line.reference_code:
+                    line.reference_code_raw = line.reference_code
+                    if get_settings().enforce_reference_code_prefix:
+                        line.reference_code = normalize_reference_code(
+                            name_supplier=line.name_supplier,
+                            reference_code=line.reference_code,
+                            prefix=prefix,
+                        )
+                    if line.reference_code_origin is None:
+                        line.reference_code_origin = "ocr"
+                    _match_reference(db, line, taken)
+                if line.reference_code is None and get_settings().auto_reference_code:
+                    line.reference_code = generate_reference_code(
                         name_supplier=line.name_supplier,
-                        reference_code=line.reference_code,
+                        description=line.description,
+                        num_invoice=line.num_invoice,
+                        prefix=prefix,
                     )
-                if line.reference_code_origin is None:
-                    line.reference_code_origin = "ocr"
-            if line.reference_code is None and get_settings().auto_reference_code:
-                line.reference_code = generate_reference_code(
-                    name_supplier=line.name_supplier,
-                    description=line.description,
-                    num_invoice=line.num_invoice,
-                )
+                    if line.reference_code:
+                        line.reference_code_origin = "auto"
                 if line.reference_code:
-                    line.reference_code_origin = "auto"
-            db.add(line)
-            out_lines.append(line)
-
-        db.flush()
-        for line in out_lines:
-            if line.price is not None and line.reference_code:
-                db.add(
-                    PriceObservation(
-                        cif_supplier=line.cif_supplier,
+                    taken.add(line.reference_code)
+                out_lines.append(line)
+
+            out_lines = insert_lines(db, out_lines)
+            observations = observation_rows(out_lines, invoice_id=invoice.id)
+
+            upserted = 0
+            for line in out_lines:
+                if not line.reference_code:
+                    continue
+                article = article_by_reference(db, line.reference_code)
+                if article is None:
+                    article = ImportacionArticulosMontcau(
                         reference_code=line.reference_code,
-                        observed_price=float(line.price),
-                        invoice_id=invoice.id,
-                        line_id=line.id,
+                        descripcion=line.description,
+                        cantidad=line.quantity,
+                        coste_unitario=line.price,
                     )
-                )
-
-        upserted = 0
-        for line in out_lines:
-            if not line.reference_code:
-                continue
-            q = select(ImportacionArticulosMontcau).where(
-                ImportacionArticulosMontcau.reference_code == line.reference_code
-            )
-            article = db.scalars(q).first()
-            if article is None:
-                article = ImportacionArticulosMontcau(
-                    reference_code=line.reference_code,
-                    descripcion=line.description,
-                    cantidad=line.quantity,
-                    coste_unitario=line.price,
-                )
-                db.add(article)
-                upserted += 1
-            else:
-                if line.description is not None:
-                    article.descripcion = line.description
-                if line.quantity is not None:
-                    article.cantidad = line.quantity
-                if line.price is not None:
-                    article.coste_unitario = line.price
-
-            decision = evaluate_price(db=db, line=line, article=article)
-            apply_price_decision(line, decision)
-            if decision.flag:
-                logger.info("price_flag", extra={"flag": decision.flag, "reference_code": line.reference_code})
+                    db.add(article)
+                    register_reference(db, article.reference_code)
+                    upserted += 1
+                else:
+                    if line.description is not None:
+                        article.descripcion = line.description
+                    if line.quantity is not None:
+                        article.cantidad = line.quantity
+                    if line.price is not None:
+                        article.coste_unitario = line.price
+
+                decision = evaluate_price(db=db, line=line, article=article)
+                apply_price_decision(line, decision)
+                if decision.flag:
+                    _record_price_flag(decision.flag, line.reference_code)
+
+            insert_price_observations(db, observations)
+            refresh_invoice_spend(db, invoice)
+
+            if key:
+                db.flush()
+                db.refresh(invoice)
+                result = _invoice_result(db, invoice, articles_upserted=upserted)
+                remember_response(db, scope="ingest_invoice", key=key, response=result.model_dump(mode="json"))
+    except IntegrityError:
+        # A concurrent delivery of the same message won the race (or two lines share a reference).
+        replay = find_replay(db, scope="ingest_invoice", key=key) if key else None
+        if replay is None:
+            if _invoice_by_source_message(db, payload.source_channel, payload.source_message_id) is not None:
+                raise HTTPException(status_code=409, detail="Duplicate invoice ingestion")
+            raise HTTPException(status_code=409, detail="Duplicate reference_code for this invoice")
+        response.headers["Idempotent-Replayed"] = "true"
+        return replay
 
     db.refresh(invoice)
-    q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice.id).order_by(OcrInfoClothes.id)
-    saved_lines = list(db.scalars(q).all())
+    saved_lines = invoice_lines(db, invoice)
+    ARTICLE_UPSERTS.inc(upserted, source="ingest")
     return ProcessInvoiceResult(invoice=invoice, lines=saved_lines, articles_upserted=upserted)
 
 
 @router.post("/ingest/line", response_model=ClothesLineOut)
-def ingest_line_ocr(payload: IngestLineOcr, db: Session = Depends(get_db), _: None = AuthDep):
+def ingest_line_ocr(
+    payload: IngestLineOcr,
+    response: Response,
+    db: Session = Depends(get_db),
+    _: None = AuthDep,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
     """Ingest a single OCR line (garment) for an existing invoice.
 
     Side effects:
@@ -417,6 +635,9 @@ def ingest_line_ocr(payload: IngestLineOcr, db: Session = Depends(get_db), _: No
     - Appends a `PriceObservation` record for historical tracking when both
       price and `reference_code` are present.
 
+    Retries with the same `Idempotency-Key` (or `source_channel` +
+    `source_message_id`) replay the first response.
+
     Args:
         payload: Target invoice id and a single parsed line.
         db: SQLAlchemy session.
@@ -429,26 +650,41 @@ def ingest_line_ocr(payload: IngestLineOcr, db: Session = Depends(get_db), _: No
         HTTPException(409): If the normalized reference duplicates within invoice.
     """
 
+    key = idempotency_key_for(
+        idempotency_key,
+        source_channel=payload.source_channel,
+        source_message_id=payload.source_message_id,
+    )
+    if key:
+        replay = find_replay(db, scope="ingest_line", key=key)
+        if replay is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return replay
+
     invoice = db.get(DataOcrInvoice, payload.invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
     line_payload = payload.line
     line = OcrInfoClothes(invoice_id=invoice.id, **line_payload.model_dump())
+    prefix = resolve_supplier_prefix(db, cif_supplier=line.cif_supplier, name_supplier=line.name_supplier)
     if line.reference_code:
         line.reference_code_raw = line.reference_code
         if get_settings().enforce_reference_code_prefix:
             line.reference_code = normalize_reference_code(
                 name_supplier=line.name_supplier,
                 reference_code=line.reference_code,
+                prefix=prefix,
             )
         if line.reference_code_origin is None:
             line.reference_code_origin = "ocr"
+        _match_reference(db, line)
     if line.reference_code is None and get_settings().auto_reference_code:
         line.reference_code = generate_reference_code(
             name_supplier=line.name_supplier,
             description=line.description,
             num_invoice=line.num_invoice,
+            prefix=prefix,
         )
         if line.reference_code:
             line.reference_code_origin = "auto"
@@ -468,19 +704,29 @@ def ingest_line_ocr(payload: IngestLineOcr, db: Session = Depends(get_db), _: No
 
     article = None
     if line.reference_code:
-        q = select(ImportacionArticulosMontcau).where(
-            ImportacionArticulosMontcau.reference_code == line.reference_code
-        )
-        article = db.scalars(q).first()
+        article = article_by_reference(db, line.reference_code)
         decision = evaluate_price(db=db, line=line, article=article)
         apply_price_decision(line, decision)
         if decision.flag:
-            logger.info("price_flag", extra={"flag": decision.flag, "reference_code": line.reference_code})
+            _record_price_flag(decision.flag, line.reference_code)
     try:
+        refresh_invoice_spend(db, invoice)
+        if key:
+            db.flush()
+            remember_response(
+                db,
+                scope="ingest_line",
+                key=key,
+                response=ClothesLineOut.model_validate(line).model_dump(mode="json"),
+            )
         db.commit()
     except IntegrityError:
         db.rollback()
-        raise HTTPException(status_code=409, detail="Duplicate reference_code for this invoice")
+        replay = find_replay(db, scope="ingest_line", key=key) if key else None
+        if replay is None:
+            raise HTTPException(status_code=409, detail="Duplicate reference_code for this invoice")
+        response.headers["Idempotent-Replayed"] = "true"
+        return replay
     db.refresh(line)
     return line
 
@@ -491,16 +737,12 @@ def list_invoice_lines(invoice_id: int, db: Session = Depends(get_db), _: None =
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice_id).order_by(OcrInfoClothes.id)
-    return list(db.scalars(q).all())
+    return invoice_lines(db, invoice)
 
 
 @router.put("/articles", response_model=ArticleOut)
 def upsert_article(payload: ArticleUpsert, db: Session = Depends(get_db), _: None = AuthDep):
-    q = select(ImportacionArticulosMontcau).where(
-        ImportacionArticulosMontcau.reference_code == payload.reference_code
-    )
-    article = db.scalars(q).first()
+    article = article_by_reference(db, payload.reference_code)
 
     if article is None:
         article = ImportacionArticulosMontcau(**payload.model_dump())
@@ -510,6 +752,8 @@ def upsert_article(payload: ArticleUpsert, db: Session = Depends(get_db), _: Non
         except IntegrityError:
             db.rollback()
             raise HTTPException(status_code=409, detail="Article with reference_code already exists")
+        register_reference(db, article.reference_code)
+        ARTICLE_UPSERTS.inc(source="api")
         db.refresh(article)
         return article
 
@@ -517,19 +761,229 @@ def upsert_article(payload: ArticleUpsert, db: Session = Depends(get_db), _: Non
         setattr(article, k, v)
 
     db.commit()
+    ARTICLE_UPSERTS.inc(source="api")
     db.refresh(article)
     return article
 
 
+@router.get("/articles/match", response_model=list[ArticleMatchOut])
+def match_articles(
+    reference_code: str = Query(min_length=1, max_length=64),
+    name_supplier: str | None = None,
+    limit: int = Query(default=5, ge=1, le=50),
+    db: Session = Depends(get_db),
+    _: None = AuthReadDep,
+):
+    """Return article master references that fuzzily match `reference_code`.
+
+    When `name_supplier` is given the code is first normalized to `<SUP>_<CODE>`
+    so candidates are searched within that supplier's prefix.
+    """
+    if name_supplier is not None and get_settings().enforce_reference_code_prefix:
+        reference_code = normalize_reference_code(name_supplier=name_supplier, reference_code=reference_code) or ""
+    candidates = find_reference_candidates(db, reference_code, limit=limit)
+    return [ArticleMatchOut(reference_code=c.reference_code, distance=c.distance) for c in candidates]
+
+
 @router.get("/articles/{reference_code}", response_model=ArticleOut)
 def get_article(reference_code: str, db: Session = Depends(get_db), _: None = AuthReadDep):
-    q = select(ImportacionArticulosMontcau).where(ImportacionArticulosMontcau.reference_code == reference_code)
-    article = db.scalars(q).first()
+    article = article_by_reference(db, reference_code)
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
     return article
 
 
+@router.get("/suppliers", response_model=list[SupplierOut])
+def list_suppliers(
+    limit: int = Query(default=50, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+    db: Session = Depends(get_db),
+    _: None = AuthReadDep,
+):
+    q = select(Supplier).order_by(Supplier.cif_supplier).offset(offset).limit(limit)
+    return list(db.scalars(q).all())
+
+
+@router.get("/suppliers/{cif_supplier}", response_model=SupplierOut)
+def get_supplier(cif_supplier: str, db: Session = Depends(get_db), _: None = AuthReadDep):
+    supplier = db.get(Supplier, cif_supplier)
+    if not supplier:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+    return supplier
+
+
+@router.get("/analytics/supplier-spend", response_model=list[SupplierSpendOut])
+def supplier_spend(
+    cif_supplier: str | None = None,
+    year: int | None = None,
+    quarter: int | None = Query(default=None, ge=1, le=4),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    _: None = AuthReadDep,
+):
+    """Spend per supplier and quarter, from the incrementally maintained summaries.
+
+    Newest quarter first, then by `total_amount` (descending).
+    """
+    q = select(SupplierSpendQuarterly).where(SupplierSpendQuarterly.invoice_count > 0)
+    if cif_supplier:
+        q = q.where(SupplierSpendQuarterly.cif_supplier == cif_supplier)
+    if year is not None:
+        q = q.where(SupplierSpendQuarterly.year == year)
+    if quarter is not None:
+        q = q.where(SupplierSpendQuarterly.quarter == quarter)
+    q = q.order_by(
+        SupplierSpendQuarterly.year.desc(),
+        SupplierSpendQuarterly.quarter.desc(),
+        SupplierSpendQuarterly.total_amount.desc(),
+    ).limit(limit)
+    return list(db.scalars(q).all())
+
+
+@router.post("/bank-movements/classify", response_model=list[BankClassificationOut])
+def classify_bank_movements(payload: BankClassifyRequest, _: None = AuthReadDep):
+    """Classify a batch of bank movements (`IDENTIFICAR` + `ESPECIFICACION` rules), in order."""
+    movements = [BankMovement(m.fecha, m.descripcion, m.importe) for m in payload.movements]
+    return [BankClassificationOut(**vars(c)) for c in classify_movements(movements)]
+
+
+def _import_csv(db: Session, file: UploadFile, importer) -> CsvImportOut:
+    if file.size is not None and file.size > get_settings().max_upload_bytes:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        result: ImportResult = importer(db, file.file)
+    except (UnicodeDecodeError, ValueError) as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {exc}")
+    db.commit()
+    return CsvImportOut(
+        rows=result.rows,
+        inserted=result.inserted,
+        skipped=result.skipped,
+        invalid=result.invalid,
+        first_date=result.first_date,
+        last_date=result.last_date,
+    )
+
+
+@router.post("/bank-movements/import", response_model=CsvImportOut)
+def import_bank_movements(file: UploadFile = File(...), db: Session = Depends(get_db), _: None = AuthDep):
+    """Import the bank movements CSV export; movements already stored are skipped."""
+    return _import_csv(db, file, import_bank_csv)
+
+
+@router.post("/cash-closings/import", response_model=CsvImportOut)
+def import_cash_closings(file: UploadFile = File(...), db: Session = Depends(get_db), _: None = AuthDep):
+    """Import the cash-register closings CSV export; closings already stored are skipped."""
+    return _import_csv(db, file, import_cash_csv)
+
+
+@router.get("/cash-closings/reconciliation", response_model=CashReconciliationOut)
+def cash_reconciliation(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    caja: str | None = None,
+    detail: bool = False,
+    db: Session = Depends(get_db),
+    _: None = AuthReadDep,
+):
+    """Expected vs declared cash, running drawer balance and outlier discrepancies per register/employee."""
+    r = reconcile_cash(db, date_from=date_from, date_to=date_to, caja=caja)
+    return CashReconciliationOut(
+        total_closings=len(r.id),
+        registers=r.registers,
+        employees=r.employees,
+        closings=r.closings(only_flagged=not detail),
+    )
+
+
+@router.get("/bank-movements/invoice-matches", response_model=InvoiceMatchesOut)
+def invoice_payment_matches(
+    year: int = Query(ge=2000, le=2100),
+    quarter: int = Query(ge=1, le=4),
+    db: Session = Depends(get_db),
+    _: None = AuthReadDep,
+):
+    """Pair the quarter's supplier invoices with the transfers/direct debits that paid them.
+
+    Read-only: returns matched pairs, ambiguous invoices (several equally good
+    payments) and what is left unmatched on each side. Invoices come from the
+    supplier spend summaries: after upgrading to them, run
+    `python -m scripts.rebuild_supplier_spend` or older invoices are left out.
+    """
+    r = match_quarter(db, year=year, quarter=quarter)
+    return InvoiceMatchesOut(
+        year=year,
+        quarter=quarter,
+        matched=r.matched,
+        ambiguous=[AmbiguousMatchOut(invoice=invoice, candidates=cands) for invoice, cands in r.ambiguous],
+        unmatched_invoices=r.unmatched_invoices,
+        unmatched_payments=r.unmatched_payments,
+    )
+
+
+@router.get("/reports/quarterly", response_model=QuarterlyReportOut)
+def quarterly_report(
+    year: int = Query(ge=2000, le=2100),
+    quarter: int = Query(ge=1, le=4),
+    format: str = Query(default="json", pattern="^(json|csv)$"),
+    db: Session = Depends(get_db),
+    primary: Session = Depends(get_primary_db),
+    _: None = AuthReadDep,
+):
+    """Quarterly close report: bank totals per `IDENTIFICAR` category plus supplier invoice totals.
+
+    Served from the stored report; generated (on the primary) on the first
+    request after any change in the quarter. `format=csv` returns it as CSV.
+    """
+    report = cached_report(db, year, quarter)
+    if report is None:
+        report = materialize_report(primary, year, quarter)
+        primary.commit()
+    if format == "csv":
+        return Response(
+            content=report_csv(report.payload),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="cierre_{year}_T{quarter}.csv"'},
+        )
+    return QuarterlyReportOut(**report.payload, generated_at=report.generated_at, cached=report.cached)
+
+
+@router.put("/suppliers/{cif_supplier}", response_model=SupplierOut)
+def put_supplier(cif_supplier: str, payload: SupplierUpsert, db: Session = Depends(get_db), _: None = AuthDep):
+    """Create or update a supplier registry row.
+
+    A new `canonical_prefix` applies to references normalized from now on;
+    stored references are not rewritten.
+    """
+    prefix_len = get_settings().reference_code_prefix_len
+    if payload.canonical_prefix is not None and len(payload.canonical_prefix) != prefix_len:
+        raise HTTPException(status_code=422, detail=f"canonical_prefix must have {prefix_len} letters")
+    supplier = upsert_supplier(db, cif_supplier=cif_supplier, **payload.model_dump())
+    db.commit()
+    db.refresh(supplier)
+    return supplier
+
+
+@router.post("/suppliers/{cif_supplier}/normalize", response_model=ReferenceBatchNormalizeOut)
+def normalize_supplier_references(
+    cif_supplier: str,
+    payload: ReferenceBatchNormalize,
+    db: Session = Depends(get_db),
+    _: None = AuthDep,
+):
+    """Normalize a whole invoice's references in one call (registers unknown suppliers)."""
+    prefix = resolve_supplier_prefix(db, cif_supplier=cif_supplier, name_supplier=payload.name_supplier)
+    refs = normalize_invoice_references(
+        db,
+        cif_supplier=cif_supplier,
+        name_supplier=payload.name_supplier,
+        reference_codes=payload.reference_codes,
+    )
+    db.commit()
+    return ReferenceBatchNormalizeOut(canonical_prefix=prefix, reference_codes=refs)
+
+
 @router.get("/invoices/{invoice_id}/export/importacion-montcau", response_model=list[ArticleUpsert])
 def export_importacion_montcau(invoice_id: int, db: Session = Depends(get_db), _: None = AuthReadDep):
     """Export invoice lines into Importación Artículos Montcau rows (JSON).
@@ -541,8 +995,7 @@ def export_importacion_montcau(invoice_id: int, db: Session = Depends(get_db), _
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice_id).order_by(OcrInfoClothes.id)
-    lines = list(db.scalars(q).all())
+    lines = invoice_lines(db, invoice)
 
     out: list[ArticleUpsert] = []
     for ln in lines:
@@ -559,8 +1012,322 @@ def export_importacion_montcau(invoice_id: int, db: Session = Depends(get_db), _
     return out
 
 
+async def _ocr_and_store(file: UploadFile, file_bytes: bytes):
+    """OCR the upload and persist the file, both off the event loop.
+
+    Returns `(parsed_invoice, parsed_lines, ocr_error, stored_path)`; an OCR
+    failure falls back to the stub parse with `ocr_error` set.
+    """
+    ocr = OcrService()
+    filename = file.filename or "uploaded"
+    try:
+        parsed_invoice, parsed_lines = await run_in_threadpool(ocr.parse, file_bytes, filename=filename)
+        ocr_error: tuple[str, str] | None = None
+    except Exception as exc:  # noqa: BLE001
+        parsed_invoice, parsed_lines = ocr._parse_stub(file_bytes=file_bytes, filename=filename)
+        ocr_error = ("ocr_failed", str(exc))
+    stored_path = await run_in_threadpool(
+        save_invoice_upload,
+        file_bytes,
+        filename=file.filename,
+        mime_type=file.content_type,
+        invoice_date=parsed_invoice.invoice_date,
+    )
+    return parsed_invoice, parsed_lines, ocr_error, stored_path
+
+
+def _find_replay_readonly(db: Session, *, scope: str, key: str) -> dict | None:
+    """`find_replay` that ends its read transaction (so `db.begin()` can follow)."""
+    replay = find_replay(db, scope=scope, key=key)
+    db.rollback()
+    return replay
+
+
+def _process_file_duplicate(
+    db: Session,
+    *,
+    file: UploadFile,
+    file_sha256: str,
+    file_size: int,
+    key: str | None,
+    response: Response,
+) -> ProcessInvoiceResult | None:
+    """Apply the duplicate policy when the same file was already processed."""
+    duplicate = find_duplicate_invoice(db, file_sha256=file_sha256)
+    if duplicate is None:
+        db.rollback()
+        return None
+    original = duplicate.invoice
+    candidate = DataOcrInvoice(
+        cif_supplier=original.cif_supplier,
+        name_supplier=original.name_supplier,
+        tel_number_supplier=original.tel_number_supplier,
+        email_supplier=original.email_supplier,
+        num_invoice=original.num_invoice,
+        total_invoice_amount=original.total_invoice_amount,
+        invoice_type=original.invoice_type,
+        optional_fields=original.optional_fields,
+        raw_text=original.raw_text,
+        invoice_file_path=original.invoice_file_path,
+        invoice_file_name=file.filename,
+        invoice_file_mime_type=file.content_type,
+        invoice_file_sha256=file_sha256,
+        invoice_file_bytes=file_size,
+    )
+    try:
+        result = _handle_duplicate(db, duplicate, response, candidate)
+    except HTTPException:
+        db.rollback()
+        raise
+    if key:
+        remember_response(db, scope="process_invoice", key=key, response=result.model_dump(mode="json"))
+    db.commit()
+    return result
+
+
+def _build_invoice_lines(
+    db: Session,
+    invoice: DataOcrInvoice,
+    parsed_invoice: ParsedInvoice,
+    parsed_lines: list[ParsedLine],
+) -> list[OcrInfoClothes]:
+    """Turn OCR lines into (transient) invoice lines with their final references."""
+    out_lines: list[OcrInfoClothes] = []
+    taken: set[str] = set()
+    prefix = resolve_supplier_prefix(db, cif_supplier=invoice.cif_supplier, name_supplier=invoice.name_supplier)
+    canonical_refs = normalize_reference_codes(
+        [ln.reference_code for ln in parsed_lines], name_supplier=invoice.name_supplier, prefix=prefix
+    )
+    for ln, canonical_ref in zip(parsed_lines, canonical_refs):
+        line = OcrInfoClothes(
+            invoice_id=invoice.id,
+            cif_supplier=invoice.cif_supplier,
+            name_supplier=invoice.name_supplier,
+            num_invoice=invoice.num_invoice,
+            date=parsed_invoice.invoice_date,
+            reference_code_raw=ln.reference_code,
+            reference_code=ln.reference_code,
+            description=ln.description,
+            quantity=ln.quantity,
+            price=ln.price,
+            total_no_iva=ln.total_no_iva,
+        )
+        if line.reference_code:
+            if get_settings().enforce_reference_code_prefix:
+                line.reference_code = canonical_ref
+            if line.reference_code_origin is None:
+                line.reference_code_origin = "ocr"
+            _match_reference(db, line, taken)
+        if line.reference_code is None and get_settings().auto_reference_code:
+            line.reference_code = generate_reference_code(
+                name_supplier=line.name_supplier,
+                description=line.description,
+                num_invoice=line.num_invoice,
+                prefix=prefix,
+            )
+            if line.reference_code:
+                line.reference_code_origin = "auto"
+        if line.reference_code:
+            taken.add(line.reference_code)
+        out_lines.append(line)
+    return out_lines
+
+
+def _upsert_articles(db: Session, lines: list[OcrInfoClothes], *, price: bool = True) -> int:
+    """Upsert master articles for `lines` and (optionally) price them; returns articles created.
+
+    With `price=False` only `descripcion`/`cantidad` of existing articles are
+    refreshed (the line price was not re-read, so cost and flags stay).
+    """
+    upserted = 0
+    for line in lines:
+        if not line.reference_code:
+            continue
+        article = article_by_reference(db, line.reference_code)
+
+        if article is None:
+            article = ImportacionArticulosMontcau(
+                reference_code=line.reference_code,
+                descripcion=line.description,
+                cantidad=line.quantity,
+                coste_unitario=line.price,
+            )
+            db.add(article)
+            register_reference(db, article.reference_code)
+            upserted += 1
+        else:
+            if line.description is not None:
+                article.descripcion = line.description
+            if line.quantity is not None:
+                article.cantidad = line.quantity
+            if price and line.price is not None:
+                article.coste_unitario = line.price
+
+        if not price:
+            continue
+        decision = evaluate_price(db=db, line=line, article=article)
+        apply_price_decision(line, decision)
+        if decision.flag:
+            _record_price_flag(decision.flag, line.reference_code)
+    return upserted
+
+
+def _save_invoice_lines(
+    db: Session,
+    invoice: DataOcrInvoice,
+    parsed_invoice: ParsedInvoice,
+    parsed_lines: list[ParsedLine],
+) -> int:
+    """Store OCR lines, price observations and article upserts; returns articles created."""
+    out_lines = insert_lines(db, _build_invoice_lines(db, invoice, parsed_invoice, parsed_lines))
+    observations = observation_rows(out_lines, invoice_id=invoice.id)
+    # Upsert minimal articles (reference_code + description + quantity/cost)
+    upserted = _upsert_articles(db, out_lines)
+    insert_price_observations(db, observations)
+    return upserted
+
+
+def _diff_invoice_lines(
+    db: Session,
+    invoice: DataOcrInvoice,
+    parsed_invoice: ParsedInvoice,
+    parsed_lines: list[ParsedLine],
+) -> int:
+    """Apply a new parse to the stored lines in place (see `services/line_diff`).
+
+    Unchanged lines keep their row, observation and price flags; removed lines
+    (and their observations) are bulk-deleted; only added lines and lines whose
+    price or reference changed get a new observation and are priced again.
+    """
+    q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice.id, *line_partition_filter(invoice))
+    stored = list(db.scalars(q).all())
+    q = select(PriceObservation.line_id, PriceObservation.observed_price).where(
+        PriceObservation.invoice_id == invoice.id, *observation_partition_filter(invoice)
+    )
+    observed = {line_id: price for line_id, price in db.execute(q).all()}
+    incoming = _build_invoice_lines(db, invoice, parsed_invoice, parsed_lines)
+    diff = diff_lines(stored, incoming, observed_prices=observed)
+
+    repriced = [u.stored for u in diff.updated if u.reprice]
+    stale_ids = [ln.id for ln in diff.removed] + [ln.id for ln in repriced]
+    if stale_ids:
+        db.execute(
+            delete(PriceObservation).where(
+                PriceObservation.line_id.in_(stale_ids), *observation_partition_filter(invoice)
+            )
+        )
+    if diff.removed:
+        db.execute(
+            delete(OcrInfoClothes).where(
+                OcrInfoClothes.id.in_([ln.id for ln in diff.removed]), *line_partition_filter(invoice)
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        for ln in diff.removed:
+            db.expunge(ln)
+    if diff.unchanged or diff.updated:
+        db.execute(
+            update(PriceObservation)
+            .where(PriceObservation.invoice_id == invoice.id, PriceObservation.cif_supplier != invoice.cif_supplier)
+            .values(cif_supplier=invoice.cif_supplier)
+        )
+
+    for u in diff.updated:
+        for name in u.fields:
+            setattr(u.stored, name, getattr(u.incoming, name))
+        if u.reprice:
+            u.stored.price_flag = None
+            u.stored.price_flag_reason = None
+            # A corrected price/total is re-derived by pricing from the OCR values.
+            u.stored.price = u.incoming.price
+            u.stored.total_no_iva = u.incoming.total_no_iva
+    db.flush()
+
+    added = insert_lines(db, diff.added)
+    priced = repriced + added
+    observations = observation_rows(priced, invoice_id=invoice.id)
+    upserted = _upsert_articles(db, priced)
+    upserted += _upsert_articles(db, [u.stored for u in diff.updated if not u.reprice], price=False)
+    insert_price_observations(db, observations)
+    logger.info("reprocess_diff", extra={"invoice_id": invoice.id, **diff.counts()})
+    return upserted
+
+
+def _store_processed_invoice(
+    db: Session,
+    *,
+    file: UploadFile,
+    file_sha256: str,
+    file_size: int,
+    parsed_invoice: ParsedInvoice,
+    parsed_lines: list[ParsedLine],
+    ocr_error: tuple[str, str] | None,
+    stored_path: str | None,
+    key: str | None,
+    response: Response,
+) -> ProcessInvoiceResult | dict:
+    """Persist a processed upload in one transaction and build the response."""
+    try:
+        with db.begin():
+            invoice = DataOcrInvoice(
+                cif_supplier=parsed_invoice.cif_supplier,
+                name_supplier=parsed_invoice.name_supplier,
+                tel_number_supplier=parsed_invoice.tel_number_supplier,
+                email_supplier=parsed_invoice.email_supplier,
+                num_invoice=parsed_invoice.num_invoice,
+                total_invoice_amount=parsed_invoice.total_invoice_amount,
+                invoice_type=parsed_invoice.invoice_type,
+                optional_fields=parsed_invoice.optional_fields,
+                raw_text=parsed_invoice.raw_text,
+                status="needs_review" if ocr_error else "draft",
+                last_error_code=ocr_error[0] if ocr_error else None,
+                last_error_message=ocr_error[1] if ocr_error else None,
+                invoice_file_path=stored_path,
+                invoice_file_name=file.filename,
+                invoice_file_mime_type=file.content_type,
+                invoice_file_sha256=file_sha256,
+                invoice_file_bytes=file_size,
+            )
+            duplicate = find_duplicate_invoice(
+                db, cif_supplier=parsed_invoice.cif_supplier, num_invoice=parsed_invoice.num_invoice
+            )
+            if duplicate is not None:
+                result = _handle_duplicate(db, duplicate, response, invoice)
+                if key:
+                    remember_response(db, scope="process_invoice", key=key, response=result.model_dump(mode="json"))
+                return result
+            db.add(invoice)
+            db.flush()
+
+            upserted = _save_invoice_lines(db, invoice, parsed_invoice, parsed_lines)
+            refresh_invoice_spend(db, invoice)
+
+            if key:
+                db.flush()
+                db.refresh(invoice)
+                result = _invoice_result(db, invoice, articles_upserted=upserted)
+                remember_response(db, scope="process_invoice", key=key, response=result.model_dump(mode="json"))
+    except IntegrityError:
+        replay = find_replay(db, scope="process_invoice", key=key) if key else None
+        if replay is None:
+            raise
+        response.headers["Idempotent-Replayed"] = "true"
+        return replay
+
+    db.refresh(invoice)
+    result = _invoice_result(db, invoice, articles_upserted=upserted)
+    ARTICLE_UPSERTS.inc(upserted, source="process")
+    return result
+
+
 @router.post("/process/invoice", response_model=ProcessInvoiceResult)
-async def process_invoice(file: UploadFile = File(...), db: Session = Depends(get_db), _: None = AuthDep):
+async def process_invoice(
+    response: Response,
+    file: UploadFile = File(...),
+    runner: DbRunner = Depends(get_db_runner),
+    _: None = AuthDep,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
     """Process an uploaded invoice end-to-end.
 
     Flow:
@@ -574,300 +1341,194 @@ async def process_invoice(file: UploadFile = File(...), db: Session = Depends(ge
     - If OCR fails, the flow falls back to a stub parse and marks the invoice as
       `needs_review` with `last_error_*` fields populated.
 
+    Idempotency: a retry with the same `Idempotency-Key` header replays the
+    first response before reading the upload (no OCR, storage or pricing).
+
+    Duplicates: an upload whose sha256 matches a stored invoice is handled by
+    `EMMO_DUPLICATE_INVOICE_POLICY` before OCR; a `(cif_supplier, num_invoice)`
+    match found by OCR is handled before lines and pricing.
+
+    Concurrency: DB work goes through `runner` (AsyncSession when available) and
+    OCR/storage run in the threadpool, so the event loop keeps serving other
+    requests while this one waits.
+
     Args:
         file: Uploaded invoice file.
-        db: SQLAlchemy session.
+        runner: Per-request DB runner (see `app.db.session.get_db_runner`).
 
     Returns:
         The saved invoice, its saved lines, and the number of articles upserted.
 
     Raises:
+        HTTPException(409): If the invoice is a duplicate and the policy is `reject`.
         HTTPException(413): If the upload exceeds the configured max size.
         HTTPException(415): If the upload content-type is not allowed.
     """
 
+    key = idempotency_key_for(idempotency_key)
+    if key:
+        replay = await runner.run(_find_replay_readonly, scope="process_invoice", key=key)
+        if replay is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return replay
+
     validate_upload(file)
     file_bytes = await read_upload_limited(file, max_bytes=get_settings().max_upload_bytes)
-    ocr = OcrService()
     file_sha256 = hashlib.sha256(file_bytes).hexdigest()
-    try:
-        parsed_invoice, parsed_lines = ocr.parse(file_bytes, filename=file.filename or "uploaded")
-        ocr_error: tuple[str, str] | None = None
-    except Exception as exc:  # noqa: BLE001
-        parsed_invoice, parsed_lines = ocr._parse_stub(file_bytes=file_bytes, filename=file.filename or "uploaded")
-        ocr_error = ("ocr_failed", str(exc))
-    stored_path = save_invoice_upload(
-        file_bytes,
-        filename=file.filename,
-        mime_type=file.content_type,
-        invoice_date=parsed_invoice.invoice_date,
+
+    # Same file already processed? Decide before paying for OCR/storage.
+    result = await runner.run(
+        _process_file_duplicate,
+        file=file,
+        file_sha256=file_sha256,
+        file_size=len(file_bytes),
+        key=key,
+        response=response,
+    )
+    if result is not None:
+        return result
+
+    parsed_invoice, parsed_lines, ocr_error, stored_path = await _ocr_and_store(file, file_bytes)
+
+    return await runner.run(
+        _store_processed_invoice,
+        file=file,
+        file_sha256=file_sha256,
+        file_size=len(file_bytes),
+        parsed_invoice=parsed_invoice,
+        parsed_lines=parsed_lines,
+        ocr_error=ocr_error,
+        stored_path=stored_path,
+        key=key,
+        response=response,
     )
 
-    with db.begin():
-        invoice = DataOcrInvoice(
-            cif_supplier=parsed_invoice.cif_supplier,
-            name_supplier=parsed_invoice.name_supplier,
-            tel_number_supplier=parsed_invoice.tel_number_supplier,
-            email_supplier=parsed_invoice.email_supplier,
-            num_invoice=parsed_invoice.num_invoice,
-            total_invoice_amount=parsed_invoice.total_invoice_amount,
-            invoice_type=parsed_invoice.invoice_type,
-            optional_fields=parsed_invoice.optional_fields,
-            raw_text=parsed_invoice.raw_text,
-            status="needs_review" if ocr_error else "draft",
-            last_error_code=ocr_error[0] if ocr_error else None,
-            last_error_message=ocr_error[1] if ocr_error else None,
-            invoice_file_path=stored_path,
-            invoice_file_name=file.filename,
-            invoice_file_mime_type=file.content_type,
-            invoice_file_sha256=file_sha256,
-            invoice_file_bytes=len(file_bytes),
-        )
-        db.add(invoice)
-        db.flush()
 
-        out_lines: list[OcrInfoClothes] = []
-        for ln in parsed_lines:
-            line = OcrInfoClothes(
-                invoice_id=invoice.id,
+def _invoice_exists(db: Session, invoice_id: int) -> bool:
+    exists = db.get(DataOcrInvoice, invoice_id) is not None
+    db.rollback()
+    return exists
+
+
+def _store_reprocessed_invoice(
+    db: Session,
+    invoice_id: int,
+    *,
+    file: UploadFile,
+    file_sha256: str,
+    file_size: int,
+    parsed_invoice: ParsedInvoice,
+    parsed_lines: list[ParsedLine],
+    ocr_error: tuple[str, str] | None,
+    stored_path: str | None,
+) -> ProcessInvoiceResult:
+    """Update an invoice's header fields and lines in one transaction."""
+    with db.begin():
+        invoice = db.get(DataOcrInvoice, invoice_id)
+        if invoice is None:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+
+        # Update header (only overwrite when OCR provides something)
+        if parsed_invoice.cif_supplier and parsed_invoice.cif_supplier != "UNKNOWN":
+            invoice.cif_supplier = parsed_invoice.cif_supplier
+        if parsed_invoice.name_supplier is not None:
+            invoice.name_supplier = parsed_invoice.name_supplier
+        if parsed_invoice.tel_number_supplier is not None:
+            invoice.tel_number_supplier = parsed_invoice.tel_number_supplier
+        if parsed_invoice.email_supplier is not None:
+            invoice.email_supplier = parsed_invoice.email_supplier
+        if parsed_invoice.num_invoice is not None:
+            invoice.num_invoice = parsed_invoice.num_invoice
+        if parsed_invoice.total_invoice_amount is not None:
+            invoice.total_invoice_amount = parsed_invoice.total_invoice_amount
+        if parsed_invoice.invoice_type is not None:
+            invoice.invoice_type = parsed_invoice.invoice_type
+        if parsed_invoice.optional_fields is not None:
+            invoice.optional_fields = parsed_invoice.optional_fields
+        if parsed_invoice.raw_text is not None:
+            invoice.raw_text = parsed_invoice.raw_text
+        if stored_path is not None:
+            invoice.invoice_file_path = stored_path
+            invoice.invoice_file_name = file.filename
+            invoice.invoice_file_mime_type = file.content_type
+            invoice.invoice_file_sha256 = file_sha256
+            invoice.invoice_file_bytes = file_size
+
+        if ocr_error:
+            invoice.status = "needs_review"
+            invoice.last_error_code = ocr_error[0]
+            invoice.last_error_message = ocr_error[1]
+
+        if invoice.duplicate_of_invoice_id is None:
+            duplicate = find_duplicate_invoice(
+                db,
                 cif_supplier=invoice.cif_supplier,
-                name_supplier=invoice.name_supplier,
                 num_invoice=invoice.num_invoice,
-                date=parsed_invoice.invoice_date,
-                reference_code_raw=ln.reference_code,
-                reference_code=ln.reference_code,
-                description=ln.description,
-                quantity=ln.quantity,
-                price=ln.price,
-                total_no_iva=ln.total_no_iva,
+                exclude_invoice_id=invoice.id,
             )
-            if line.reference_code:
-                if get_settings().enforce_reference_code_prefix:
-                    line.reference_code = normalize_reference_code(
-                        name_supplier=line.name_supplier,
-                        reference_code=line.reference_code,
-                    )
-                if line.reference_code_origin is None:
-                    line.reference_code_origin = "ocr"
-            if line.reference_code is None and get_settings().auto_reference_code:
-                line.reference_code = generate_reference_code(
-                    name_supplier=line.name_supplier,
-                    description=line.description,
-                    num_invoice=line.num_invoice,
+            if duplicate is not None:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Duplicate invoice: matches invoice {duplicate.invoice.id} by {duplicate.reason}",
                 )
-                if line.reference_code:
-                    line.reference_code_origin = "auto"
-            db.add(line)
-            out_lines.append(line)
 
-        db.flush()
-        for line in out_lines:
-            if line.price is not None and line.reference_code:
-                db.add(
-                    PriceObservation(
-                        cif_supplier=line.cif_supplier,
-                        reference_code=line.reference_code,
-                        observed_price=float(line.price),
-                        invoice_id=invoice.id,
-                        line_id=line.id,
-                    )
+        if get_settings().reprocess_mode == "diff":
+            upserted = _diff_invoice_lines(db, invoice, parsed_invoice, parsed_lines)
+        else:
+            # Replace lines (observations first: SQLite does not enforce the FK cascade)
+            db.execute(
+                delete(PriceObservation).where(
+                    PriceObservation.invoice_id == invoice_id, *observation_partition_filter(invoice)
                 )
-
-        # Upsert minimal articles (reference_code + description + quantity/cost)
-        upserted = 0
-        for line in out_lines:
-            if not line.reference_code:
-                continue
-            q = select(ImportacionArticulosMontcau).where(
-                ImportacionArticulosMontcau.reference_code == line.reference_code
             )
-            article = db.scalars(q).first()
+            q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice_id, *line_partition_filter(invoice))
+            existing = list(db.scalars(q).all())
+            for ln in existing:
+                db.delete(ln)
+            db.flush()
 
-            if article is None:
-                article = ImportacionArticulosMontcau(
-                    reference_code=line.reference_code,
-                    descripcion=line.description,
-                    cantidad=line.quantity,
-                    coste_unitario=line.price,
-                )
-                db.add(article)
-                upserted += 1
-            else:
-                if line.description is not None:
-                    article.descripcion = line.description
-                if line.quantity is not None:
-                    article.cantidad = line.quantity
-                if line.price is not None:
-                    article.coste_unitario = line.price
-
-            decision = evaluate_price(db=db, line=line, article=article)
-            apply_price_decision(line, decision)
-            if decision.flag:
-                logger.info("price_flag", extra={"flag": decision.flag, "reference_code": line.reference_code})
+            upserted = _save_invoice_lines(db, invoice, parsed_invoice, parsed_lines)
+        refresh_invoice_spend(db, invoice)
 
     db.refresh(invoice)
-    q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice.id).order_by(OcrInfoClothes.id)
-    saved_lines = list(db.scalars(q).all())
-
-    return ProcessInvoiceResult(invoice=invoice, lines=saved_lines, articles_upserted=upserted)
+    result = _invoice_result(db, invoice, articles_upserted=upserted)
+    ARTICLE_UPSERTS.inc(upserted, source="reprocess")
+    return result
 
 
 @router.post("/invoices/{invoice_id}/process", response_model=ProcessInvoiceResult)
 async def reprocess_invoice(
     invoice_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    runner: DbRunner = Depends(get_db_runner),
     _: None = AuthDep,
 ):
     """Reprocesa una factura existente con una nueva foto/archivo.
 
     - Actualiza campos de cabecera si vienen del OCR
-    - Reemplaza las líneas existentes
+    - `EMMO_REPROCESS_MODE=diff` (por defecto): actualiza solo las líneas que
+      cambian y solo vuelve a calcular precio si cambia precio o referencia;
+      `replace`: borra y reinserta todas las líneas
     - Hace upsert de artículos por reference_code
+    - 409 si la nueva cabecera (CIF + nº factura) coincide con otra factura
     """
 
-    invoice = db.get(DataOcrInvoice, invoice_id)
-    if not invoice:
+    if not await runner.run(_invoice_exists, invoice_id):
         raise HTTPException(status_code=404, detail="Invoice not found")
 
     validate_upload(file)
     file_bytes = await read_upload_limited(file, max_bytes=get_settings().max_upload_bytes)
-    ocr = OcrService()
     file_sha256 = hashlib.sha256(file_bytes).hexdigest()
-    try:
-        parsed_invoice, parsed_lines = ocr.parse(file_bytes, filename=file.filename or "uploaded")
-        ocr_error: tuple[str, str] | None = None
-    except Exception as exc:  # noqa: BLE001
-        parsed_invoice, parsed_lines = ocr._parse_stub(file_bytes=file_bytes, filename=file.filename or "uploaded")
-        ocr_error = ("ocr_failed", str(exc))
-    stored_path = save_invoice_upload(
-        file_bytes,
-        filename=file.filename,
-        mime_type=file.content_type,
-        invoice_date=parsed_invoice.invoice_date,
+    parsed_invoice, parsed_lines, ocr_error, stored_path = await _ocr_and_store(file, file_bytes)
+
+    return await runner.run(
+        _store_reprocessed_invoice,
+        invoice_id,
+        file=file,
+        file_sha256=file_sha256,
+        file_size=len(file_bytes),
+        parsed_invoice=parsed_invoice,
+        parsed_lines=parsed_lines,
+        ocr_error=ocr_error,
+        stored_path=stored_path,
     )
-
-    # Update header (only overwrite when OCR provides something)
-    if parsed_invoice.cif_supplier and parsed_invoice.cif_supplier != "UNKNOWN":
-        invoice.cif_supplier = parsed_invoice.cif_supplier
-    if parsed_invoice.name_supplier is not None:
-        invoice.name_supplier = parsed_invoice.name_supplier
-    if parsed_invoice.tel_number_supplier is not None:
-        invoice.tel_number_supplier = parsed_invoice.tel_number_supplier
-    if parsed_invoice.email_supplier is not None:
-        invoice.email_supplier = parsed_invoice.email_supplier
-    if parsed_invoice.num_invoice is not None:
-        invoice.num_invoice = parsed_invoice.num_invoice
-    if parsed_invoice.total_invoice_amount is not None:
-        invoice.total_invoice_amount = parsed_invoice.total_invoice_amount
-    if parsed_invoice.invoice_type is not None:
-        invoice.invoice_type = parsed_invoice.invoice_type
-    if parsed_invoice.optional_fields is not None:
-        invoice.optional_fields = parsed_invoice.optional_fields
-    if parsed_invoice.raw_text is not None:
-        invoice.raw_text = parsed_invoice.raw_text
-    if stored_path is not None:
-        invoice.invoice_file_path = stored_path
-        invoice.invoice_file_name = file.filename
-        invoice.invoice_file_mime_type = file.content_type
-        invoice.invoice_file_sha256 = file_sha256
-        invoice.invoice_file_bytes = len(file_bytes)
-
-    if ocr_error:
-        invoice.status = "needs_review"
-        invoice.last_error_code = ocr_error[0]
-        invoice.last_error_message = ocr_error[1]
-
-    with db.begin():
-        # Replace lines
-        existing = list(
-            db.scalars(select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice_id)).all()
-        )
-        for ln in existing:
-            db.delete(ln)
-        db.flush()
-
-        new_lines: list[OcrInfoClothes] = []
-        for ln in parsed_lines:
-            line = OcrInfoClothes(
-                invoice_id=invoice.id,
-                cif_supplier=invoice.cif_supplier,
-                name_supplier=invoice.name_supplier,
-                num_invoice=invoice.num_invoice,
-                date=parsed_invoice.invoice_date,
-                reference_code_raw=ln.reference_code,
-                reference_code=ln.reference_code,
-                description=ln.description,
-                quantity=ln.quantity,
-                price=ln.price,
-                total_no_iva=ln.total_no_iva,
-            )
-            if line.reference_code:
-                if get_settings().enforce_reference_code_prefix:
-                    line.reference_code = normalize_reference_code(
-                        name_supplier=line.name_supplier,
-                        reference_code=line.reference_code,
-                    )
-                if line.reference_code_origin is None:
-                    line.reference_code_origin = "ocr"
-            if line.reference_code is None and get_settings().auto_reference_code:
-                line.reference_code = generate_reference_code(
-                    name_supplier=line.name_supplier,
-                    description=line.description,
-                    num_invoice=line.num_invoice,
-                )
-                if line.reference_code:
-                    line.reference_code_origin = "auto"
-            db.add(line)
-            new_lines.append(line)
-
-        db.flush()
-        for line in new_lines:
-            if line.price is not None and line.reference_code:
-                db.add(
-                    PriceObservation(
-                        cif_supplier=line.cif_supplier,
-                        reference_code=line.reference_code,
-                        observed_price=float(line.price),
-                        invoice_id=invoice.id,
-                        line_id=line.id,
-                    )
-                )
-
-        # Upsert minimal articles
-        upserted = 0
-        for line in new_lines:
-            if not line.reference_code:
-                continue
-            q = select(ImportacionArticulosMontcau).where(
-                ImportacionArticulosMontcau.reference_code == line.reference_code
-            )
-            article = db.scalars(q).first()
-            if article is None:
-                article = ImportacionArticulosMontcau(
-                    reference_code=line.reference_code,
-                    descripcion=line.description,
-                    cantidad=line.quantity,
-                    coste_unitario=line.price,
-                )
-                db.add(article)
-                upserted += 1
-            else:
-                if line.description is not None:
-                    article.descripcion = line.description
-                if line.quantity is not None:
-                    article.cantidad = line.quantity
-                if line.price is not None:
-                    article.coste_unitario = line.price
-
-            decision = evaluate_price(db=db, line=line, article=article)
-            apply_price_decision(line, decision)
-            if decision.flag:
-                logger.info("price_flag", extra={"flag": decision.flag, "reference_code": line.reference_code})
-
-    db.refresh(invoice)
-
-    q = select(OcrInfoClothes).where(OcrInfoClothes.invoice_id == invoice.id).order_by(OcrInfoClothes.id)
-    saved_lines = list(db.scalars(q).all())
-
-    return ProcessInvoiceResult(invoice=invoice, lines=saved_lines, articles_upserted=upserted)
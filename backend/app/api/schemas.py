@@ -10,7 +10,8 @@ Guidelines used in this file:
 - OCR ingest payloads (`Ingest*`) carry source metadata + extracted fields.
 """
 
-from datetime import date, datetime
+import datetime as dt
+from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel, Field
@@ -49,6 +50,7 @@ class InvoiceOut(BaseModel):
     invoice_file_mime_type: Optional[str]
     invoice_file_sha256: Optional[str]
     invoice_file_bytes: Optional[int]
+    duplicate_of_invoice_id: Optional[int] = None
     created_at: datetime
 
     model_config = {"from_attributes": True}
@@ -68,7 +70,8 @@ class ClothesLineCreate(BaseModel):
     cif_supplier: str = Field(min_length=3, max_length=32)
     name_supplier: Optional[str] = None
     num_invoice: Optional[str] = None
-    date: Optional[date] = None
+    # `dt.date`: a bare `date` would resolve to this field's own default (None).
+    date: Optional[dt.date] = None
 
     reference_code: Optional[str] = Field(default=None, min_length=1, max_length=64)
     description: Optional[str] = None
@@ -88,11 +91,12 @@ class ClothesLineOut(BaseModel):
     cif_supplier: str
     name_supplier: Optional[str]
     num_invoice: Optional[str]
-    date: Optional[date]
+    date: Optional[dt.date]
 
     reference_code_raw: Optional[str]
     reference_code: Optional[str]
     reference_code_origin: Optional[str]
+    reference_code_suggestion: Optional[str] = None
     description: Optional[str]
     quantity: Optional[int]
     price: Optional[float]
@@ -189,6 +193,12 @@ class ArticleOut(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class ArticleMatchOut(BaseModel):
+    """Fuzzy match candidate from the article master."""
+    reference_code: str
+    distance: int
+
+
 class ProcessInvoiceResult(BaseModel):
     """Result of an end-to-end invoice ingestion process."""
     invoice: InvoiceOut
@@ -234,3 +244,228 @@ class IngestLineOcr(BaseModel):
 
     invoice_id: int
     line: ClothesLineCreate
+
+
+class SupplierUpsert(BaseModel):
+    """Payload to create/update a supplier registry row.
+
+    `canonical_prefix` pins the `<SUP>` part of reference codes for this CIF.
+    """
+    name_supplier: Optional[str] = None
+    canonical_prefix: Optional[str] = Field(default=None, pattern=r"^[A-Z]+$", max_length=16)
+    name_variants: Optional[list[str]] = None
+    settings: Optional[dict] = None
+
+
+class SupplierOut(BaseModel):
+    """Supplier registry response model."""
+    cif_supplier: str
+    name_supplier: Optional[str]
+    canonical_prefix: Optional[str]
+    name_variants: Optional[list[str]]
+    settings: Optional[dict]
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class SupplierSpendOut(BaseModel):
+    """Spend summary of one supplier in one quarter (of the invoice date)."""
+    cif_supplier: str
+    year: int
+    quarter: int
+    invoice_count: int
+    total_amount: float
+    line_count: int
+    units: int
+    flagged_lines: int
+    updated_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class BankMovementIn(BaseModel):
+    """One row of the bank export (fecha, concepto, importe)."""
+    fecha: Optional[dt.date] = None
+    descripcion: Optional[str] = None
+    importe: Optional[float] = None
+
+
+class BankClassifyRequest(BaseModel):
+    """Batch of bank movements to classify."""
+    movements: list[BankMovementIn] = Field(default_factory=list, max_length=20000)
+
+
+class BankClassificationOut(BaseModel):
+    """`IDENTIFICAR` / `ESPECIFICACION` of one movement (`null` without description)."""
+    identificacion: Optional[str]
+    especificacion: Optional[str]
+
+
+class CsvImportOut(BaseModel):
+    """Result of a bank / cash-register CSV import.
+
+    `skipped`: rows already imported (overlapping exports); `invalid`: rows
+    without a parseable date/amount (headers, totals).
+    """
+    rows: int
+    inserted: int
+    skipped: int
+    invalid: int
+    first_date: Optional[dt.date]
+    last_date: Optional[dt.date]
+
+
+class CashGroupOut(BaseModel):
+    """Discrepancy summary of one register (`final_balance` set) or employee."""
+    key: str
+    closings: int
+    expected_total: float
+    declared_total: float
+    discrepancy_total: float
+    discrepancy_median: float
+    discrepancy_mad: float
+    outliers: int
+    final_balance: Optional[float] = None
+
+    model_config = {"from_attributes": True}
+
+
+class CashClosingCheckOut(BaseModel):
+    """One reconciled closing."""
+    id: int
+    fecha: dt.date
+    caja: str
+    numero: str
+    empleado: str
+    expected: float
+    declared: float
+    discrepancy: float
+    reported_mismatch: bool
+    running_balance: float
+    cumulative_discrepancy: float
+    outlier_register: bool
+    outlier_employee: bool
+
+
+class CashReconciliationOut(BaseModel):
+    """Reconciliation of the closings in a date range.
+
+    `closings` lists only flagged closings (outliers or a `descuadre` that does not
+    match declared - expected) unless `detail=true`.
+    """
+    total_closings: int
+    registers: list[CashGroupOut]
+    employees: list[CashGroupOut]
+    closings: list[CashClosingCheckOut]
+
+
+class MatchInvoiceOut(BaseModel):
+    id: int
+    cif_supplier: str
+    name_supplier: Optional[str] = None
+    num_invoice: Optional[str] = None
+    amount: float
+    fecha: dt.date
+
+    model_config = {"from_attributes": True}
+
+
+class MatchPaymentOut(BaseModel):
+    """Outgoing bank movement (`amount` positive; `kind`: transfer or direct_debit)."""
+    id: int
+    fecha: dt.date
+    descripcion: str
+    amount: float
+    kind: str
+
+    model_config = {"from_attributes": True}
+
+
+class PaymentCandidateOut(BaseModel):
+    """Invoice/payment pair: `score` 2 = CIF in the description, else shared name tokens."""
+    invoice: MatchInvoiceOut
+    payment: MatchPaymentOut
+    score: int
+    amount_diff: float
+    days: int
+
+    model_config = {"from_attributes": True}
+
+
+class AmbiguousMatchOut(BaseModel):
+    invoice: MatchInvoiceOut
+    candidates: list[PaymentCandidateOut]
+
+
+class InvoiceMatchesOut(BaseModel):
+    """Invoice/payment matching of one quarter (by invoice date)."""
+    year: int
+    quarter: int
+    matched: list[PaymentCandidateOut]
+    ambiguous: list[AmbiguousMatchOut]
+    unmatched_invoices: list[MatchInvoiceOut]
+    unmatched_payments: list[MatchPaymentOut]
+
+
+class ReportCategoryOut(BaseModel):
+    """Bank movements of one `IDENTIFICAR` category (`expenses` negative)."""
+    identificacion: str
+    movements: int
+    income: float
+    expenses: float
+    net: float
+
+
+class ReportBankTotalsOut(BaseModel):
+    movements: int
+    income: float
+    expenses: float
+    net: float
+
+
+class ReportSupplierOut(BaseModel):
+    cif_supplier: str
+    name_supplier: Optional[str] = None
+    invoice_count: int
+    total_amount: float
+
+
+class ReportInvoiceTotalsOut(BaseModel):
+    suppliers: int
+    invoice_count: int
+    total_amount: float
+
+
+class ReportMerchandiseOut(BaseModel):
+    """Supplier invoices vs payments classified "Compra de Mercaderias (CV)"."""
+    invoiced: float
+    paid: float
+    difference: float
+
+
+class QuarterlyReportOut(BaseModel):
+    """Quarterly close report; `cached` is false when this request generated it."""
+    year: int
+    quarter: int
+    date_from: dt.date
+    date_to: dt.date
+    generated_at: datetime
+    cached: bool
+    categories: list[ReportCategoryOut]
+    bank_totals: ReportBankTotalsOut
+    suppliers: list[ReportSupplierOut]
+    invoice_totals: ReportInvoiceTotalsOut
+    merchandise: ReportMerchandiseOut
+
+
+class ReferenceBatchNormalize(BaseModel):
+    """Batch normalization request for all references of one invoice."""
+    name_supplier: Optional[str] = None
+    reference_codes: list[Optional[str]] = Field(default_factory=list, max_length=5000)
+
+
+class ReferenceBatchNormalizeOut(BaseModel):
+    """Canonical references, in the same order as requested."""
+    canonical_prefix: str
+    reference_codes: list[Optional[str]]
@@ -5,10 +5,13 @@ This module exists to support development and tests.
 - In dev/test, we can create tables automatically via `Base.metadata.create_all`.
 - In production (Postgres + scaling), prefer Alembic migrations and set
     `EMMO_DB_AUTO_CREATE=false`.
+- With `EMMO_DB_PARTITIONING=quarter` on Postgres, upcoming quarter partitions
+  are created at startup (see `app/db/partitioning.py`).
 """
 
 from app.db.base import Base
 from app.db import session
+from app.db.partitioning import ensure_partitions
 from app.settings import get_settings
 
 # Ensure models are imported so metadata is populated
@@ -16,9 +19,15 @@ from app.db import models  # noqa: F401
 
 
 def init_db():
-    """Create tables if `db_auto_create` is enabled."""
-    if not get_settings().db_auto_create:
+    """Create tables if `db_auto_create` is enabled; create upcoming quarter partitions."""
+    settings = get_settings()
+    partitioned = settings.db_partitioning == "quarter"
+    if not settings.db_auto_create and not partitioned:
         return
     if session.engine is None:
         session.init_engine()
-    Base.metadata.create_all(bind=session.engine)
+    if settings.db_auto_create:
+        Base.metadata.create_all(bind=session.engine)
+    if partitioned and session.engine.dialect.name == "postgresql":
+        with session.engine.begin() as conn:
+            ensure_partitions(conn)
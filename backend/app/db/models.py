@@ -8,13 +8,33 @@ Core tables:
 - `OcrInfoClothes`: normalized invoice lines detected/entered.
 - `ImportacionArticulosMontcau`: article master / import format used by Montcau.
 - `PriceObservation`: historical observed prices per reference_code.
+- `PriceObservationMonthly`: monthly rollups of compacted (old) observations.
+- `Supplier`: supplier registry keyed by CIF (canonical reference prefix, name variants).
+- `IdempotencyRecord`: stored responses of retried webhook deliveries (TTL-evicted).
+- `SupplierSpendQuarterly` / `SupplierSpendInvoice`: incrementally maintained spend per supplier and quarter.
+- `BankAccountMovement` / `CashClosing`: rows imported from the bank and cash-register CSV exports.
+- `QuarterlyReport`: materialized quarterly close report, dropped when its quarter's data changes.
 """
 
 from datetime import date, datetime, timezone
 from typing import Optional
 
-from sqlalchemy import Date, DateTime, Float, ForeignKey, Integer, JSON, String, Text, UniqueConstraint
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    JSON,
+    String,
+    Text,
+    UniqueConstraint,
+    event,
+    select,
+    text,
+)
+from sqlalchemy.orm import Mapped, mapped_column, object_session, relationship
 
 from app.db.base import Base
 
@@ -26,6 +46,20 @@ class DataOcrInvoice(Base):
     uploaded file metadata (path, sha256, bytes).
     """
     __tablename__ = "data_ocr_invoice"
+    __table_args__ = (
+        # Messaging platforms retry webhooks: one invoice per delivered message.
+        UniqueConstraint("source_channel", "source_message_id", name="uq_invoice_source_message"),
+        # One canonical invoice per supplier invoice number; linked duplicates and the
+        # OCR placeholder CIF (see `services/duplicates`) are exempt.
+        Index(
+            "uq_invoice_supplier_number",
+            "cif_supplier",
+            "num_invoice",
+            unique=True,
+            sqlite_where=text("duplicate_of_invoice_id IS NULL AND cif_supplier <> 'UNKNOWN'"),
+            postgresql_where=text("duplicate_of_invoice_id IS NULL AND cif_supplier <> 'UNKNOWN'"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
@@ -50,8 +84,12 @@ class DataOcrInvoice(Base):
     invoice_file_path: Mapped[Optional[str]] = mapped_column(String(2048), nullable=True)
     invoice_file_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     invoice_file_mime_type: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
-    invoice_file_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    invoice_file_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
     invoice_file_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Set when this row is a linked duplicate of an earlier invoice (status=duplicate).
+    duplicate_of_invoice_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("data_ocr_invoice.id", ondelete="SET NULL"), nullable=True, index=True
+    )
     created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     clothes_lines: Mapped[list[OcrInfoClothes]] = relationship(
@@ -75,6 +113,9 @@ class OcrInfoClothes(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     invoice_id: Mapped[int] = mapped_column(ForeignKey("data_ocr_invoice.id", ondelete="CASCADE"))
+    # Copy of the invoice's `created_at` (set on insert): the partition key when
+    # lines are partitioned by quarter, so all lines of an invoice share a partition.
+    invoice_created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     cif_supplier: Mapped[str] = mapped_column(String(32), index=True)
     name_supplier: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
@@ -85,6 +126,8 @@ class OcrInfoClothes(Base):
     reference_code_raw: Mapped[Optional[str]] = mapped_column(String(64), index=True, nullable=True)
     reference_code: Mapped[Optional[str]] = mapped_column(String(64), index=True, nullable=True)
     reference_code_origin: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    # Closest article master reference when OCR's reference is unknown (fuzzy match).
+    reference_code_suggestion: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     description: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     quantity: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
@@ -95,6 +138,19 @@ class OcrInfoClothes(Base):
     invoice: Mapped[DataOcrInvoice] = relationship(back_populates="clothes_lines")
 
 
+@event.listens_for(OcrInfoClothes, "before_insert")
+def _set_invoice_created_at(mapper, connection, target: OcrInfoClothes) -> None:
+    if target.invoice_created_at is not None:
+        return
+    session = object_session(target)
+    invoice = session.identity_map.get(session.identity_key(DataOcrInvoice, target.invoice_id)) if session else None
+    if invoice is not None and invoice.created_at is not None:
+        target.invoice_created_at = invoice.created_at
+    else:
+        q = select(DataOcrInvoice.created_at).where(DataOcrInvoice.id == target.invoice_id)
+        target.invoice_created_at = connection.scalar(q)
+
+
 class ImportacionArticulosMontcau(Base):
     """Montcau article master/import row.
 
@@ -159,7 +215,8 @@ class PriceObservation(Base):
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Indexed for the compaction job (`created_at < cutoff`).
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
 
     cif_supplier: Mapped[str] = mapped_column(String(32), index=True)
     reference_code: Mapped[str] = mapped_column(String(64), index=True)
@@ -167,3 +224,183 @@ class PriceObservation(Base):
 
     invoice_id: Mapped[int] = mapped_column(ForeignKey("data_ocr_invoice.id", ondelete="CASCADE"))
     line_id: Mapped[int] = mapped_column(ForeignKey("ocr_info_clothes.id", ondelete="CASCADE"))
+
+
+class PriceObservationMonthly(Base):
+    """Monthly aggregate of compacted `PriceObservation` rows per reference.
+
+    Filled by the compaction job (see `services/price_rollup`); `sketch` is a
+    mergeable quantile sketch so pricing can still estimate a median when the
+    raw history is too sparse.
+    """
+    __tablename__ = "price_observation_monthly"
+    __table_args__ = (
+        UniqueConstraint("reference_code", "month", name="uq_price_rollup_reference_month"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    reference_code: Mapped[str] = mapped_column(String(64), index=True)
+    # First day of the month.
+    month: Mapped[date] = mapped_column(Date)
+
+    count: Mapped[int] = mapped_column(Integer)
+    min_price: Mapped[float] = mapped_column(Float)
+    max_price: Mapped[float] = mapped_column(Float)
+    sum_price: Mapped[float] = mapped_column(Float)
+    sketch: Mapped[dict] = mapped_column(JSON)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class Supplier(Base):
+    """Supplier registry keyed by CIF.
+
+    Pins the canonical reference-code prefix the first time a supplier is seen,
+    so later name variants ("Proveedor SL", "PROVEEDOR S.L.") keep producing the
+    same `<SUP>_<CODE>` references. The prefix stays NULL while no supplier name
+    has been seen. `settings` holds per-supplier overrides.
+    """
+    __tablename__ = "supplier"
+
+    cif_supplier: Mapped[str] = mapped_column(String(32), primary_key=True)
+    name_supplier: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    canonical_prefix: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    name_variants: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    settings: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class IdempotencyRecord(Base):
+    """Stored response of an idempotent request.
+
+    Keyed by route `scope` + key (the `Idempotency-Key` header, or
+    `<source_channel>:<source_message_id>` for webhook payloads). Retries within
+    `expires_at` replay `response` without re-running OCR/pricing/upserts.
+    """
+    __tablename__ = "idempotency_record"
+    __table_args__ = (
+        UniqueConstraint("scope", "idempotency_key", name="uq_idempotency_scope_key"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    scope: Mapped[str] = mapped_column(String(64))
+    idempotency_key: Mapped[str] = mapped_column(String(255))
+    response: Mapped[dict] = mapped_column(JSON)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class SupplierSpendQuarterly(Base):
+    """Spend summary per supplier and quarter (of the invoice date).
+
+    Maintained incrementally from `SupplierSpendInvoice` deltas in the same
+    transaction as the invoice change (see `services/supplier_spend`).
+    """
+    __tablename__ = "supplier_spend_quarterly"
+    __table_args__ = (
+        UniqueConstraint("cif_supplier", "year", "quarter", name="uq_supplier_spend_quarter"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    cif_supplier: Mapped[str] = mapped_column(String(32))
+    year: Mapped[int] = mapped_column(Integer)
+    quarter: Mapped[int] = mapped_column(Integer)
+
+    invoice_count: Mapped[int] = mapped_column(Integer, default=0)
+    total_amount: Mapped[float] = mapped_column(Float, default=0.0)
+    line_count: Mapped[int] = mapped_column(Integer, default=0)
+    units: Mapped[int] = mapped_column(Integer, default=0)
+    flagged_lines: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class SupplierSpendInvoice(Base):
+    """What one invoice currently adds to `SupplierSpendQuarterly`.
+
+    Lets an invoice change apply only its delta (and move between quarters or
+    suppliers) without rescanning other invoices.
+    """
+    __tablename__ = "supplier_spend_invoice"
+
+    invoice_id: Mapped[int] = mapped_column(ForeignKey("data_ocr_invoice.id", ondelete="CASCADE"), primary_key=True)
+    cif_supplier: Mapped[str] = mapped_column(String(32))
+    year: Mapped[int] = mapped_column(Integer)
+    quarter: Mapped[int] = mapped_column(Integer)
+
+    total_amount: Mapped[float] = mapped_column(Float, default=0.0)
+    line_count: Mapped[int] = mapped_column(Integer, default=0)
+    units: Mapped[int] = mapped_column(Integer, default=0)
+    flagged_lines: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class BankAccountMovement(Base):
+    """One movement of the bank account CSV export ("CSV MOVIMIENTOS").
+
+    `fingerprint` hashes (date, description, amount, balance), so importing an
+    export that overlaps earlier ones only adds the new movements.
+    `identificacion` / `especificacion` are set on import by the rule classifier.
+    """
+    __tablename__ = "bank_movement"
+    __table_args__ = (
+        UniqueConstraint("fingerprint", name="uq_bank_movement_fingerprint"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+
+    fecha: Mapped[date] = mapped_column(Date, index=True)
+    descripcion: Mapped[str] = mapped_column(Text)
+    importe: Mapped[float] = mapped_column(Float)
+    saldo: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    referencia_1: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    referencia_2: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    identificacion: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    especificacion: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class CashClosing(Base):
+    """One register closing of the cash-register CSV export ("CSV EFECTIVO").
+
+    `fingerprint` hashes (date, register + closing number, total sales, declared
+    cash), the cash-export counterpart of the bank movement fingerprint.
+    """
+    __tablename__ = "cash_closing"
+    __table_args__ = (
+        UniqueConstraint("fingerprint", name="uq_cash_closing_fingerprint"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+
+    fecha: Mapped[date] = mapped_column(Date, index=True)
+    caja: Mapped[str] = mapped_column(String(32))
+    numero: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    empleado: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+
+    ventas_totales: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    venta_efectivo: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    entrada: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    salida: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    calculado: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    declarado: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    descuadre: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    retirado: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class QuarterlyReport(Base):
+    """Materialized quarterly close report (see `services/quarterly_report`).
+
+    `payload` is `NULL` until generated. Every data change in the quarter bumps
+    `version` and clears `payload`; a report is only stored if `version` did not
+    move while it was computed, so a stale report never overwrites an invalidation.
+    """
+    __tablename__ = "quarterly_report"
+
+    year: Mapped[int] = mapped_column(Integer, primary_key=True)
+    quarter: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    payload: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    generated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    invalidated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
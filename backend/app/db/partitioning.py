@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+"""Quarter range partitioning (Postgres, opt-in).
+
+Accounting closes by quarter (IVA trimestral) and uploads are stored by
+year/quarter. With `EMMO_DB_PARTITIONING=quarter` the two large append-mostly
+tables are declaratively partitioned by quarter too:
+
+- `ocr_info_clothes` by `invoice_created_at` (all lines of an invoice share a partition);
+- `price_observation` by `created_at`.
+
+`data_ocr_invoice` stays a regular table: Postgres only enforces a unique index
+on a partitioned table when it includes the partition key, and the header's
+unique keys (webhook message, supplier invoice number) must hold across
+quarters. Headers are one row per invoice; lines and observations are the bulk.
+
+Partitioning a table:
+- turns its primary key into `(id, <key>)` and appends `<key>` to its unique
+  constraints/indexes (enforced per quarter; lines share their invoice's key);
+- drops foreign keys into another partitioned table (`price_observation.line_id`);
+  reprocessing already deletes a line's observations explicitly;
+- lets queries filtered on the key scan only matching quarters (see
+  `line_partition_filter()` / `observation_partition_filter()`).
+
+Operations (`python -m scripts.partitions ...`):
+- `enable`: converts the tables in place (copies rows; run in a maintenance window);
+- `ensure`: creates the current and next `EMMO_DB_PARTITIONS_AHEAD` quarters
+  (also done at startup); schedule it so inserts never outrun the last partition;
+- `detach --before 2024-01-01 [--archive-schema archive]`: detaches whole
+  quarters (catalog change, no row deletes). Run the price compaction first so
+  detached observations are already in the monthly rollups.
+"""
+
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import Connection, text
+
+from app.db.models import DataOcrInvoice, OcrInfoClothes, PriceObservation
+from app.settings import get_settings
+
+# Conversion order matters: observations first, so their FK into lines goes away
+# with the old heap before lines are converted.
+PARTITION_KEYS = {
+    "price_observation": "created_at",
+    "ocr_info_clothes": "invoice_created_at",
+}
+
+_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def quarter_start(day: date) -> date:
+    return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+
+
+def next_quarter(start: date) -> date:
+    return date(start.year + 1, 1, 1) if start.month == 10 else date(start.year, start.month + 3, 1)
+
+
+def partition_name(table: str, start: date) -> str:
+    """`price_observation_2026q4` style name of the quarter starting at `start`."""
+    return f"{table}_{start.year}q{(start.month - 1) // 3 + 1}"
+
+
+def parse_partition_name(table: str, name: str) -> date | None:
+    """Quarter start encoded in a partition name; `None` for other names."""
+    m = re.fullmatch(rf"{re.escape(table)}_(\d{{4}})q([1-4])", name)
+    return date(int(m.group(1)), 3 * (int(m.group(2)) - 1) + 1, 1) if m else None
+
+
+def partitioning_enabled() -> bool:
+    return get_settings().db_partitioning == "quarter"
+
+
+def line_partition_filter(invoice: DataOcrInvoice) -> list:
+    """Extra WHERE clauses so loading an invoice's lines scans one partition."""
+    if not partitioning_enabled() or invoice.created_at is None:
+        return []
+    return [OcrInfoClothes.invoice_created_at == invoice.created_at]
+
+
+def observation_partition_filter(invoice: DataOcrInvoice) -> list:
+    """Extra WHERE clauses for an invoice's observations (never older than the invoice)."""
+    if not partitioning_enabled() or invoice.created_at is None:
+        return []
+    return [PriceObservation.created_at >= invoice.created_at]
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    q = text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :t AND c.relnamespace = CAST(current_schema() AS regnamespace)"
+    )
+    return conn.scalar(q, {"t": table}) is not None
+
+
+def list_partitions(conn: Connection, table: str) -> list[tuple[str, date | None]]:
+    """Partitions of `table` with their quarter start (`None` if not named by quarter)."""
+    q = text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t AND p.relnamespace = CAST(current_schema() AS regnamespace) ORDER BY c.relname"
+    )
+    return [(name, parse_partition_name(table, name)) for name in conn.scalars(q, {"t": table})]
+
+
+def _create_partition(conn: Connection, table: str, start: date) -> str | None:
+    name = partition_name(table, start)
+    if conn.scalar(text("SELECT to_regclass(:n)"), {"n": name}) is not None:
+        return None
+    conn.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{next_quarter(start).isoformat()}')"
+        )
+    )
+    return name
+
+
+def _create_quarters(conn: Connection, table: str, first: date, last: date) -> list[str]:
+    created = []
+    start = quarter_start(first)
+    while start <= last:
+        name = _create_partition(conn, table, start)
+        if name:
+            created.append(name)
+        start = next_quarter(start)
+    return created
+
+
+def _ahead(today: date, quarters: int) -> date:
+    start = quarter_start(today)
+    for _ in range(quarters):
+        start = next_quarter(start)
+    return start
+
+
+def ensure_partitions(conn: Connection, *, ahead: int | None = None, today: date | None = None) -> list[str]:
+    """Create missing partitions from the current quarter to `ahead` quarters later."""
+    ahead = get_settings().db_partitions_ahead if ahead is None else ahead
+    today = today or _today()
+    created = []
+    for table in PARTITION_KEYS:
+        if is_partitioned(conn, table):
+            created += _create_quarters(conn, table, today, _ahead(today, ahead))
+    return created
+
+
+def _with_key(columns_sql: str, key: str) -> str:
+    """Append `key` to the first parenthesized column list of a DDL fragment."""
+    return re.sub(r"\(([^()]*)\)", lambda m: f"({m.group(1)}, {key})", columns_sql, count=1)
+
+
+def partitioned_constraint(contype: str, definition: str, key: str) -> str | None:
+    """Constraint definition valid on the partitioned table (`None` = drop it).
+
+    `contype`/`definition` as in `pg_constraint` / `pg_get_constraintdef()`.
+    """
+    if contype == "p":
+        return f"PRIMARY KEY (id, {key})"
+    if contype == "u":
+        return _with_key(definition, key)
+    if contype == "f":
+        referenced = re.search(r"REFERENCES\s+(?:\w+\.)?(\w+)\s*\(", definition)
+        return None if referenced and referenced.group(1) in PARTITION_KEYS else definition
+    return definition
+
+
+def partitioned_index(indexdef: str, *, unique: bool, key: str) -> str:
+    """`pg_get_indexdef()` output valid on the partitioned table."""
+    if not unique:
+        return indexdef
+    head, sep, tail = indexdef.partition(" USING ")
+    return head + sep + _with_key(tail, key)
+
+
+def _convert(conn: Connection, table: str, key: str, *, last: date) -> None:
+    heap = f"{table}_heap"
+    constraints = conn.execute(
+        text(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = CAST(:t AS regclass) ORDER BY contype DESC, conname"
+        ),
+        {"t": table},
+    ).all()
+    indexes = conn.execute(
+        text(
+            "SELECT pg_get_indexdef(i.indexrelid), i.indisunique FROM pg_index i "
+            "WHERE i.indrelid = CAST(:t AS regclass) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)"
+        ),
+        {"t": table},
+    ).all()
+    sequence = conn.scalar(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table})
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {heap}"))
+    conn.execute(text(f"CREATE TABLE {table} (LIKE {heap} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})"))
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    conn.execute(text(f"UPDATE {heap} SET {key} = CURRENT_TIMESTAMP WHERE {key} IS NULL"))
+    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL"))
+
+    first = conn.scalar(text(f"SELECT min({key}) FROM {heap}"))
+    _create_quarters(conn, table, first.date() if first else last, last)
+    conn.execute(text(f"INSERT INTO {table} SELECT * FROM {heap}"))
+    conn.execute(text(f"DROP TABLE {heap}"))
+
+    for name, contype, definition in constraints:
+        ddl = partitioned_constraint(contype, definition, key)
+        if ddl is not None:
+            conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {ddl}"))
+    for indexdef, unique in indexes:
+        conn.execute(text(partitioned_index(indexdef, unique=unique, key=key)))
+
+
+def enable_partitioning(conn: Connection, *, ahead: int | None = None, today: date | None = None) -> list[str]:
+    """Convert the tables in `PARTITION_KEYS` to quarter partitions; returns converted tables.
+
+    Copies every row under an exclusive lock, so run it with the app stopped.
+    Already partitioned tables are skipped.
+    """
+    ahead = get_settings().db_partitions_ahead if ahead is None else ahead
+    last = _ahead(today or _today(), ahead)
+    converted = []
+    for table, key in PARTITION_KEYS.items():
+        if not is_partitioned(conn, table):
+            _convert(conn, table, key, last=last)
+            converted.append(table)
+    return converted
+
+
+def detach_partitions(conn: Connection, *, before: date, archive_schema: str | None = None) -> list[str]:
+    """Detach quarters that end on or before `before`; optionally move them to `archive_schema`."""
+    if archive_schema is not None and not _IDENTIFIER.match(archive_schema):
+        raise ValueError(f"invalid schema name: {archive_schema!r}")
+    detached = []
+    for table in PARTITION_KEYS:
+        if not is_partitioned(conn, table):
+            continue
+        for name, start in list_partitions(conn, table):
+            if start is None or next_quarter(start) > before:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if archive_schema:
+                conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+                conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+            detached.append(name)
+    return detached
+
+
+__all__ = [
+    "PARTITION_KEYS",
+    "detach_partitions",
+    "enable_partitioning",
+    "ensure_partitions",
+    "is_partitioned",
+    "line_partition_filter",
+    "list_partitions",
+    "next_quarter",
+    "observation_partition_filter",
+    "parse_partition_name",
+    "partition_name",
+    "partitioned_constraint",
+    "partitioned_index",
+    "partitioning_enabled",
+    "quarter_start",
+]
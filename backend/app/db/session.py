@@ -2,17 +2,73 @@
 
 This module exposes:
 
-- `init_engine()`: initializes a global SQLAlchemy engine + session factory.
-- `get_db()`: FastAPI dependency that yields a per-request `Session`.
+- `init_engine()`: initializes a global SQLAlchemy engine + session factory
+  (and the async engine, when enabled and its driver is installed).
+- `get_db()`: FastAPI dependency that yields a per-request `Session` (a read
+  session for GET/HEAD requests when a reader pool is configured).
+- `get_primary_db()`: same, but always on the primary (GET routes that may write).
+- `get_db_runner()`: FastAPI dependency for `async def` routes. It yields a
+  `DbRunner` whose `run(fn)` executes sync ORM code without blocking the event
+  loop: through `AsyncSession.run_sync` (aiosqlite / psycopg async / asyncpg)
+  or, when async is disabled, in the threadpool with a regular `Session`.
+- `database_key()`: driver-independent identity of a session's database, for
+  in-process caches shared by the sync and async engines.
+- `call_after_commit()` / `transaction_info()`: publish in-process cache updates
+  only once the transaction that made them commits.
+- `pool_stats()`: connections per engine pool (also exported to `/metrics`).
+- `statement_cache_stats()`: compiled-statement cache size and hit/miss counts.
 
 The configuration is driven by Settings (`EMMO_DATABASE_URL` and pool options).
+Scripts and Alembic keep using the sync engine.
+
+SQLite profile (`EMMO_SQLITE_PROFILE`, file databases only): every connection
+gets WAL/`synchronous`/`busy_timeout`/`mmap_size`/`cache_size` pragmas; `engine`
+is the single writer (a pool of exactly one connection, so concurrent writers
+wait in the pool queue rather than racing for the file lock) and `read_engine`
+is a pool of `query_only` connections that WAL lets run alongside the writer.
+
+SQLite engines emit `BEGIN` themselves: pysqlite otherwise defers it to the
+first DML statement, so a `begin_nested()` issued before any write becomes the
+outermost transaction and its `RELEASE` commits.
+
+Read replica (`EMMO_READ_DATABASE_URL`): `read_engine` points at the replica
+instead. GET/HEAD requests read from it unless the client asks for the
+primary with `X-Read-Primary: true` or carries the read-your-writes cookie
+that `ReadYourWritesMiddleware` sets after a successful write.
 """
 
-from sqlalchemy import create_engine
+import time
+from typing import Any, Callable, TypeVar
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+from starlette.concurrency import run_in_threadpool
 
+from app.services.metrics import DB_POOL_CONNECTIONS, DB_STATEMENT_CACHE, REGISTRY, instrument_engine
 from app.settings import get_settings
 
+T = TypeVar("T")
+
+# Async driver used for each sync driver when EMMO_ASYNC_DATABASE_URL is not set.
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+}
+
+
+def _prepare_connect_args(database_url: str) -> dict:
+    """psycopg 3 server-side prepared statements (`prepare_threshold`; `None` disables)."""
+    if make_url(database_url).get_driver_name() != "psycopg":
+        return {}
+    settings = get_settings()
+    return {"prepare_threshold": settings.db_prepare_threshold if settings.db_prepared_statements else None}
+
 
 def _make_engine(
     database_url: str,
@@ -27,18 +83,137 @@ def _make_engine(
     engine_kwargs: dict = {
         "echo": echo,
         "pool_pre_ping": pool_pre_ping,
+        "query_cache_size": get_settings().db_query_cache_size,
     }
     if database_url.startswith("sqlite"):
         connect_args = {"check_same_thread": False}
     else:
+        connect_args = _prepare_connect_args(database_url)
         engine_kwargs["pool_size"] = pool_size
         engine_kwargs["max_overflow"] = max_overflow
 
-    return create_engine(database_url, connect_args=connect_args, **engine_kwargs)
+    engine = create_engine(database_url, connect_args=connect_args, **engine_kwargs)
+    if database_url.startswith("sqlite"):
+        _emit_sqlite_begin(engine)
+    return engine
+
+
+def _emit_sqlite_begin(engine) -> None:
+    """Let SQLAlchemy, not pysqlite, start SQLite transactions (so SAVEPOINTs nest)."""
+
+    @event.listens_for(engine, "connect")
+    def _disable_driver_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+_SQLITE_SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def sqlite_profile_applies(database_url: str) -> bool:
+    """Whether the SQLite profile is enabled and `database_url` is a SQLite file."""
+    url = make_url(database_url)
+    return (
+        get_settings().sqlite_profile
+        and url.get_backend_name() == "sqlite"
+        and url.database not in (None, "", ":memory:")
+    )
+
+
+def _sqlite_pragmas(*, writer: bool) -> list[str]:
+    settings = get_settings()
+    synchronous = settings.sqlite_synchronous.upper()
+    if synchronous not in _SQLITE_SYNCHRONOUS:
+        raise ValueError(f"EMMO_SQLITE_SYNCHRONOUS must be one of {', '.join(_SQLITE_SYNCHRONOUS)}")
+    pragmas = [
+        f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA synchronous={synchronous}",
+        f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}",
+        f"PRAGMA cache_size={-int(settings.sqlite_cache_size_kib)}",
+    ]
+    if writer:
+        # Persistent in the file; only the writer switches it.
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+    else:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def _make_sqlite_engine(
+    database_url: str,
+    *,
+    echo: bool,
+    writer: bool,
+    pool_size: int,
+    max_overflow: int,
+    pool_timeout: float,
+):
+    """Create a SQLite writer or reader engine with the profile pragmas."""
+    engine = create_engine(
+        database_url,
+        echo=echo,
+        connect_args={"check_same_thread": False},
+        query_cache_size=get_settings().db_query_cache_size,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    pragmas = _sqlite_pragmas(writer=writer)
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    _emit_sqlite_begin(engine)
+    return engine
+
+
+def async_database_url(database_url: str) -> str:
+    """Map a sync SQLAlchemy URL to its async-driver equivalent."""
+    url = make_url(database_url)
+    driver = _ASYNC_DRIVERS.get(url.drivername)
+    return url.set(drivername=driver).render_as_string(hide_password=False) if driver else database_url
+
+
+def _make_async_engine(database_url: str, *, echo: bool, pool_pre_ping: bool, pool_size: int, max_overflow: int):
+    """Create the async engine; `None` when its driver is not installed."""
+    engine_kwargs: dict = {
+        "echo": echo,
+        "pool_pre_ping": pool_pre_ping,
+        "query_cache_size": get_settings().db_query_cache_size,
+    }
+    if database_url.startswith("sqlite"):
+        # Opening a SQLite file is cheap, and unpooled connections never outlive
+        # the event loop that created them.
+        engine_kwargs["poolclass"] = NullPool
+    else:
+        engine_kwargs["connect_args"] = _prepare_connect_args(database_url)
+        engine_kwargs["pool_size"] = pool_size
+        engine_kwargs["max_overflow"] = max_overflow
+    try:
+        engine = create_async_engine(database_url, **engine_kwargs)
+    except ImportError:
+        return None
+    if database_url.startswith("sqlite"):
+        _emit_sqlite_begin(engine.sync_engine)
+    return engine
 
 
 engine = None
 SessionLocal = None
+read_engine = None
+ReadSessionLocal = None
+async_engine: AsyncEngine | None = None
+AsyncSessionLocal = None
 
 
 def init_engine(database_url: str | None = None):
@@ -50,25 +225,148 @@ def init_engine(database_url: str | None = None):
     Notes:
         - For SQLite, `check_same_thread=False` is required for TestClient usage.
         - For remote DBs, pooling parameters are applied.
+        - With the SQLite profile, `engine` is the single writer and
+          `read_engine` the reader pool; otherwise reads share `engine`.
+        - `EMMO_READ_DATABASE_URL` makes `read_engine` the replica.
     """
-    global engine, SessionLocal
+    global engine, SessionLocal, read_engine, ReadSessionLocal
     settings = get_settings()
     url = database_url or settings.database_url
-    engine = _make_engine(
+    read_engine = None
+    if sqlite_profile_applies(url):
+        engine = _make_sqlite_engine(
+            url,
+            echo=settings.db_echo,
+            writer=True,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=settings.sqlite_write_timeout_s,
+        )
+        read_engine = _make_sqlite_engine(
+            url,
+            echo=settings.db_echo,
+            writer=False,
+            pool_size=settings.sqlite_reader_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.sqlite_write_timeout_s,
+        )
+    else:
+        engine = _make_engine(
+            url,
+            echo=settings.db_echo,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+        )
+    if settings.read_database_url:
+        read_engine = _make_engine(
+            settings.read_database_url,
+            echo=settings.db_echo,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+        )
+    instrument_engine(engine, slow_query_ms=settings.db_slow_query_ms)
+    if read_engine is not None:
+        instrument_engine(read_engine, slow_query_ms=settings.db_slow_query_ms)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    ReadSessionLocal = SessionLocal
+    if read_engine is not None:
+        ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=read_engine)
+    init_async_engine(None if database_url is None else async_database_url(database_url))
+
+
+def init_async_engine(async_url: str | None = None):
+    """(Re)initialize the global async engine/sessionmaker.
+
+    Disabled (`None`) when `EMMO_DB_ASYNC=false`, the async driver for the URL
+    is not installed, or the SQLite profile owns the writer; `get_db_runner()`
+    then falls back to the threadpool.
+    """
+    global async_engine, AsyncSessionLocal
+    settings = get_settings()
+    async_engine, AsyncSessionLocal = None, None
+    if not settings.db_async:
+        return
+    url = async_url or settings.async_database_url or async_database_url(settings.database_url)
+    if sqlite_profile_applies(url):
+        # A second (aiosqlite) connection would bypass the single-writer queue.
+        return
+    async_engine = _make_async_engine(
         url,
         echo=settings.db_echo,
         pool_pre_ping=settings.db_pool_pre_ping,
         pool_size=settings.db_pool_size,
         max_overflow=settings.db_max_overflow,
     )
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    if async_engine is None:
+        return
+    instrument_engine(async_engine.sync_engine, slow_query_ms=settings.db_slow_query_ms)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 
 init_engine()
 
 
-def get_db():
-    """Yield a SQLAlchemy session for a single request and always close it."""
+_READ_METHODS = frozenset({"GET", "HEAD"})
+READ_PRIMARY_HEADER = "x-read-primary"
+READ_PRIMARY_COOKIE = "emmo_read_primary_until"
+
+
+def _reads_from_primary(request: Request) -> bool:
+    """Read-your-writes escape hatch (only meaningful with a replica)."""
+    if not get_settings().read_database_url:
+        return False
+    if request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_db(request: Request):
+    """Yield a SQLAlchemy session for a single request and always close it.
+
+    GET/HEAD requests get a `ReadSessionLocal` session (the replica, the SQLite
+    reader pool when the profile is on, or the same engine otherwise) unless
+    `_reads_from_primary()` says the client must see its own writes.
+    """
+    if SessionLocal is None:
+        init_engine()
+    reads = request.method in _READ_METHODS and not _reads_from_primary(request)
+    factory = ReadSessionLocal if reads else SessionLocal
+    db = factory()  # type: ignore[operator]
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class DbRunner:
+    """Run sync ORM code from an `async def` route without blocking the event loop.
+
+    `fn` receives a regular `Session`. With an `AsyncSession` the I/O is awaited
+    through SQLAlchemy's greenlet bridge (`run_sync`), so DB waits overlap with
+    other requests on the same worker; otherwise `fn` runs in the threadpool.
+    ORM objects must be turned into response models inside `fn`.
+    """
+
+    def __init__(self, session: Session | AsyncSession):
+        self.session = session
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self.session, AsyncSession)
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+def get_primary_db():
+    """Yield a primary (writable) session for a single request and always close it."""
     if SessionLocal is None:
         init_engine()
     db = SessionLocal()  # type: ignore[operator]
@@ -76,3 +374,116 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_db_runner():
+    """Yield a `DbRunner` for a single request and always close its session."""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as adb:
+            yield DbRunner(adb)
+        return
+    if SessionLocal is None:
+        init_engine()
+    db = SessionLocal()  # type: ignore[operator]
+    try:
+        yield DbRunner(db)
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def database_key(db: Session) -> tuple:
+    """Identify the database behind `db`, ignoring the driver (sync vs async).
+
+    A replica session is keyed as its primary (same logical database).
+    """
+    bind = db.get_bind()
+    if read_engine is not None and bind is read_engine and engine is not None:
+        bind = engine
+    url = bind.url
+    return url.get_backend_name(), url.host, url.port, url.database
+
+
+_TRANSACTION_INFO = "emmo_transaction_info"
+
+
+def transaction_info(db: Session) -> dict:
+    """Scratch dict for the current transaction of `db`; dropped when it ends."""
+    return db.info.setdefault(_TRANSACTION_INFO, {})
+
+
+def call_after_commit(db: Session, callback: Callable[[], None]) -> None:
+    """Run `callback` once the current transaction of `db` commits; drop it on rollback.
+
+    For updates to in-process caches that other requests read: publishing them
+    before commit would expose rows a rollback then discards.
+    """
+    transaction_info(db).setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    # Also dispatched for SAVEPOINT releases; only the outermost commit counts.
+    if session.in_nested_transaction():
+        return
+    for callback in session.info.get(_TRANSACTION_INFO, {}).pop("after_commit", ()):
+        callback()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_transaction_info(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(_TRANSACTION_INFO, None)
+
+
+def _pool_status(pool) -> dict:
+    out: dict = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        out.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return out
+
+
+def pool_stats() -> dict[str, dict]:
+    """Pool status per engine: `primary`, plus `read` and `async` when configured."""
+    out = {}
+    if engine is not None:
+        out["primary"] = _pool_status(engine.pool)
+    if read_engine is not None:
+        out["read"] = _pool_status(read_engine.pool)
+    if async_engine is not None:
+        out["async"] = _pool_status(async_engine.pool)
+    return out
+
+
+def statement_cache_stats() -> dict[str, dict]:
+    """Compiled-statement cache size per engine, and cache results of executed statements."""
+    engines = {
+        "primary": engine,
+        "read": read_engine,
+        "async": async_engine.sync_engine if async_engine is not None else None,
+    }
+    caches = {}
+    for name, eng in engines.items():
+        if eng is None:
+            continue
+        # SQLAlchemy's LRU of compiled statements; None with query_cache_size=0.
+        cache = eng._compiled_cache
+        caches[name] = {"entries": len(cache or ()), "capacity": cache.capacity if cache is not None else 0}
+    results = {labels[0]: int(count) for labels, count in REGISTRY.collect(DB_STATEMENT_CACHE.name).items()}
+    return {"engines": caches, "results": results}
+
+
+def _pool_samples() -> dict[tuple, float]:
+    return {
+        (name, state): stats[state]
+        for name, stats in pool_stats().items()
+        for state in ("checked_in", "checked_out", "overflow")
+        if state in stats
+    }
+
+
+DB_POOL_CONNECTIONS.set_function(_pool_samples)
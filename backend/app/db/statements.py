@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+"""Hot-path SELECTs as lambda statements.
+
+A few statements run on nearly every request: an invoice's lines ordered by id,
+an article by `reference_code`, the recent price history of a reference. Built
+with `select()` on each call, SQLAlchemy has to rebuild the statement and
+compute its cache key before it can find the compiled SQL in the engine's
+`query_cache_size` cache. With `lambda_stmt` the statement is built once per code
+location; later calls only extract the new bound values (`invoice_id`,
+`reference_code`) from the lambdas' closures.
+
+Invoice by id stays `Session.get()`: it returns the identity-map object
+without SQL when the invoice is already loaded, and otherwise uses the mapper's
+cached primary-key load.
+
+Cache effectiveness is exported as `emmo_db_statement_cache_total{result}` (see
+`services/metrics`) and at `GET /health/db/statement-cache`.
+"""
+
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.orm import Session
+
+from app.db.models import DataOcrInvoice, ImportacionArticulosMontcau, OcrInfoClothes, PriceObservation
+from app.db.partitioning import partitioning_enabled
+
+# Observations considered by the history median (newest first).
+PRICE_HISTORY_LIMIT = 200
+
+
+def invoice_lines(db: Session, invoice: DataOcrInvoice) -> list[OcrInfoClothes]:
+    """The invoice's lines ordered by id (one partition when lines are partitioned)."""
+    invoice_id = invoice.id
+    created_at = invoice.created_at if partitioning_enabled() else None
+    stmt = lambda_stmt(lambda: select(OcrInfoClothes))
+    if created_at is None:
+        stmt += lambda s: s.where(OcrInfoClothes.invoice_id == invoice_id)
+    else:
+        stmt += lambda s: s.where(
+            OcrInfoClothes.invoice_id == invoice_id, OcrInfoClothes.invoice_created_at == created_at
+        )
+    stmt += lambda s: s.order_by(OcrInfoClothes.id)
+    return list(db.scalars(stmt).all())
+
+
+def article_by_reference(db: Session, reference_code: str) -> ImportacionArticulosMontcau | None:
+    stmt = lambda_stmt(
+        lambda: select(ImportacionArticulosMontcau).where(ImportacionArticulosMontcau.reference_code == reference_code)
+    )
+    return db.scalars(stmt).first()
+
+
+def recent_prices(db: Session, reference_code: str) -> list[float]:
+    """Newest `PRICE_HISTORY_LIMIT` observed prices of a reference."""
+    stmt = lambda_stmt(
+        lambda: select(PriceObservation.observed_price)
+        .where(PriceObservation.reference_code == reference_code)
+        .order_by(PriceObservation.created_at.desc())
+        .limit(PRICE_HISTORY_LIMIT)
+    )
+    return [float(p) for p in db.scalars(stmt).all() if p is not None]
+
+
+__all__ = ["PRICE_HISTORY_LIMIT", "article_by_reference", "invoice_lines", "recent_prices"]
@@ -7,16 +7,31 @@ Provides a single entrypoint `configure_logging()` used by `create_app()`.
 Features:
 - Adds `request_id` to log records via a filter (see middleware/request_context).
 - Supports either human-readable text logs or structured JSON logs.
+- Includes `extra=` fields (e.g. `flag`, `reference_code`) in both formats.
+- Non-blocking: request threads only enqueue records; a `QueueListener` thread
+  formats and writes them (`EMMO_LOG_QUEUE`).
+- Optional fast JSON encoder (orjson) and per-message sampling for
+  high-volume events (`EMMO_LOG_SAMPLE_RATES="price_flag=0.1"`).
 """
 
+import atexit
 import json
 import logging
+import queue
+import random
 import sys
-from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable
 
 from app.settings import get_settings
 from app.middleware.request_context import request_id_ctx
 
+# Attributes every LogRecord has; anything else came from `extra=`.
+_RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener: QueueListener | None = None
+_handler: logging.Handler | None = None
+
 
 class _RequestIdFilter(logging.Filter):
     """Inject `request_id` into every log record."""
@@ -25,8 +40,77 @@ class _RequestIdFilter(logging.Filter):
         return True
 
 
-def _json_formatter() -> logging.Formatter:
+class _SamplingFilter(logging.Filter):
+    """Keep only a fraction of records whose message is listed in `rates`."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self._rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self._rates.get(record.msg) if isinstance(record.msg, str) else None
+        if rate is None or rate >= 1.0:
+            return True
+        return rate > 0.0 and random.random() < rate
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller and keeps `extra=` attributes.
+
+    The stdlib `prepare()` formats the record with a default formatter and
+    replaces `msg`; here only the message/exception text are resolved so the
+    listener-side formatter still sees the original fields.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # dropping a log line beats stalling a request
+
+
+def _extra_fields(record: logging.LogRecord) -> dict[str, Any]:
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED_ATTRS and not k.startswith("_")}
+
+
+def _json_dumps(encoder: str) -> Callable[[dict], str]:
+    """Return a `dict -> str` JSON encoder (`orjson` when requested/available)."""
+    if encoder in ("auto", "orjson"):
+        try:
+            import orjson
+        except ImportError:
+            if encoder == "orjson":
+                raise
+        else:
+            return lambda payload: orjson.dumps(payload, default=str).decode("utf-8")
+    return lambda payload: json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    """Human-readable format with `extra=` fields appended as `key=value`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = _extra_fields(record)
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        return line
+
+
+def _json_formatter(encoder: str = "auto") -> logging.Formatter:
     """Build a JSON formatter implementation."""
+    dumps = _json_dumps(encoder)
+
     class JsonFormatter(logging.Formatter):
         def format(self, record: logging.LogRecord) -> str:
             payload = {
@@ -36,65 +120,83 @@ def _json_formatter() -> logging.Formatter:
             }
             if getattr(record, "request_id", None):
                 payload["request_id"] = record.request_id
+            payload.update(_extra_fields(record))
             if record.exc_info:
                 payload["exc_info"] = self.formatException(record.exc_info)
-            return json.dumps(payload, ensure_ascii=False)
+            elif record.exc_text:
+                payload["exc_info"] = record.exc_text
+            return dumps(payload)
 
     return JsonFormatter()
 
 
+def parse_sample_rates(value: str | None) -> dict[str, float]:
+    """Parse `"price_flag=0.1,other=0.5"` into `{message: rate}`."""
+    out: dict[str, float] = {}
+    for item in (value or "").split(","):
+        name, sep, rate = item.strip().partition("=")
+        if sep and name.strip():
+            out[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return out
+
+
+def stop_logging() -> None:
+    """Flush and stop the background log listener (if running)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 def configure_logging() -> None:
     """Configure process-wide logging based on Settings.
 
-    - `EMMO_LOG_JSON=true` enables JSON logs.
+    - `EMMO_LOG_JSON=true` enables JSON logs (`EMMO_LOG_JSON_ENCODER`).
     - `EMMO_LOG_LEVEL` controls verbosity.
+    - `EMMO_LOG_QUEUE` moves formatting/I/O to a background thread.
+    - `EMMO_LOG_SAMPLE_RATES` samples high-volume messages.
     """
+    global _handler, _listener
     settings = get_settings()
     level = settings.log_level.upper()
 
     if settings.log_json:
-        handler = {
-            "class": "logging.StreamHandler",
-            "stream": "ext://sys.stdout",
-            "formatter": "json",
-        }
-        formatters = {
-            "json": {
-                "()": "app.logging_config._json_formatter",
-            }
-        }
+        formatter = _json_formatter(settings.log_json_encoder)
     else:
-        handler = {
-            "class": "logging.StreamHandler",
-            "stream": "ext://sys.stdout",
-            "formatter": "default",
-        }
-        formatters = {
-            "default": {
-                "format": "%(asctime)s %(levelname)s %(name)s [request_id=%(request_id)s] %(message)s",
-            }
-        }
-
-    dictConfig(
-        {
-            "version": 1,
-            "disable_existing_loggers": False,
-            "formatters": formatters,
-            "handlers": {
-                "stdout": {
-                    **handler,
-                    "filters": ["request_id"],
-                },
-            },
-            "filters": {
-                "request_id": {"()": "app.logging_config._RequestIdFilter"},
-            },
-            "root": {
-                "handlers": ["stdout"],
-                "level": level,
-            },
-        }
-    )
-
-
-__all__ = ["configure_logging"]
+        formatter = _TextFormatter("%(asctime)s %(levelname)s %(name)s [request_id=%(request_id)s] %(message)s")
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+
+    # Request id and sampling run on the caller's thread: the contextvar is only
+    # visible there, and sampled-out records are never queued.
+    filters: list[logging.Filter] = [_RequestIdFilter()]
+    rates = parse_sample_rates(settings.log_sample_rates)
+    if rates:
+        filters.append(_SamplingFilter(rates))
+
+    stop_logging()
+    if settings.log_queue:
+        handler: logging.Handler = _DroppingQueueHandler(queue.Queue(maxsize=max(1, settings.log_queue_size)))
+        _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = stream
+    for f in filters:
+        handler.addFilter(f)
+
+    # Replace only the handler installed by a previous call (create_app() may run
+    # several times per process); handlers added by the host (pytest, uvicorn) stay.
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+        _handler.close()
+    _handler = handler
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+atexit.register(stop_logging)
+
+
+__all__ = ["configure_logging", "parse_sample_rates", "stop_logging"]
@@ -4,7 +4,8 @@ from __future__ import annotations
 
 `create_app()` wires together:
 - logging,
-- middleware (request id, security headers, optional trusted hosts / HTTPS redirect / rate limit),
+- middleware (request id, security headers, metrics, optional trusted hosts / HTTPS redirect / rate limit /
+  read-your-writes cookie),
 - and API routes.
 
 Database initialization is handled in the app lifespan; in production with Postgres
@@ -21,7 +22,9 @@ from starlette.middleware.trustedhost import TrustedHostMiddleware
 from app.api.routes import router
 from app.db.init_db import init_db
 from app.logging_config import configure_logging
+from app.middleware.metrics import MetricsMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
+from app.middleware.read_your_writes import ReadYourWritesMiddleware
 from app.middleware.request_context import RequestContextMiddleware
 from app.middleware.security_headers import SecurityHeadersMiddleware
 from app.settings import get_settings
@@ -46,6 +49,12 @@ def create_app() -> FastAPI:
     if settings.rate_limit_per_minute and settings.rate_limit_per_minute > 0:
         app.add_middleware(RateLimitMiddleware)
 
+    if settings.metrics_enabled or settings.db_query_headers:
+        app.add_middleware(MetricsMiddleware)
+
+    if settings.read_database_url:
+        app.add_middleware(ReadYourWritesMiddleware)
+
     if settings.enable_trusted_hosts and settings.trusted_hosts:
         allowed = [h.strip() for h in settings.trusted_hosts.split(",") if h.strip()]
         if allowed:
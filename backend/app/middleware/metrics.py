@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+"""Request latency and per-request DB metrics.
+
+Records `emmo_http_request_duration_seconds{method,route,status}` and the SQL
+statements/time of each request. `route` is the route template
+(`/invoices/{invoice_id}`), never the raw path, so label cardinality stays
+bounded; unmatched paths are reported as `unmatched`.
+
+With `EMMO_DB_QUERY_HEADERS=true` the request's SQL work is also returned as
+`X-DB-Queries` and `X-DB-Time` (milliseconds) response headers, which makes
+N+1 patterns visible from any HTTP client.
+"""
+
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import (
+    DB_STATEMENTS_PER_REQUEST,
+    DB_TIME_PER_REQUEST,
+    HTTP_REQUEST_DURATION,
+    RequestDbStats,
+    request_db_stats,
+)
+from app.settings import get_settings
+
+_route_templates: dict[object, str] = {}
+
+
+def route_template(scope: Scope) -> str:
+    """Return the path template of the route that handled `scope`."""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    template = _route_templates.get(endpoint)
+    if template is None:
+        template = "unmatched"
+        for route in getattr(scope.get("app"), "routes", ()):
+            if getattr(route, "endpoint", None) is endpoint:
+                template = route.path
+                break
+        _route_templates[endpoint] = template
+    return template
+
+
+class MetricsMiddleware:
+    """Observe latency per route/status and SQL work per request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self._observe = settings.metrics_enabled
+        self._db_headers = settings.db_query_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = RequestDbStats()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self._db_headers:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-DB-Queries", str(stats.statements))
+                    headers.append("X-DB-Time", f"{stats.duration_s * 1000:.2f}")
+            await send(message)
+
+        token = request_db_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_db_stats.reset(token)
+            if self._observe:
+                route = route_template(scope)
+                HTTP_REQUEST_DURATION.observe(elapsed, method=scope["method"], route=route, status=status)
+                DB_STATEMENTS_PER_REQUEST.observe(stats.statements, route=route)
+                DB_TIME_PER_REQUEST.observe(stats.duration_s, route=route)
+
+
+__all__ = ["MetricsMiddleware", "route_template"]
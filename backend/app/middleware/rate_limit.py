@@ -1,48 +1,220 @@
 from __future__ import annotations
 
+"""Token-bucket rate limiting.
+
+Each client gets a bucket of `EMMO_RATE_LIMIT_BURST` tokens (defaults to the
+per-minute limit) refilled continuously at `limit / 60` tokens per second, so
+there is no fixed-window burst at minute boundaries. Requests spend tokens
+according to per-route costs (uploads cost more than GETs).
+
+Clients that send the configured API key share one bucket (keyed by a digest,
+never the raw secret) and may get their own limit; everyone else, including
+clients sending a wrong key, is keyed by client IP.
+
+Backends:
+- `memory` (default): per-process buckets in an LRU map bounded by
+  `EMMO_RATE_LIMIT_MAX_KEYS`, so memory no longer grows with every distinct IP.
+- `sqlite`: buckets in a local SQLite file shared by every worker on the host,
+  so N workers enforce one limit instead of N x the configured one. Hits run
+  in the threadpool so a contended file lock never blocks the event loop.
+
+For multi-host deployments keep rate limiting at the gateway/Redis.
+"""
+
+import fnmatch
+import hashlib
+import hmac
+import math
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from app.settings import get_settings
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Very small in-memory rate limiter.
+@dataclass(frozen=True)
+class RateDecision:
+    """Result of spending tokens from a bucket."""
+    allowed: bool
+    remaining: float
+    retry_after_s: float
+
+
+def _spend(tokens: float, updated_at: float, now: float, *, capacity: float, rate: float, cost: float):
+    """Refill a bucket to `now` and try to spend `cost`; returns (tokens, decision)."""
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= cost:
+        tokens -= cost
+        return tokens, RateDecision(allowed=True, remaining=tokens, retry_after_s=0.0)
+    retry_after = (cost - tokens) / rate if rate > 0 else 60.0
+    return tokens, RateDecision(allowed=False, remaining=tokens, retry_after_s=retry_after)
+
+
+class MemoryTokenBuckets:
+    """Per-process token buckets in a bounded LRU map."""
+
+    def __init__(self, *, max_keys: int, clock: Callable[[], float] = time.monotonic):
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._max_keys = max(1, max_keys)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def hit(self, key: str, *, capacity: float, rate: float, cost: float) -> RateDecision:
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens, decision = _spend(tokens, updated_at, now, capacity=capacity, rate=rate, cost=cost)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self._max_keys:
+                # Least recently seen client; a fresh bucket for it is at worst more permissive.
+                self._buckets.popitem(last=False)
+        return decision
+
+
+class SqliteTokenBuckets:
+    """Token buckets in a local SQLite file, shared by all workers on a host.
 
-    Not suitable for multi-worker/multi-instance deployments.
-    For production, replace with a shared limiter (Redis) or an API gateway.
+    Each hit is one short `BEGIN IMMEDIATE` transaction. Buckets idle long enough
+    to be full again are equivalent to absent and are pruned; the table is also
+    capped at `max_keys` rows (least recently updated first).
     """
 
-    def __init__(self, app):
-        super().__init__(app)
-        self._bucket: dict[str, tuple[float, int]] = {}
+    _PRUNE_EVERY = 1000
 
-    async def dispatch(self, request: Request, call_next) -> Response:
+    def __init__(self, path: str, *, max_keys: int, clock: Callable[[], float] = time.time):
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_bucket ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_bucket_updated_at ON rate_limit_bucket (updated_at)")
+        self._max_keys = max(1, max_keys)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key: str, *, capacity: float, rate: float, cost: float) -> RateDecision:
+        now = self._clock()
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                row = cur.execute("SELECT tokens, updated_at FROM rate_limit_bucket WHERE key = ?", (key,)).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                tokens, decision = _spend(tokens, updated_at, now, capacity=capacity, rate=rate, cost=cost)
+                cur.execute(
+                    "INSERT INTO rate_limit_bucket (key, tokens, updated_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (key, tokens, now),
+                )
+                self._hits += 1
+                if self._hits % self._PRUNE_EVERY == 0:
+                    self._prune(cur, now=now, full_after_s=capacity / rate if rate > 0 else 60.0)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        return decision
+
+    def _prune(self, cur: sqlite3.Cursor, *, now: float, full_after_s: float) -> None:
+        cur.execute("DELETE FROM rate_limit_bucket WHERE updated_at < ?", (now - full_after_s,))
+        cur.execute(
+            "DELETE FROM rate_limit_bucket WHERE key IN ("
+            " SELECT key FROM rate_limit_bucket ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self._max_keys,),
+        )
+
+
+def parse_route_costs(value: str | None) -> list[tuple[str, str, float]]:
+    """Parse `"POST /process/invoice=5,GET /invoices/*=1"` into (method, path glob, cost)."""
+    out: list[tuple[str, str, float]] = []
+    for item in (value or "").split(","):
+        rule, sep, cost = item.strip().rpartition("=")
+        if not sep or not rule.strip():
+            continue
+        method, _, pattern = rule.strip().partition(" ")
+        out.append((method.strip().upper(), pattern.strip() or "*", float(cost)))
+    return out
+
+
+class RateLimitMiddleware:
+    """Token-bucket rate limiter with bounded memory and an optional shared store.
+
+    Plain ASGI middleware: allowed requests are passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
         settings = get_settings()
-        limit = int(settings.rate_limit_per_minute or 0)
-        if limit <= 0:
-            return await call_next(request)
+        self._buckets: MemoryTokenBuckets | SqliteTokenBuckets
+        if settings.rate_limit_store == "sqlite":
+            self._buckets = SqliteTokenBuckets(settings.rate_limit_sqlite_path, max_keys=settings.rate_limit_max_keys)
+        else:
+            self._buckets = MemoryTokenBuckets(max_keys=settings.rate_limit_max_keys)
+        # SQLite hits do blocking file I/O (up to the 5 s lock timeout).
+        self._offload = isinstance(self._buckets, SqliteTokenBuckets)
+        self._route_costs = parse_route_costs(settings.rate_limit_route_costs)
 
-        now = time.monotonic()
-        key = request.client.host if request.client else "unknown"
-        window_start, count = self._bucket.get(key, (now, 0))
-        if now - window_start >= 60.0:
-            window_start, count = now, 0
+    def _cost(self, method: str, path: str) -> float:
+        for rule_method, pattern, cost in self._route_costs:
+            if rule_method in (method, "*") and fnmatch.fnmatchcase(path, pattern):
+                return cost
+        return 1.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        settings = get_settings()
+        limit = int(settings.rate_limit_per_minute or 0)
+        if scope["type"] != "http" or limit <= 0:
+            await self.app(scope, receive, send)
+            return
 
-        count += 1
-        self._bucket[key] = (window_start, count)
+        api_key = Headers(scope=scope).get("x-api-key")
+        if api_key and settings.api_key and hmac.compare_digest(api_key.encode(), settings.api_key.encode()):
+            key = "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+            limit = int(settings.rate_limit_per_minute_api_key or limit)
+        else:
+            client = scope.get("client")
+            key = "ip:" + (client[0] if client else "unknown")
 
-        if count > limit:
-            return JSONResponse(
+        capacity = float(settings.rate_limit_burst or limit)
+        hit_kwargs = dict(
+            capacity=capacity,
+            rate=limit / 60.0,
+            cost=min(self._cost(scope["method"], scope["path"]), capacity),
+        )
+        if self._offload:
+            decision = await run_in_threadpool(self._buckets.hit, key, **hit_kwargs)
+        else:
+            decision = self._buckets.hit(key, **hit_kwargs)
+        if not decision.allowed:
+            response = JSONResponse(
                 status_code=429,
                 content={"detail": "Rate limit exceeded"},
-                headers={"Retry-After": "60"},
+                headers={"Retry-After": str(max(1, math.ceil(decision.retry_after_s)))},
             )
+            await response(scope, receive, send)
+            return
 
-        return await call_next(request)
+        await self.app(scope, receive, send)
 
 
-__all__ = ["RateLimitMiddleware"]
+__all__ = [
+    "MemoryTokenBuckets",
+    "RateDecision",
+    "RateLimitMiddleware",
+    "SqliteTokenBuckets",
+    "parse_route_costs",
+]
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+"""Read-your-writes cookie for replica routing.
+
+Installed only when `EMMO_READ_DATABASE_URL` is set. After a successful
+(< 400) write request, the response sets a short-lived cookie; while it is
+valid, `get_db()` sends that client's GET/HEAD requests to the primary, so a
+client never reads a replica that has not caught up with its own write.
+
+Clients without a cookie jar (scripts, integrations) can send
+`X-Read-Primary: true` on the reads that must be fresh.
+"""
+
+import math
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.session import READ_PRIMARY_COOKIE
+from app.settings import get_settings
+
+_SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadYourWritesMiddleware:
+    """Set the read-from-primary cookie after successful writes."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._window_s = get_settings().read_your_writes_s
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in _SAFE_METHODS or self._window_s <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                window = math.ceil(self._window_s)
+                until = math.ceil(time.time() + self._window_s)
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_PRIMARY_COOKIE}={until}; Max-Age={window}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+__all__ = ["ReadYourWritesMiddleware"]
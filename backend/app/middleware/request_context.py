@@ -6,32 +6,47 @@ This middleware:
 - Accepts an incoming `X-Request-ID` if provided (e.g. from a gateway), otherwise generates one.
 - Stores it in a contextvar (`request_id_ctx`) so logging can include it.
 - Echoes it back on the response header.
+
+It is a plain ASGI middleware (no `BaseHTTPMiddleware`): it only wraps `send`
+to add the header, so there is no extra task or body re-streaming per request.
 """
 
 import contextvars
 from uuid import uuid4
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
 request_id_ctx: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
 
 
-class RequestContextMiddleware(BaseHTTPMiddleware):
+class RequestContextMiddleware:
     """Attach a stable request id to the request and response."""
-    async def dispatch(self, request: Request, call_next) -> Response:
-        incoming = request.headers.get("X-Request-ID")
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get("x-request-id")
         request_id = incoming.strip() if incoming and incoming.strip() else uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if "x-request-id" not in headers:
+                    headers.append("X-Request-ID", request_id)
+            await send(message)
+
         token = request_id_ctx.set(request_id)
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_with_request_id)
         finally:
             request_id_ctx.reset(token)
 
-        response.headers.setdefault("X-Request-ID", request_id)
-        return response
-
 
 __all__ = ["RequestContextMiddleware", "request_id_ctx"]
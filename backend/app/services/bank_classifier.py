@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+"""Bank movement classification (port of the Apps Script `IDENTIFICAR` / `ESPECIFICACION`).
+
+`automate_reading_accountant.js` classifies each movement of the bank export
+cell by cell with long `descripcion.includes(...)` chains. Here the same rules
+are data (`IDENTIFY_RULES`, `SPECIFY_RULES`) compiled once:
+
+- every literal pattern of every rule goes into one Aho-Corasick automaton, so a
+  description is scanned once, whatever the number of rules;
+- a rule matches when all its patterns were found and its day-of-month / amount
+  predicates hold; the first matching rule (table order = JS order) wins;
+- within a batch, descriptions repeated across movements are scanned once.
+
+Semantics follow the JS on purpose, quirks included, so results are identical:
+matching is case-sensitive, `"BS"` shadows later rules (`"BSSG"` is unreachable),
+`"TAX"` matches inside any word, and transfer names keep their
+`"TRANSFERENCIA A "` prefix. Where the JS would throw (no date when a date rule
+is reached, no identification) the predicate simply does not hold.
+"""
+
+import math
+import re
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Iterable
+
+UNKNOWN = "DESCONOCIDO"
+OTHER_EXPENSES = "Otros gastos (CV)"
+CARD_INCOME = "700_000_000"
+
+Result = str | Callable[[str], str | None]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """`result` when every pattern in `all_of` occurs in the description and the predicates hold.
+
+    `day` / `amount` are inclusive `(low, high)` ranges (`None` = unbounded).
+    A callable `result` computes the value from the description; `None` means
+    "no match, keep going".
+    """
+    result: Result
+    all_of: tuple[str, ...] = ()
+    day: tuple[int | None, int | None] | None = None
+    amount: tuple[float | None, float | None] | None = None
+
+
+def _each(result: Result, *alternatives: str | tuple[str, ...]) -> tuple[Rule, ...]:
+    """One rule per alternative (JS `a || b`), in order."""
+    return tuple(Rule(result, alt if isinstance(alt, tuple) else (alt,)) for alt in alternatives)
+
+
+# JS `String.prototype.trim()` whitespace and JS `.` (anything but a line terminator).
+_JS_WHITESPACE = (
+    "\t\n\v\f\r \u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a"
+    "\u2028\u2029\u202f\u205f\u3000\ufeff"
+)
+_JS_DOT = r"[^\n\r\u2028\u2029]"
+# `$` in a JS regex without the `m` flag only matches at the very end: `\Z` here.
+_TRANSFER_SUFFIX = re.compile(r"(TRANSFERENCIA|TRANSFERENCIA A)\Z")
+_COMPANY_SUFFIX = re.compile(rf"( S{_JS_DOT}L{_JS_DOT}|S{_JS_DOT}L)\Z")
+_CARD_PURCHASE = re.compile(rf"COMPRA TARJ\. \d{{4}}X{{8}}\d{{4}} ({_JS_DOT}+)\Z", re.ASCII)
+_CARD_TOWN = re.compile(r"-(BARCELONA|BADALONA|SAN ADRIA DEL|SANT JOAN|ESPLUGUES|ESPLUGUES DE)\Z")
+
+
+def _transfer_name(descripcion: str) -> str:
+    """Payee of an outgoing transfer: the description without a trailing `S.L.`."""
+    nombre = _TRANSFER_SUFFIX.sub("", descripcion, count=1).strip(_JS_WHITESPACE)
+    return _COMPANY_SUFFIX.sub("", nombre, count=1).strip(_JS_WHITESPACE)
+
+
+def _card_merchant(descripcion: str) -> str | None:
+    """Merchant of a card purchase (`COMPRA TARJ. 1234XXXXXXXX5678 SHOP-BARCELONA` -> `SHOP`)."""
+    m = _CARD_PURCHASE.match(descripcion)
+    if not m:
+        return None
+    return _CARD_TOWN.sub("", m.group(1), count=1).strip(_JS_WHITESPACE)
+
+
+IDENTIFY_RULES: tuple[Rule, ...] = (
+    # Impuesto Sociedades / seguridad social: between the 27th and the end of the month.
+    Rule("631_000_000 (CV)", ("IMPUESTOS",), day=(27, None), amount=(350, 400)),
+    Rule("642 (CV)", ("IMPUESTOS",), day=(27, None)),
+    Rule("Arrendamientos (CV)", ("IMPUESTOS",), day=(20, 23), amount=(460, 470)),
+    Rule("IVA trimestral (CV)", ("IMPUESTOS",), day=(3, 7)),
+    *_each("Servicios profesionales (CF)", "ADEUDO RECIBO MARIA JESUS ROSAS MORAO", "TAX", "NOTARIA"),
+    *_each(
+        "Suministros (CF)",
+        "APPLE", "IATSAE", "JAZZTEL", "ENDESA", "Jazztel", "BeeDIGITAL", "AGEDI", "SGAE", "SECURITAS DIRECT",
+    ),
+    *_each(
+        "Gastos de personal (CF)",
+        ("TRANSFERENCIA A", "AIDA NORA"), "NOMINA COPALAU S.L.", "SEGUROS SOCIALES", "TGSS",
+    ),
+    *_each("Parking (CF)", "DOLORES TOLSA"),
+    *_each("Arrendamientos (CF)", "TRANSFERENCIA A PEDRO LOPEZ"),
+    *_each("Mobiliario (CV)", *(("COMPRA TARJ", shop) for shop in ("AMAZON", "Amazon", "LEROY", "BASAR", "BAZAR"))),
+    *_each("Gastos de transporte (CV)", "IBERSANTJUST, S.L.", "METRO", "LOGISTICA"),
+    *_each(
+        "Compra de Mercaderias (CV)",
+        ("CHLOE", "COMPRA"), "TRANSFERENCIA A", "ADEUDO", "BESTSELLER", "BE THE REFERENCE", "BLUE HOLE", "BS",
+        "COMPRA TARJ",
+    ),
+    Rule("Comision TPV (CF)", ("TPV", "SERVICIO")),
+    Rule("Comisiones bancarias (CF)", ("COMISIONES KT",)),
+    Rule("Comisiones bancarias (CF)", ("COMISIONES",), amount=(-54, -54)),
+    *_each(
+        "Comisiones bancarias (CV)",
+        ("COMISIONES", "MANTENIMIENTO"), "COMISIONES", "COMISIÓN", "COMISION", "INTERESES",
+    ),
+    *_each("Cuotas aplazamientos (CV)", "IMPUESTOS"),
+    *_each("Deudas a corto plazo (CV)", "TARJETA CREDITO"),
+    *_each("Primas de Seguro (CF)", "SEGUROS"),
+    *_each(CARD_INCOME, "ABONO TPV"),
+)
+
+# identification -> (rules, default). A rule without patterns always matches.
+SPECIFY_RULES: dict[str, tuple[tuple[Rule, ...], str]] = {
+    "700_000_000": ((), "VISA"),
+    "701_000_000": ((), "EFECTIVO"),
+    "Arrendamientos (CF)": ((), "CAMPFASO 22"),
+    "Compra de Mercaderias (CV)": (
+        (
+            *_each("VESMER", "MERTOR INVEST"),
+            *_each("ANGELINA", "ANGELINA"),
+            *_each("ASHLEY", "ASHLEY"),
+            *_each("BESTSELLER", "BESTSELLER", "BS", "Wholesale"),
+            *_each("BSSG", "BSSG"),
+            *_each("BLUE HOLE", "BLUE HOLE"),
+            *_each("BE THE REFERENCE", "BE THE REFERENCE"),
+            *_each("LETIZ", "LETIZ"),
+            *_each(
+                "CHLOE LUCAS",
+                "CHLOE LUCAS", "CHOE LUCAS", "CHOE & LUCAS", "CHLOE & LUCAS", "CLOE & LUCAS", "CLOE LUCAS",
+            ),
+            *_each("VESMER", "MERTOT"),
+            *_each("JIANNA", "JIANNA"),
+            *_each("PULSERAS", "PULSERAS"),
+            *_each("SHINE", "SHINE"),
+            *_each("PAN DE ORO", "JEWELS CENTURY"),
+            *_each("MIN MILA MOLINA", "MIN MILA"),
+            Rule(_transfer_name, ("TRANSFERENCIA A",)),
+            Rule(_card_merchant, ("COMPRA TARJ",)),
+        ),
+        UNKNOWN,
+    ),
+    "Comision TPV (CF)": ((), "Comision TPV"),
+    "Compra de Mercaderias B (CV)": (
+        tuple(
+            rule
+            for name in ("LETIZ", "ASHLEY", "CRISTINA", "BEATIFUL ENCOUNTER", "ANGELINA", "FEDERIKA")
+            for rule in _each(name, name)
+        ),
+        UNKNOWN,
+    ),
+    "MONTSE": (
+        (
+            *_each("YERAY (CV)", "YERAY"),
+            *_each("SERGIO (CF)", "SERGIO"),
+            *_each("MEDIA MENSUAL (CF)", "MEDIA MENSUAL"),
+            *_each("CASA COMIDA (CF)", "PANADERIA", "LIDL", "MERCADONA"),
+            *_each("TOMAR ALGO (CV)", "CAFES", "PUYOL", "COMIDA"),
+            *_each("CAPRICHOS (CV)", "FLORES"),
+            *_each("IMPUESTOS (CF)", ("IMPUESTO", "COCHE")),
+            *_each("IMPUESTOS (CV)", "IMPUESTO"),
+        ),
+        UNKNOWN,
+    ),
+    "Gastos de personal (CF)": (
+        (
+            *_each("NOMINA", "AIDA NORA", "NOMINA"),
+            *_each("SSGG A CARGO EMPRESA", "SEGUROS SOCIALES", "TGSS"),
+        ),
+        UNKNOWN,
+    ),
+    "Gastos de transporte (CV)": (
+        (*_each("GASOLINA", "COMPRA TARJ"), *_each("GASTOS TRANSPORTE", "RECIBO")),
+        UNKNOWN,
+    ),
+    "Mobiliario (CV)": (
+        (
+            *_each("AMAZON", "AMAZON", "Amazon", "amazon"),
+            *_each("LEROY MERLIN", "LEROY"),
+            *_each("BASAR CHINO", "BAZAR", "BASAR"),
+        ),
+        "POLIZA (GASTO)",
+    ),
+    "Suministros (CF)": (
+        (
+            *_each("IATSAE", "IATSAE"),
+            *_each("APPLE", "APPLE"),
+            *_each("BEEDIGITAL", "BeeDIGITAL"),
+            *_each("LUZ", "ENDESA"),
+            *_each("SECURITAS DIRECT", "SECURITAS DIRECT"),
+            *_each("JAZZTEL", "JAZZTEL", "Jazztel"),
+            *_each("SGAE - MUSICA", "AGEDI", "SGAE"),
+        ),
+        UNKNOWN,
+    ),
+    "Primas de Seguro (CF)": (
+        (*_each("DKV", "DKV"), *_each("COMPLEJO FAMILY", "SEGURCAIXA"), *_each("OBLIGATORIO", "BANSABADELL")),
+        UNKNOWN,
+    ),
+    "Servicios profesionales (CF)": ((*_each("TAX", "TAX"), *_each("NOTARIA", "NOTARIA")), "SSGG"),
+    "Deudas a corto plazo (CV)": ((), "TARGETA CREDITO"),
+    "Cuotas aplazamientos (CV)": ((), "IVA APLAZADO"),
+    "Parking (CF)": ((), "PARKING TIENDA"),
+}
+
+# Identifications matched by substring (JS `identificacion.includes(...)`), after the exact ones.
+SPECIFY_CONTAINS: tuple[tuple[str, tuple[tuple[Rule, ...], str]], ...] = (
+    (
+        "Comisiones bancarias",
+        (
+            (
+                *_each("MANTENIMIENTO", "MANTENIMIENTO"),
+                *_each("COMISIONES BANCARIAS", "INTERESES Y/O COMISIONES"),
+                *_each("DIVISA", "DIVISA"),
+            ),
+            "POLIZA (GASTO)",
+        ),
+    ),
+)
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton: which of many literal patterns occur in a text, in one pass."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: list[str] = []
+        self._ids: dict[str, int] = {}
+        goto: list[dict[str, int]] = [{}]
+        out: list[set[int]] = [set()]
+        for pattern in patterns:
+            if not pattern or pattern in self._ids:
+                continue
+            pid = self._ids[pattern] = len(self.patterns)
+            self.patterns.append(pattern)
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].add(pid)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] |= out[fail[nxt]]
+        self._goto = goto
+        self._fail = fail
+        self._out = [frozenset(o) for o in out]
+
+    def pattern_id(self, pattern: str) -> int:
+        return self._ids[pattern]
+
+    def find(self, text: str) -> set[int]:
+        """Ids of the patterns occurring in `text` (case-sensitive substrings)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[int] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+def _in_range(value: float | None, bounds: tuple[float | None, float | None] | None) -> bool:
+    if bounds is None:
+        return True
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return False
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+class _CompiledRules:
+    """Rules of one table as pattern-id sets, indexed by pattern for candidate lookup."""
+
+    def __init__(self, rules: tuple[Rule, ...], matcher: PatternMatcher):
+        self.rules = rules
+        self.required = [frozenset(matcher.pattern_id(p) for p in rule.all_of) for rule in rules]
+        self.always = [i for i, req in enumerate(self.required) if not req]
+        by_pattern: dict[int, list[int]] = {}
+        for i, req in enumerate(self.required):
+            for pid in req:
+                by_pattern.setdefault(pid, []).append(i)
+        self.by_pattern = by_pattern
+
+    def first(self, found: set[int], descripcion: str, *, day: int | None, amount: float | None) -> str | None:
+        candidates = set(self.always)
+        for pid in found:
+            candidates.update(self.by_pattern.get(pid, ()))
+        for i in sorted(candidates):
+            rule = self.rules[i]
+            if not self.required[i] <= found or not _in_range(day, rule.day) or not _in_range(amount, rule.amount):
+                continue
+            result = rule.result(descripcion) if callable(rule.result) else rule.result
+            if result is not None:
+                return result
+        return None
+
+
+@dataclass(frozen=True)
+class BankMovement:
+    fecha: date | None
+    descripcion: str | None
+    importe: float | None
+
+
+@dataclass(frozen=True)
+class Classification:
+    identificacion: str | None
+    especificacion: str | None
+
+
+class BankClassifier:
+    """Compiled `IDENTIFICAR` + `ESPECIFICACION` rules sharing one pattern automaton."""
+
+    def __init__(
+        self,
+        identify_rules: tuple[Rule, ...] = IDENTIFY_RULES,
+        specify_rules: dict[str, tuple[tuple[Rule, ...], str]] = SPECIFY_RULES,
+        specify_contains: tuple[tuple[str, tuple[tuple[Rule, ...], str]], ...] = SPECIFY_CONTAINS,
+    ):
+        tables = [identify_rules, *(r for r, _ in specify_rules.values()), *(r for _, (r, _) in specify_contains)]
+        self.matcher = PatternMatcher(p for rules in tables for rule in rules for p in rule.all_of)
+        self._identify = _CompiledRules(identify_rules, self.matcher)
+        self._specify = {
+            name: (_CompiledRules(rules, self.matcher), default) for name, (rules, default) in specify_rules.items()
+        }
+        self._specify_contains = [
+            (needle, _CompiledRules(rules, self.matcher), default) for needle, (rules, default) in specify_contains
+        ]
+
+    def _identify_found(self, found: set[int], descripcion: str, fecha: date | None, importe: float | None) -> str:
+        day = fecha.day if fecha is not None else None
+        result = self._identify.first(found, descripcion, day=day, amount=importe)
+        if result is not None:
+            return result
+        # Fallback por importe.
+        return CARD_INCOME if importe is not None and importe > 0 else OTHER_EXPENSES
+
+    def _specify_found(self, found: set[int], descripcion: str, identificacion: str | None) -> str:
+        table = self._specify.get(identificacion) if identificacion is not None else None
+        if table is None and identificacion is not None:
+            table = next(((t, d) for needle, t, d in self._specify_contains if needle in identificacion), None)
+        if table is None:
+            return UNKNOWN
+        rules, default = table
+        result = rules.first(found, descripcion, day=None, amount=None)
+        return default if result is None else result
+
+    def identificar(self, fecha: date | None, descripcion: str | None, importe: float | None) -> str | None:
+        """Identification (account/category) of one movement; `None` without description."""
+        if not descripcion:
+            return None
+        return self._identify_found(self.matcher.find(descripcion), descripcion, fecha, importe)
+
+    def especificacion(self, descripcion: str | None, identificacion: str | None) -> str | None:
+        """Specification (payee/concept) within an identification; `None` without description."""
+        if not descripcion:
+            return None
+        return self._specify_found(self.matcher.find(descripcion), descripcion, identificacion)
+
+    def classify(self, movements: Iterable[BankMovement]) -> list[Classification]:
+        """Identification and specification of every movement, in order."""
+        scanned: dict[str, set[int]] = {}
+        results = []
+        for mv in movements:
+            if not mv.descripcion:
+                results.append(Classification(None, None))
+                continue
+            found = scanned.get(mv.descripcion)
+            if found is None:
+                found = scanned[mv.descripcion] = self.matcher.find(mv.descripcion)
+            identificacion = self._identify_found(found, mv.descripcion, mv.fecha, mv.importe)
+            results.append(
+                Classification(identificacion, self._specify_found(found, mv.descripcion, identificacion))
+            )
+        return results
+
+
+@lru_cache(maxsize=1)
+def get_classifier() -> BankClassifier:
+    return BankClassifier()
+
+
+def identificar(fecha: date | None, descripcion: str | None, importe: float | None) -> str | None:
+    return get_classifier().identificar(fecha, descripcion, importe)
+
+
+def especificacion(descripcion: str | None, identificacion: str | None) -> str | None:
+    return get_classifier().especificacion(descripcion, identificacion)
+
+
+def classify_movements(movements: Iterable[BankMovement]) -> list[Classification]:
+    return get_classifier().classify(movements)
+
+
+__all__ = [
+    "BankClassifier",
+    "BankMovement",
+    "Classification",
+    "IDENTIFY_RULES",
+    "PatternMatcher",
+    "Rule",
+    "SPECIFY_CONTAINS",
+    "SPECIFY_RULES",
+    "classify_movements",
+    "especificacion",
+    "get_classifier",
+    "identificar",
+]
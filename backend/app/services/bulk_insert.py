@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+"""Bulk insert path for invoice lines and price observations.
+
+The ORM unit of work inserts `OcrInfoClothes`/`PriceObservation` one object
+at a time (one round trip per row on most drivers). For invoices with at least
+`EMMO_BULK_INSERT_MIN_ROWS` lines:
+
+- lines go in with `INSERT ... RETURNING` over multi-row VALUES batches
+  (SQLAlchemy "insertmanyvalues"); the returned rows are persistent ORM objects
+  in input order, so pricing can keep mutating them like before;
+- observations go in with `COPY ... FROM STDIN` on Postgres (sync psycopg 3)
+  and a multi-row `INSERT` elsewhere.
+
+Smaller invoices, `EMMO_BULK_INSERT_MIN_ROWS=0`, and SQLite builds without
+RETURNING use the ORM path.
+
+Observation rows are captured before pricing (the observed price is the OCR
+price, not the corrected one) and written after it, so the historical median
+never includes the invoice being priced, exactly as with pending ORM objects.
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, cast, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.db.models import DataOcrInvoice, OcrInfoClothes, PriceObservation
+from app.settings import get_settings
+
+_LINE_COLUMNS = tuple(c.key for c in OcrInfoClothes.__table__.columns if c.key != "id")
+_OBSERVATION_COPY_COLUMNS = ("created_at", "cif_supplier", "reference_code", "observed_price", "invoice_id", "line_id")
+
+
+def use_bulk_path(db: Session, rows: int) -> bool:
+    """Whether `rows` rows should take the bulk path on this session's database."""
+    threshold = get_settings().bulk_insert_min_rows
+    if threshold <= 0 or rows < threshold:
+        return False
+    return bool(db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order)
+
+
+def insert_lines(db: Session, lines: list[OcrInfoClothes]) -> list[OcrInfoClothes]:
+    """Persist new (transient) lines; returns them with ids, in input order.
+
+    On the bulk path the returned objects replace the transient ones (same
+    column values, now persistent); use the return value from here on.
+    """
+    if not lines:
+        return []
+    if not use_bulk_path(db, len(lines)):
+        db.add_all(lines)
+        db.flush()
+        return lines
+    # Core inserts skip the ORM `before_insert` hook that fills the partition key.
+    created_at: dict[int, datetime | None] = {}
+    for line in lines:
+        if line.invoice_created_at is None:
+            if line.invoice_id not in created_at:
+                created_at[line.invoice_id] = db.get(DataOcrInvoice, line.invoice_id).created_at
+            line.invoice_created_at = created_at[line.invoice_id]
+    rows = [{key: getattr(line, key) for key in _LINE_COLUMNS} for line in lines]
+    stmt = insert(OcrInfoClothes).returning(OcrInfoClothes, sort_by_parameter_order=True)
+    return list(db.scalars(stmt, rows))
+
+
+def observation_rows(lines: list[OcrInfoClothes], *, invoice_id: int) -> list[dict]:
+    """`PriceObservation` values for lines with a price and a reference."""
+    return [
+        {
+            "cif_supplier": line.cif_supplier,
+            "reference_code": line.reference_code,
+            "observed_price": float(line.price),
+            "invoice_id": invoice_id,
+            "line_id": line.id,
+        }
+        for line in lines
+        if line.price is not None and line.reference_code
+    ]
+
+
+def _copy_supported(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg" and not dialect.is_async
+
+
+def _copy_observations(db: Session, rows: list[dict]) -> None:
+    # The ORM binds the model default (aware UTC) and the server casts it to the
+    # naive column in the session time zone; COPY text would drop the offset
+    # instead, so let the server do the same cast once for the whole batch.
+    now = literal(datetime.now(timezone.utc), DateTime(timezone=True))
+    created_at = db.scalar(select(cast(now, DateTime)))
+    columns = ", ".join(_OBSERVATION_COPY_COLUMNS)
+    driver_connection = db.connection().connection.driver_connection
+    with driver_connection.cursor() as cursor:
+        with cursor.copy(f"COPY {PriceObservation.__tablename__} ({columns}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row((created_at, *(row[c] for c in _OBSERVATION_COPY_COLUMNS[1:])))
+
+
+def insert_price_observations(db: Session, rows: list[dict]) -> None:
+    """Write observation rows (see `observation_rows`)."""
+    if not rows:
+        return
+    if not use_bulk_path(db, len(rows)):
+        db.add_all(PriceObservation(**row) for row in rows)
+        return
+    if _copy_supported(db):
+        _copy_observations(db, rows)
+    else:
+        db.execute(insert(PriceObservation), rows)
+
+
+__all__ = ["insert_lines", "insert_price_observations", "observation_rows", "use_bulk_path"]
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+"""Cash-register reconciliation over imported closings (`cash_closing`).
+
+Replaces eyeballing the "CONSULTA EFECTIVO" sheet. Per closing:
+
+- `expected`: the register's computed cash (`calculado`); when the export has
+  none, `venta_efectivo + entrada - salida`;
+- `discrepancy`: `declarado - expected` (what `descuadre` should say; closings
+  where it does not are flagged `reported_mismatch`);
+- `running_balance`: cash that should be in the drawer after the closing,
+  accumulated per register in closing order:
+  `sum(venta_efectivo + entrada - salida - retirado + discrepancy)`;
+- `cumulative_discrepancy`: running sum of `discrepancy` per register;
+- outliers: robust z-score of `discrepancy` within its register and within its
+  employee, `|x - median| / (1.4826 * MAD) > EMMO_CASH_OUTLIER_Z`, and at least
+  `EMMO_CASH_OUTLIER_MIN_EUR` away from the median (with MAD 0, e.g. a register
+  that is usually exact, any such deviation is an outlier).
+
+Everything is computed on whole columns: one SELECT (rows sorted by register
+and date), transposed into column tuples, then `map` / `accumulate` over columns and
+per-group slices. No per-closing Python logic, so years of closings take
+milliseconds.
+"""
+
+import operator
+import statistics
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import accumulate, chain, repeat
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import CashClosing
+from app.settings import get_settings
+
+_MAD_SCALE = 1.4826
+_CENT = 0.005
+
+
+@dataclass(frozen=True)
+class GroupStats:
+    """Discrepancy statistics of one register or employee."""
+    key: str
+    closings: int
+    expected_total: float
+    declared_total: float
+    discrepancy_total: float
+    discrepancy_median: float
+    discrepancy_mad: float
+    outliers: int
+    final_balance: float | None = None
+
+
+@dataclass
+class Reconciliation:
+    """Per-closing columns (same order: register, date, number) plus group summaries."""
+    id: tuple[int, ...] = ()
+    fecha: tuple[date, ...] = ()
+    caja: tuple[str, ...] = ()
+    numero: tuple[str, ...] = ()
+    empleado: tuple[str, ...] = ()
+    expected: list[float] = field(default_factory=list)
+    declared: tuple[float, ...] = ()
+    discrepancy: list[float] = field(default_factory=list)
+    reported_mismatch: list[bool] = field(default_factory=list)
+    running_balance: list[float] = field(default_factory=list)
+    cumulative_discrepancy: list[float] = field(default_factory=list)
+    outlier_register: list[bool] = field(default_factory=list)
+    outlier_employee: list[bool] = field(default_factory=list)
+    registers: list[GroupStats] = field(default_factory=list)
+    employees: list[GroupStats] = field(default_factory=list)
+
+    def closings(self, *, only_flagged: bool = False) -> list[dict]:
+        """Row view of the columns (optionally only outliers / reported mismatches)."""
+        names = (
+            "id", "fecha", "caja", "numero", "empleado", "expected", "declared", "discrepancy", "reported_mismatch",
+            "running_balance", "cumulative_discrepancy", "outlier_register", "outlier_employee",
+        )
+        rows = (dict(zip(names, values)) for values in zip(*(getattr(self, n) for n in names)))
+        if not only_flagged:
+            return list(rows)
+        return [r for r in rows if r["outlier_register"] or r["outlier_employee"] or r["reported_mismatch"]]
+
+
+def _segments(keys: tuple[str, ...] | list[str]) -> list[tuple[str, int, int]]:
+    """`(key, start, stop)` of each run of equal keys in a sorted sequence."""
+    return [(k, bisect_left(keys, k), bisect_right(keys, k)) for k in sorted(set(keys))]
+
+
+def _round(values) -> list[float]:
+    return list(map(round, values, repeat(2)))
+
+
+def _take(values, order: list[int]) -> list:
+    return list(map(values.__getitem__, order))
+
+
+def _cumsum_by_segment(values: list[float], segments: list[tuple[str, int, int]]) -> list[float]:
+    """Running sum of `values` restarting at each segment (values sorted by segment)."""
+    total = list(accumulate(values, initial=0.0))
+    base = chain.from_iterable(repeat(total[start], stop - start) for _, start, stop in segments)
+    return _round(map(operator.sub, total[1:], base))
+
+
+def _outliers(values: list[float], z: float, min_eur: float) -> tuple[list[bool], float, float]:
+    median = statistics.median(values)
+    deviation = list(map(abs, map(operator.sub, values, repeat(median))))
+    mad = statistics.median(deviation)
+    limit = max(min_eur, z * _MAD_SCALE * mad) if mad else min_eur
+    return list(map((limit - _CENT).__lt__, deviation)), median, mad
+
+
+def _group_stats(
+    r: Reconciliation,
+    order: list[int],
+    z: float,
+    min_eur: float,
+    keys: tuple[str, ...],
+    *,
+    balance: bool = False,
+) -> tuple[list[GroupStats], list[bool]]:
+    """Stats per group of `keys` (rows visited in `order`, grouped); outlier flags in row order."""
+    grouped = _take(keys, order)
+    discrepancy, expected, declared = _take(r.discrepancy, order), _take(r.expected, order), _take(r.declared, order)
+    stats, flags = [], []
+    for key, start, stop in _segments(grouped):
+        seg = discrepancy[start:stop]
+        is_outlier, median, mad = _outliers(seg, z, min_eur)
+        flags += is_outlier
+        stats.append(
+            GroupStats(
+                key=key,
+                closings=stop - start,
+                expected_total=round(sum(expected[start:stop]), 2),
+                declared_total=round(sum(declared[start:stop]), 2),
+                discrepancy_total=round(sum(seg), 2),
+                discrepancy_median=round(median, 2),
+                discrepancy_mad=round(mad, 2),
+                outliers=sum(is_outlier),
+                final_balance=r.running_balance[order[stop - 1]] if balance else None,
+            )
+        )
+    # Back to row order: position of each row in `order`.
+    inverse = sorted(range(len(order)), key=order.__getitem__)
+    return stats, _take(flags, inverse)
+
+
+def reconcile_cash(
+    db: Session,
+    *,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    caja: str | None = None,
+) -> Reconciliation:
+    """Reconcile the stored closings in `[date_from, date_to]` (optionally one register)."""
+    settings = get_settings()
+    zero = 0.0
+    cash_in = func.coalesce(CashClosing.venta_efectivo, zero) + func.coalesce(CashClosing.entrada, zero)
+    cash_out = func.coalesce(CashClosing.salida, zero)
+    q = select(
+        CashClosing.id,
+        CashClosing.fecha,
+        CashClosing.caja,
+        func.coalesce(CashClosing.numero, ""),
+        func.coalesce(CashClosing.empleado, ""),
+        func.coalesce(CashClosing.calculado, cash_in - cash_out),
+        func.coalesce(CashClosing.declarado, zero),
+        func.coalesce(CashClosing.descuadre, zero),
+        cash_in - cash_out - func.coalesce(CashClosing.retirado, zero),
+    )
+    if date_from is not None:
+        q = q.where(CashClosing.fecha >= date_from)
+    if date_to is not None:
+        q = q.where(CashClosing.fecha <= date_to)
+    if caja is not None:
+        q = q.where(CashClosing.caja == caja)
+    rows = db.execute(q).all()
+    if not rows:
+        return Reconciliation()
+    # Sorted here, not in SQL: grouping relies on Python's string order, not the DB collation.
+    rows.sort(key=operator.itemgetter(2, 1, 3, 0))
+
+    ids, fechas, cajas, numeros, empleados, expected, declared, reported, net_flow = zip(*rows)
+    r = Reconciliation(id=ids, fecha=fechas, caja=cajas, numero=numeros, empleado=empleados, declared=declared)
+    r.expected = _round(map(float, expected))
+    r.discrepancy = _round(map(operator.sub, declared, r.expected))
+    r.reported_mismatch = list(map(_CENT.__lt__, map(abs, map(operator.sub, r.discrepancy, reported))))
+
+    registers = _segments(cajas)
+    r.running_balance = _cumsum_by_segment(list(map(operator.add, net_flow, r.discrepancy)), registers)
+    r.cumulative_discrepancy = _cumsum_by_segment(r.discrepancy, registers)
+
+    z, min_eur = settings.cash_outlier_z, settings.cash_outlier_min_eur
+    rows_in_order = list(range(len(ids)))
+    r.registers, r.outlier_register = _group_stats(r, rows_in_order, z, min_eur, cajas, balance=True)
+    by_employee = sorted(rows_in_order, key=empleados.__getitem__)
+    r.employees, r.outlier_employee = _group_stats(r, by_employee, z, min_eur, empleados)
+    return r
+
+
+__all__ = ["GroupStats", "Reconciliation", "reconcile_cash"]
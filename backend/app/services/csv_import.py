@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+"""Streaming import of the bank and cash-register CSV exports.
+
+The Apps Script (`CSVmovimientos` / `CSVefectivo`) re-copied the whole export
+sheet on every run. Here each export is read row by row from the upload
+(never fully in memory) and written in batches of `EMMO_CSV_IMPORT_BATCH_ROWS`:
+
+- every row gets a `fingerprint` (sha256 of its identifying fields) with a
+  unique index, so one `INSERT ... ON CONFLICT (fingerprint) DO NOTHING` per
+  batch adds only rows not imported before; overlapping exports are fine;
+- rows repeated inside the same export are dropped before the insert, except
+  bank movements: the n-th repeat of a `(fecha, descripcion, importe)` in one
+  file is fingerprinted with its ordinal, so genuine identical movements on the
+  same day are all kept, and re-importing the file still skips them;
+- bank movements are classified (`services/bank_classifier`) as they are read,
+  and the quarterly reports of the quarters that got new movements are invalidated.
+
+Layout: data starts at `EMMO_*_CSV_FIRST_ROW` and fields are mapped with
+`EMMO_*_CSV_COLUMNS` ("field=column letter", as in the sheet). Rows whose date
+does not parse (footers, totals) or whose first column is empty are not
+imported; the former are counted as `invalid`. A bank `saldo` that does not
+parse is stored as empty instead of rejecting the movement. Amounts accept Spanish
+formatting (`1.234,56`), dates `dd/mm/yyyy`, `dd-mm-yyyy`, `dd/mm/yy` or ISO.
+"""
+
+import csv
+import functools
+import hashlib
+import io
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.db.models import BankAccountMovement, CashClosing
+from app.services.bank_classifier import BankMovement, classify_movements
+from app.services.quarterly_report import invalidate_quarters, quarter_of
+from app.settings import get_settings
+
+_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%y")
+_BANK_REQUIRED = ("fecha", "descripcion", "importe")
+_CASH_REQUIRED = ("fecha", "caja")
+_CASH_AMOUNTS = (
+    "ventas_totales",
+    "venta_efectivo",
+    "entrada",
+    "salida",
+    "calculado",
+    "declarado",
+    "descuadre",
+    "retirado",
+)
+
+
+@dataclass
+class ImportResult:
+    """Outcome of one CSV import (`rows` = data rows read)."""
+    rows: int = 0
+    inserted: int = 0
+    invalid: int = 0
+    first_date: date | None = None
+    last_date: date | None = None
+    # (year, quarter) of the inserted rows.
+    quarters: set[tuple[int, int]] = field(default_factory=set)
+
+    @property
+    def skipped(self) -> int:
+        """Rows already stored (earlier imports or repeated in this file)."""
+        return self.rows - self.inserted - self.invalid
+
+    def _seen(self, day: date) -> None:
+        self.first_date = day if self.first_date is None else min(self.first_date, day)
+        self.last_date = day if self.last_date is None else max(self.last_date, day)
+
+
+def column_index(letter: str) -> int:
+    """0-based index of a spreadsheet column letter (`A` -> 0, `AA` -> 26)."""
+    index = 0
+    for ch in letter.strip().upper():
+        if not "A" <= ch <= "Z":
+            raise ValueError(f"invalid column letter: {letter!r}")
+        index = index * 26 + ord(ch) - ord("A") + 1
+    if index == 0:
+        raise ValueError(f"invalid column letter: {letter!r}")
+    return index - 1
+
+
+def parse_columns(value: str, required: Iterable[str]) -> dict[str, int]:
+    """Parse a `field=letter,...` mapping into `{field: index}`."""
+    columns = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        field, sep, letter = item.partition("=")
+        if not sep:
+            raise ValueError(f"invalid column mapping: {item!r}")
+        columns[field.strip()] = column_index(letter)
+    missing = [f for f in required if f not in columns]
+    if missing:
+        raise ValueError(f"column mapping lacks: {', '.join(missing)}")
+    return columns
+
+
+def parse_amount(value: str | None) -> float | None:
+    """`"-1.234,56 €"` -> `-1234.56`; empty -> `None`; raises `ValueError` otherwise."""
+    s = (value or "").replace("€", "").replace("\u00a0", "").replace(" ", "").strip()
+    if not s:
+        return None
+    if "," in s:
+        s = s.replace(".", "").replace(",", ".")
+    return float(s)
+
+
+def parse_date(value: str | None) -> date | None:
+    s = (value or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _fingerprint(*parts: object) -> str:
+    text = "|".join("" if p is None else f"{p:.2f}" if isinstance(p, float) else str(p) for p in parts)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _squash(value: str) -> str:
+    return " ".join(value.split())
+
+
+def _rows(stream: BinaryIO, *, first_row: int, columns: dict[str, int]) -> Iterator[dict[str, str]]:
+    """Data rows as `{field: raw cell}`, read lazily from a binary stream."""
+    settings = get_settings()
+    text = io.TextIOWrapper(stream, encoding=settings.csv_import_encoding, newline="")
+    try:
+        width = max(columns.values()) + 1
+        for number, cells in enumerate(csv.reader(text, delimiter=settings.csv_import_delimiter), start=1):
+            if number < first_row or not cells or not cells[0].strip():
+                continue
+            cells += [""] * (width - len(cells))
+            yield {field: cells[i].strip() for field, i in columns.items()}
+    finally:
+        # Leave the upload's file object open for its owner.
+        text.detach()
+
+
+def _insert_new(db: Session, model, rows: list[dict]) -> list[date]:
+    """Insert rows whose fingerprint is not stored yet (one statement); returns their dates."""
+    if not rows:
+        return []
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        q = select(table.c.fingerprint).where(table.c.fingerprint.in_([r["fingerprint"] for r in rows]))
+        stored = set(db.scalars(q))
+        rows = [r for r in rows if r["fingerprint"] not in stored]
+        if rows:
+            db.execute(insert(table).values(rows))
+        return [r["fecha"] for r in rows]
+    stmt = upsert(table).values(rows).on_conflict_do_nothing(index_elements=["fingerprint"])
+    return list(db.scalars(stmt.returning(table.c.fecha)))
+
+
+def _import(
+    db: Session,
+    rows: Iterator[dict[str, str]],
+    model,
+    build: Callable[[dict[str, str]], dict | None],
+    finish_batch: Callable[[list[dict]], None] | None = None,
+) -> ImportResult:
+    result = ImportResult()
+    batch_rows = max(1, get_settings().csv_import_batch_rows)
+    batch: dict[str, dict] = {}
+
+    def flush() -> None:
+        values = list(batch.values())
+        if finish_batch is not None:
+            finish_batch(values)
+        inserted = _insert_new(db, model, values)
+        result.inserted += len(inserted)
+        result.quarters.update(quarter_of(day) for day in inserted)
+        batch.clear()
+
+    for raw in rows:
+        result.rows += 1
+        try:
+            row = build(raw)
+        except ValueError:
+            row = None
+        if row is None:
+            result.invalid += 1
+            continue
+        result._seen(row["fecha"])
+        batch.setdefault(row["fingerprint"], row)
+        if len(batch) >= batch_rows:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+def _bank_row(raw: dict[str, str], *, occurrences: dict[tuple, int]) -> dict | None:
+    """Build a movement row; `occurrences` counts `(fecha, descripcion, importe)` within the file."""
+    fecha = parse_date(raw["fecha"])
+    importe = parse_amount(raw["importe"])
+    if fecha is None or importe is None or not raw["descripcion"]:
+        return None
+    try:
+        saldo = parse_amount(raw.get("saldo"))
+    except ValueError:
+        # The balance column is optional evidence; a bad mapping must not drop movements.
+        saldo = None
+    descripcion = _squash(raw["descripcion"])
+    key = (fecha, descripcion, importe)
+    repeat = occurrences.get(key, 0)
+    occurrences[key] = repeat + 1
+    # The first occurrence keeps the plain fingerprint (rows stored before the counter existed).
+    parts = (fecha.isoformat(), descripcion, importe, saldo) + ((repeat,) if repeat else ())
+    return {
+        "fingerprint": _fingerprint(*parts),
+        "fecha": fecha,
+        "descripcion": raw["descripcion"],
+        "importe": importe,
+        "saldo": saldo,
+        "referencia_1": raw.get("referencia_1") or None,
+        "referencia_2": raw.get("referencia_2") or None,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def _classify(rows: list[dict]) -> None:
+    movements = [BankMovement(r["fecha"], r["descripcion"], r["importe"]) for r in rows]
+    for row, c in zip(rows, classify_movements(movements)):
+        row["identificacion"] = c.identificacion
+        row["especificacion"] = c.especificacion
+
+
+def _cash_row(raw: dict[str, str]) -> dict | None:
+    fecha = parse_date(raw["fecha"])
+    if fecha is None or not raw["caja"]:
+        return None
+    amounts = {field: parse_amount(raw.get(field)) for field in _CASH_AMOUNTS}
+    numero = raw.get("numero") or None
+    return {
+        "fingerprint": _fingerprint(
+            fecha.isoformat(), f"{raw['caja']}/{numero or ''}", amounts["ventas_totales"], amounts["declarado"]
+        ),
+        "fecha": fecha,
+        "caja": raw["caja"],
+        "numero": numero,
+        "empleado": raw.get("empleado") or None,
+        **amounts,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def import_bank_csv(db: Session, stream: BinaryIO) -> ImportResult:
+    """Import a bank movements export; only new movements are inserted (caller commits)."""
+    settings = get_settings()
+    columns = parse_columns(settings.bank_csv_columns, _BANK_REQUIRED)
+    rows = _rows(stream, first_row=settings.bank_csv_first_row, columns=columns)
+    build = functools.partial(_bank_row, occurrences={})
+    result = _import(db, rows, BankAccountMovement, build, _classify)
+    invalidate_quarters(db, result.quarters)
+    return result
+
+
+def import_cash_csv(db: Session, stream: BinaryIO) -> ImportResult:
+    """Import a cash-register closings export; only new closings are inserted (caller commits)."""
+    settings = get_settings()
+    columns = parse_columns(settings.cash_csv_columns, _CASH_REQUIRED)
+    rows = _rows(stream, first_row=settings.cash_csv_first_row, columns=columns)
+    return _import(db, rows, CashClosing, _cash_row)
+
+
+__all__ = [
+    "ImportResult",
+    "column_index",
+    "import_bank_csv",
+    "import_cash_csv",
+    "parse_amount",
+    "parse_columns",
+    "parse_date",
+]
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+"""Duplicate supplier invoice detection.
+
+The same supplier invoice often arrives more than once (re-sent photo, e-mail
+and WhatsApp copies). Processing it again multiplies lines, article updates and
+`PriceObservation` rows, which skews the pricing medians.
+
+An invoice is a duplicate of an earlier *canonical* invoice (one that is not
+itself linked as a duplicate) when either:
+
+- `(cif_supplier, num_invoice)` matches (backed by a partial unique index), or
+- the uploaded file has the same `invoice_file_sha256`.
+
+What happens then is decided by `EMMO_DUPLICATE_INVOICE_POLICY` (see routes):
+`reject` (409), `merge` (return the original) or `link` (store a header-only
+row with `status=duplicate` pointing at the original).
+"""
+
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.models import DataOcrInvoice
+
+DUPLICATE_POLICIES = ("reject", "merge", "link")
+
+# CIF placeholder used by the stub OCR; too ambiguous to match on.
+_UNKNOWN_CIF = "UNKNOWN"
+
+
+@dataclass(frozen=True)
+class DuplicateMatch:
+    """An earlier canonical invoice matched by `reason` (`cif_num` or `file_sha256`)."""
+    invoice: DataOcrInvoice
+    reason: str
+
+
+def find_duplicate_invoice(
+    db: Session,
+    *,
+    cif_supplier: str | None = None,
+    num_invoice: str | None = None,
+    file_sha256: str | None = None,
+    exclude_invoice_id: int | None = None,
+) -> DuplicateMatch | None:
+    """Return the canonical invoice this one duplicates, if any.
+
+    Both lookups are single indexed queries; the `(cif_supplier, num_invoice)`
+    check runs first because it is the accounting identity of an invoice.
+    """
+    base = select(DataOcrInvoice).where(DataOcrInvoice.duplicate_of_invoice_id.is_(None))
+    if exclude_invoice_id is not None:
+        base = base.where(DataOcrInvoice.id != exclude_invoice_id)
+
+    if cif_supplier and cif_supplier != _UNKNOWN_CIF and num_invoice:
+        q = base.where(
+            DataOcrInvoice.cif_supplier == cif_supplier,
+            DataOcrInvoice.num_invoice == num_invoice,
+        )
+        invoice = db.scalars(q.order_by(DataOcrInvoice.id).limit(1)).first()
+        if invoice is not None:
+            return DuplicateMatch(invoice=invoice, reason="cif_num")
+
+    if file_sha256:
+        q = base.where(DataOcrInvoice.invoice_file_sha256 == file_sha256)
+        invoice = db.scalars(q.order_by(DataOcrInvoice.id).limit(1)).first()
+        if invoice is not None:
+            return DuplicateMatch(invoice=invoice, reason="file_sha256")
+
+    return None
+
+
+__all__ = ["DUPLICATE_POLICIES", "DuplicateMatch", "find_duplicate_invoice"]
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+"""Idempotent request handling for webhook ingestion.
+
+Messaging platforms (WhatsApp/Telegram gateways) retry webhooks. Each retry of
+`/ingest/invoice` or `/ingest/line` used to insert new rows and redo pricing.
+
+A request is identified by:
+- the `Idempotency-Key` header, when the caller sends one, or
+- `<source_channel>:<source_message_id>` from the payload.
+
+The first successful response is stored in `idempotency_record` in the same
+transaction as the ingested rows; retries replay it. Records expire after
+`EMMO_IDEMPOTENCY_TTL_S` and expired rows are purged opportunistically.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.db.models import IdempotencyRecord
+from app.settings import get_settings
+
+# Seconds between opportunistic purges of expired records (per process).
+_PURGE_INTERVAL_S = 300.0
+_last_purge = 0.0
+
+
+def _utcnow() -> datetime:
+    """Naive UTC timestamp (the DateTime columns are timezone-less)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def idempotency_key_for(
+    header_key: str | None,
+    *,
+    source_channel: str | None = None,
+    source_message_id: str | None = None,
+) -> str | None:
+    """Return the idempotency key of a request, or `None` when it has none."""
+    if header_key and header_key.strip():
+        return header_key.strip()[:255]
+    if source_channel and source_message_id:
+        return f"{source_channel}:{source_message_id}"[:255]
+    return None
+
+
+def find_replay(db: Session, *, scope: str, key: str) -> dict | None:
+    """Return the stored response for `(scope, key)` if it has not expired."""
+    if get_settings().idempotency_ttl_s <= 0:
+        return None
+    q = select(IdempotencyRecord.response).where(
+        IdempotencyRecord.scope == scope,
+        IdempotencyRecord.idempotency_key == key,
+        IdempotencyRecord.expires_at > _utcnow(),
+    )
+    return db.scalars(q).first()
+
+
+def remember_response(db: Session, *, scope: str, key: str, response: dict) -> None:
+    """Store a response in the current transaction (replaces an expired record).
+
+    A concurrent delivery that stored the same key first makes the commit fail
+    with `IntegrityError`; callers then replay that delivery's response.
+    """
+    global _last_purge
+    ttl = get_settings().idempotency_ttl_s
+    if ttl <= 0:
+        return
+    now = _utcnow()
+    db.execute(
+        delete(IdempotencyRecord).where(
+            IdempotencyRecord.scope == scope,
+            IdempotencyRecord.idempotency_key == key,
+            IdempotencyRecord.expires_at <= now,
+        )
+    )
+    if time.monotonic() - _last_purge >= _PURGE_INTERVAL_S:
+        _last_purge = time.monotonic()
+        purge_expired(db, now=now)
+    db.add(
+        IdempotencyRecord(
+            scope=scope,
+            idempotency_key=key,
+            response=response,
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+    )
+
+
+def purge_expired(db: Session, *, now: datetime | None = None) -> int:
+    """Delete expired records; returns the number of rows removed."""
+    result = db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= (now or _utcnow())))
+    return int(result.rowcount or 0)
+
+
+__all__ = ["find_replay", "idempotency_key_for", "purge_expired", "remember_response"]
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+"""Diff of an invoice's stored lines against a new OCR parse.
+
+Used by reprocessing (`EMMO_REPROCESS_MODE=diff`) so that one OCR correction
+on a large invoice touches one row instead of deleting and re-pricing all.
+
+Matching:
+1) lines with the same `reference_code` (unique per invoice) are paired;
+2) the remaining stored and incoming lines are paired by position (stored in
+   id order, incoming in parse order), lines with a reference among themselves
+   and lines without one among themselves; this catches a misread reference;
+3) leftovers are `removed` (stored) or `added` (incoming).
+
+A paired line is unchanged when every field in `LINE_FIELDS` is equal. The
+stored `price`/`total_no_iva` may have been corrected by pricing, so `price`
+is compared against the observed (OCR) price and `total_no_iva` is ignored for
+corrected lines. A change in `REPRICE_FIELDS` means the line must be priced
+again (and get a new `PriceObservation`).
+"""
+
+import math
+from dataclasses import dataclass, field
+
+from app.db.models import OcrInfoClothes
+
+LINE_FIELDS = (
+    "cif_supplier",
+    "name_supplier",
+    "num_invoice",
+    "date",
+    "reference_code_raw",
+    "reference_code",
+    "reference_code_origin",
+    "reference_code_suggestion",
+    "description",
+    "quantity",
+    "price",
+    "total_no_iva",
+)
+REPRICE_FIELDS = frozenset({"price", "reference_code"})
+CORRECTED_FLAGS = frozenset({"corrected_to_cost", "corrected_to_reference_median"})
+
+
+@dataclass
+class LineUpdate:
+    """A stored line paired with its incoming version and the fields that differ."""
+    stored: OcrInfoClothes
+    incoming: OcrInfoClothes
+    fields: set[str]
+
+    @property
+    def reprice(self) -> bool:
+        return bool(self.fields & REPRICE_FIELDS)
+
+
+@dataclass
+class LineDiff:
+    unchanged: list[OcrInfoClothes] = field(default_factory=list)
+    updated: list[LineUpdate] = field(default_factory=list)
+    added: list[OcrInfoClothes] = field(default_factory=list)
+    removed: list[OcrInfoClothes] = field(default_factory=list)
+
+    def counts(self) -> dict[str, int]:
+        return {
+            "unchanged": len(self.unchanged),
+            "updated": len(self.updated),
+            "repriced": sum(1 for u in self.updated if u.reprice),
+            "added": len(self.added),
+            "removed": len(self.removed),
+        }
+
+
+def _equal(a: object, b: object) -> bool:
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+def changed_fields(stored: OcrInfoClothes, incoming: OcrInfoClothes, *, observed_price: float | None) -> set[str]:
+    """Fields of `LINE_FIELDS` whose incoming value differs from the stored line."""
+    corrected = stored.price_flag in CORRECTED_FLAGS
+    out: set[str] = set()
+    for name in LINE_FIELDS:
+        old = getattr(stored, name)
+        if name == "price" and observed_price is not None:
+            old = observed_price
+        elif name == "total_no_iva" and corrected:
+            continue
+        if not _equal(old, getattr(incoming, name)):
+            out.add(name)
+    return out
+
+
+def diff_lines(
+    stored: list[OcrInfoClothes],
+    incoming: list[OcrInfoClothes],
+    *,
+    observed_prices: dict[int, float],
+) -> LineDiff:
+    """Pair `stored` (persistent) with `incoming` (transient) lines.
+
+    `observed_prices` maps stored line id to its `PriceObservation.observed_price`.
+    """
+    diff = LineDiff()
+    by_reference = {ln.reference_code: ln for ln in stored if ln.reference_code}
+    pairs: list[tuple[OcrInfoClothes, OcrInfoClothes]] = []
+    unmatched_incoming: list[OcrInfoClothes] = []
+    for line in incoming:
+        match = by_reference.pop(line.reference_code, None) if line.reference_code else None
+        if match is None:
+            unmatched_incoming.append(line)
+        else:
+            pairs.append((match, line))
+
+    matched_ids = {s.id for s, _ in pairs}
+    unmatched_stored = sorted((ln for ln in stored if ln.id not in matched_ids), key=lambda ln: ln.id)
+    for has_reference in (True, False):
+        olds = [ln for ln in unmatched_stored if bool(ln.reference_code) is has_reference]
+        news = [ln for ln in unmatched_incoming if bool(ln.reference_code) is has_reference]
+        pairs.extend(zip(olds, news))
+        diff.removed.extend(olds[len(news):])
+        diff.added.extend(news[len(olds):])
+
+    for old, new in pairs:
+        fields = changed_fields(old, new, observed_price=observed_prices.get(old.id))
+        if fields:
+            diff.updated.append(LineUpdate(stored=old, incoming=new, fields=fields))
+        else:
+            diff.unchanged.append(old)
+    return diff
+
+
+__all__ = [
+    "CORRECTED_FLAGS",
+    "LINE_FIELDS",
+    "LineDiff",
+    "LineUpdate",
+    "REPRICE_FIELDS",
+    "changed_fields",
+    "diff_lines",
+]
@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+"""In-process metrics with Prometheus text exposition.
+
+No client library: counters and histograms write to a per-thread shard (a
+plain dict owned by that thread), so the hot path takes no lock. `/metrics`
+aggregates every shard at scrape time, folding the shards of threads that
+have exited (idle threadpool workers are replaced) into one retired shard.
+
+Each worker process keeps its own registry; scrape every worker (or put the
+workers behind a per-pod scrape target), as with any multi-process Python app.
+
+Metrics:
+- `emmo_http_request_duration_seconds{method,route,status}`
+- `emmo_ocr_duration_seconds{endpoint}`, `emmo_ocr_failures_total{endpoint}`
+- `emmo_storage_write_duration_seconds`, `emmo_storage_write_bytes_total`
+- `emmo_db_statements_total`, `emmo_db_statement_duration_seconds`
+- `emmo_db_statements_per_request`, `emmo_db_time_per_request_seconds`
+- `emmo_price_flags_total{flag}`
+- `emmo_article_upserts_total{source}`
+- `emmo_db_pool_connections{engine,state}` (gauge, read from the pools at scrape time)
+- `emmo_db_statement_cache_total{result}`: compiled-statement cache lookups
+  (`hit`, `miss`; `no_key` for raw SQL, `disabled` with `EMMO_DB_QUERY_CACHE_SIZE=0`)
+
+The same engine hooks feed `RequestDbStats` (per-request statement count and
+DB time, exposed as `X-DB-Queries`/`X-DB-Time` when enabled) and the
+slow-query log.
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS, CACHING_DISABLED, NO_CACHE_KEY, NO_DIALECT_SUPPORT
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Registry:
+    """Metric definitions plus the per-thread value shards."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._local = threading.local()
+        self._shards: list[tuple[threading.Thread, dict]] = []
+        # Totals of the shards whose thread has exited.
+        self._retired: dict = {}
+        self._shards_lock = threading.Lock()
+
+    def shard(self) -> dict:
+        """Return the calling thread's shard (created on first use)."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: dict = {}
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _retire_dead_shards(self) -> list[dict]:
+        """Fold the shards of exited threads into the retired shard; return all shards."""
+        with self._shards_lock:
+            live: list[tuple[threading.Thread, dict]] = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                    continue
+                # The owner is gone, so nothing writes to this shard any more.
+                for key, value in shard.items():
+                    self._retired[key] = self._metrics[key[0]].merge(self._retired.get(key), value)
+            self._shards = live
+            return [self._retired, *(shard for _, shard in live)]
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def collect(self, name: str) -> dict[tuple, object]:
+        """Aggregate the values of one metric across all shards."""
+        metric = self._metrics[name]
+        if isinstance(metric, GaugeFunc):
+            return metric.sample()
+        out: dict[tuple, object] = {}
+        for shard in self._retire_dead_shards():
+            for (metric_name, labels), value in list(shard.items()):
+                if metric_name == name:
+                    out[labels] = metric.merge(out.get(labels), value)
+        return out
+
+    def reset(self) -> None:
+        """Zero every value (tests)."""
+        for shard in self._retire_dead_shards():
+            shard.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines: list[str] = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(self.collect(name).items()):
+                lines.extend(metric.render(dict(zip(metric.labelnames, labels)), value))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _fmt_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), *, registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        registry.register(self)
+
+    def _key(self, labels: dict[str, object]) -> tuple:
+        return self.name, tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def merge(self, acc, value):
+        raise NotImplementedError
+
+    def render(self, labels: dict[str, str], value) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        shard = self._registry.shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return float(self._registry.collect(self.name).get(self._key(labels)[1], 0.0))
+
+    def merge(self, acc, value):
+        return (acc or 0.0) + value
+
+    def render(self, labels: dict[str, str], value) -> list[str]:
+        return [f"{self.name}{_fmt_labels(labels)} {_fmt_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; each cell is `[*bucket_counts, +Inf_count, sum]`."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry=registry)
+
+    def observe(self, value: float, **labels: object) -> None:
+        shard = self._registry.shard()
+        key = self._key(labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: object) -> int:
+        cell = self._registry.collect(self.name).get(self._key(labels)[1])
+        return int(sum(cell[:-1])) if cell else 0
+
+    def merge(self, acc, value):
+        if acc is None:
+            return list(value)
+        return [a + b for a, b in zip(acc, value)]
+
+    def render(self, labels: dict[str, str], value) -> list[str]:
+        lines = []
+        cumulative = 0
+        for upper, n in zip((*self.buckets, math.inf), value[:-1]):
+            cumulative += n
+            le = "+Inf" if math.isinf(upper) else repr(float(upper))
+            lines.append(f"{self.name}_bucket{_fmt_labels({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(value[-1])}")
+        lines.append(f"{self.name}_count{_fmt_labels(labels)} {cumulative}")
+        return lines
+
+
+class GaugeFunc(_Metric):
+    """Gauge whose values come from a callback at scrape time (no shards)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), *, registry: Registry = REGISTRY):
+        self._fn: Callable[[], dict[tuple, float]] | None = None
+        super().__init__(name, help, labelnames, registry=registry)
+
+    def set_function(self, fn: Callable[[], dict[tuple, float]]) -> None:
+        """`fn` returns `{label_values_tuple: value}`."""
+        self._fn = fn
+
+    def sample(self) -> dict[tuple, float]:
+        if self._fn is None:
+            return {}
+        return {tuple(str(v) for v in labels): value for labels, value in self._fn().items()}
+
+    def merge(self, acc, value):
+        return value
+
+    def render(self, labels: dict[str, str], value) -> list[str]:
+        return [f"{self.name}{_fmt_labels(labels)} {_fmt_value(value)}"]
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "emmo_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status")
+)
+OCR_DURATION = Histogram("emmo_ocr_duration_seconds", "OCR provider call latency.", ("endpoint",))
+OCR_FAILURES = Counter("emmo_ocr_failures_total", "Failed OCR provider calls.", ("endpoint",))
+STORAGE_WRITE_DURATION = Histogram("emmo_storage_write_duration_seconds", "Time spent writing uploads to storage.")
+STORAGE_WRITE_BYTES = Counter("emmo_storage_write_bytes_total", "Bytes written to upload storage.")
+DB_STATEMENTS = Counter("emmo_db_statements_total", "SQL statements executed.")
+DB_STATEMENT_DURATION = Histogram("emmo_db_statement_duration_seconds", "SQL statement execution time.")
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    "emmo_db_statements_per_request", "SQL statements per HTTP request.", ("route",), buckets=COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram("emmo_db_time_per_request_seconds", "SQL time per HTTP request.", ("route",))
+PRICE_FLAGS = Counter("emmo_price_flags_total", "Lines flagged by the pricing rules.", ("flag",))
+ARTICLE_UPSERTS = Counter("emmo_article_upserts_total", "Articles created/updated in the master.", ("source",))
+DB_STATEMENT_CACHE = Counter(
+    "emmo_db_statement_cache_total", "Compiled-statement cache lookups per result.", ("result",)
+)
+DB_POOL_CONNECTIONS = GaugeFunc(
+    "emmo_db_pool_connections", "Connections per engine pool and state.", ("engine", "state")
+)
+
+
+@dataclass
+class RequestDbStats:
+    """SQL statements and time accumulated by the current request."""
+    statements: int = 0
+    duration_s: float = 0.0
+
+
+# Set by the metrics middleware; sync endpoints run in a copied context, so
+# they mutate the same object.
+request_db_stats: contextvars.ContextVar[RequestDbStats | None] = contextvars.ContextVar(
+    "request_db_stats", default=None
+)
+
+
+_slow_query_logger = logging.getLogger("app.db.slow_query")
+
+_CACHE_RESULTS = {
+    CACHE_HIT: "hit",
+    CACHE_MISS: "miss",
+    CACHING_DISABLED: "disabled",
+    NO_CACHE_KEY: "no_key",
+    NO_DIALECT_SUPPORT: "unsupported",
+}
+
+
+def redact_parameters(parameters: object) -> object:
+    """Replace bound values by their type name (keeps shape, drops data)."""
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: one redacted row plus the batch size is enough.
+            return {"rows": len(parameters), "first": redact_parameters(parameters[0])}
+        return [type(v).__name__ for v in parameters]
+    return type(parameters).__name__
+
+
+def instrument_engine(engine: Engine, *, slow_query_ms: float = 0.0) -> None:
+    """Count statements/time on `engine` globally and for the current request.
+
+    Statements slower than `slow_query_ms` (0 disables) are logged with their
+    parameters redacted; the log record carries the request id like any other.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_emmo_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["_emmo_query_start"].pop()
+        DB_STATEMENTS.inc()
+        DB_STATEMENT_DURATION.observe(elapsed)
+        if context is not None:
+            DB_STATEMENT_CACHE.inc(result=_CACHE_RESULTS.get(context.cache_hit, "no_key"))
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.duration_s += elapsed
+        if slow_query_ms > 0 and elapsed * 1000 >= slow_query_ms:
+            _slow_query_logger.warning(
+                "slow_query",
+                extra={
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "statement": " ".join(statement.split())[:2000],
+                    "parameters": redact_parameters(parameters),
+                },
+            )
+
+
+__all__ = [
+    "ARTICLE_UPSERTS",
+    "Counter",
+    "DB_POOL_CONNECTIONS",
+    "DB_STATEMENT_CACHE",
+    "DB_STATEMENTS",
+    "DB_STATEMENT_DURATION",
+    "DB_STATEMENTS_PER_REQUEST",
+    "DB_TIME_PER_REQUEST",
+    "HTTP_REQUEST_DURATION",
+    "GaugeFunc",
+    "Histogram",
+    "OCR_DURATION",
+    "OCR_FAILURES",
+    "PRICE_FLAGS",
+    "REGISTRY",
+    "Registry",
+    "RequestDbStats",
+    "STORAGE_WRITE_BYTES",
+    "STORAGE_WRITE_DURATION",
+    "instrument_engine",
+    "redact_parameters",
+    "request_db_stats",
+]
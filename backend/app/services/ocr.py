@@ -3,9 +3,11 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import date
 from typing import Optional
+from urllib.parse import urlsplit
 
 import httpx
 
+from app.services.metrics import OCR_DURATION, OCR_FAILURES
 from app.settings import get_settings
 
 
@@ -41,10 +43,18 @@ class OcrService:
 
     def parse(self, file_bytes: bytes, filename: str) -> tuple[ParsedInvoice, list[ParsedLine]]:
         settings = get_settings()
-        if settings.ocr_api_url:
-            return self._parse_via_http(file_bytes=file_bytes, filename=filename)
-
-        return self._parse_stub(file_bytes=file_bytes, filename=filename)
+        if not settings.ocr_api_url:
+            return self._parse_stub(file_bytes=file_bytes, filename=filename)
+
+        # Host + path only: query strings may carry provider credentials.
+        url = urlsplit(settings.ocr_api_url)
+        endpoint = f"{url.netloc}{url.path}"
+        try:
+            with OCR_DURATION.time(endpoint=endpoint):
+                return self._parse_via_http(file_bytes=file_bytes, filename=filename)
+        except Exception:
+            OCR_FAILURES.inc(endpoint=endpoint)
+            raise
 
     def _parse_stub(self, file_bytes: bytes, filename: str) -> tuple[ParsedInvoice, list[ParsedLine]]:
         raw_text = f"STUB_OCR filename={filename} bytes={len(file_bytes)}"
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+"""Match supplier invoices with the bank payments that settled them.
+
+For one quarter (of the invoice date, as in `supplier_spend`), pairs
+`data_ocr_invoice` rows with outgoing transfers and direct debits from
+`bank_movement`:
+
+- amount: `|importe|` within `EMMO_PAYMENT_MATCH_TOLERANCE_EUR` (plus
+  `EMMO_PAYMENT_MATCH_TOLERANCE_PCT` of the invoice total) of `total_invoice_amount`;
+- date: paid between `EMMO_PAYMENT_MATCH_DAYS_BEFORE` days before and
+  `EMMO_PAYMENT_MATCH_DAYS_AFTER` days after the invoice date;
+- supplier: the movement description contains the CIF or shares a name token
+  with the supplier (legal forms and bank words like "TRANSFERENCIA" ignored).
+
+Candidates come from a sort-merge: invoices and payments are both sorted by
+amount and a sliding window over the payments follows the invoices, so only
+pairs within the tolerance are ever compared (no invoice x payment loop).
+
+Resolution: only the candidates with the best supplier evidence count. An
+invoice left with a single payment is `matched` to it (unless another invoice is
+left with only that payment too); matched payments are then removed from the
+other invoices' candidates and the step repeats. Invoices that still have
+candidates are `ambiguous`; the other invoices, and the payments dated in the
+quarter that are neither matched nor an ambiguous candidate, are `unmatched`.
+
+Invoices are selected through `supplier_spend_invoice`, so invoices stored
+before that table existed are only seen after
+`python -m scripts.rebuild_supplier_spend`.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from itertools import chain
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.db.models import BankAccountMovement, DataOcrInvoice, OcrInfoClothes, SupplierSpendInvoice
+from app.db.partitioning import next_quarter
+from app.settings import get_settings
+
+# Description markers of outgoing payments: transfers and direct debits.
+PAYMENT_KINDS = {"transfer": ("TRANSFERENCIA",), "direct_debit": ("ADEUDO", "RECIBO")}
+_STOPWORDS = frozenset(
+    {
+        "SL", "SLU", "SA", "SAU", "SC", "CB", "SOCIEDAD", "LIMITADA", "ANONIMA", "THE", "AND",
+        "DEL", "LOS", "LAS", "TRANSFERENCIA", "ADEUDO", "RECIBO", "COMPRA", "TARJ", "PAGO", "FRA", "FACTURA",
+    }
+)
+_NON_ALNUM = re.compile(r"[^A-Z0-9]+")
+# Absorbs float error at the tolerance edges (amounts have cents).
+_EPSILON = 1e-6
+
+
+def _fold(value: str | None) -> str:
+    """Uppercase ASCII without accents (`"Añil, S.L."` -> `"ANIL, S.L."`)."""
+    text = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode()
+    return text.upper()
+
+
+def name_tokens(value: str | None) -> frozenset[str]:
+    """Significant tokens of a supplier name or description (3+ chars, no legal forms)."""
+    return frozenset(t for t in _NON_ALNUM.split(_fold(value)) if len(t) >= 3 and t not in _STOPWORDS)
+
+
+def payment_kind(descripcion: str) -> str | None:
+    text = _fold(descripcion)
+    for kind, markers in PAYMENT_KINDS.items():
+        if any(m in text for m in markers):
+            return kind
+    return None
+
+
+@dataclass(frozen=True)
+class InvoiceRef:
+    id: int
+    cif_supplier: str
+    name_supplier: str | None
+    num_invoice: str | None
+    amount: float
+    fecha: date
+
+
+@dataclass(frozen=True)
+class PaymentRef:
+    id: int
+    fecha: date
+    descripcion: str
+    amount: float
+    kind: str
+
+
+@dataclass(frozen=True)
+class Candidate:
+    invoice: InvoiceRef
+    payment: PaymentRef
+    score: int
+    amount_diff: float
+    days: int
+
+
+@dataclass
+class MatchResult:
+    matched: list[Candidate] = field(default_factory=list)
+    ambiguous: list[tuple[InvoiceRef, list[Candidate]]] = field(default_factory=list)
+    unmatched_invoices: list[InvoiceRef] = field(default_factory=list)
+    unmatched_payments: list[PaymentRef] = field(default_factory=list)
+
+
+def _supplier_score(invoice: InvoiceRef, payment_text: str, payment_tokens: frozenset[str]) -> int:
+    """2 when the CIF appears in the description, else the number of shared name tokens."""
+    cif = _NON_ALNUM.sub("", _fold(invoice.cif_supplier))
+    if len(cif) >= 8 and cif in _NON_ALNUM.sub("", payment_text):
+        return 2
+    return len(name_tokens(invoice.name_supplier) & payment_tokens)
+
+
+def find_candidates(invoices: list[InvoiceRef], payments: list[PaymentRef]) -> list[Candidate]:
+    """Invoice/payment pairs passing the amount, date and supplier checks (sort-merge on amount)."""
+    settings = get_settings()
+    tol_eur, tol_pct = settings.payment_match_tolerance_eur, settings.payment_match_tolerance_pct
+    before, after = settings.payment_match_days_before, settings.payment_match_days_after
+
+    invoices = sorted(invoices, key=lambda i: i.amount)
+    payments = sorted(payments, key=lambda p: p.amount)
+    texts = {p.id: _fold(p.descripcion) for p in payments}
+    tokens = {p.id: name_tokens(p.descripcion) for p in payments}
+
+    candidates = []
+    lo = 0
+    for invoice in invoices:
+        tol = tol_eur + invoice.amount * tol_pct / 100 + _EPSILON
+        # Invoices ascend, so payments below this window are below every later window too.
+        while lo < len(payments) and payments[lo].amount < invoice.amount - tol:
+            lo += 1
+        hi = lo
+        while hi < len(payments) and payments[hi].amount <= invoice.amount + tol:
+            payment = payments[hi]
+            hi += 1
+            days = (payment.fecha - invoice.fecha).days
+            if not -before <= days <= after:
+                continue
+            score = _supplier_score(invoice, texts[payment.id], tokens[payment.id])
+            if score:
+                candidates.append(Candidate(invoice, payment, score, round(payment.amount - invoice.amount, 2), days))
+    return candidates
+
+
+def _best(cands: list[Candidate]) -> list[Candidate]:
+    """Keep the candidates with the strongest supplier evidence."""
+    top = max(c.score for c in cands)
+    return [c for c in cands if c.score == top]
+
+
+def resolve(candidates: list[Candidate]) -> tuple[list[Candidate], dict[int, list[Candidate]]]:
+    """Forced pairs (propagated until stable) and the remaining candidates per invoice."""
+    by_invoice: dict[int, list[Candidate]] = defaultdict(list)
+    for c in candidates:
+        by_invoice[c.invoice.id].append(c)
+    matched: list[Candidate] = []
+    taken_payments: set[int] = set()
+    while True:
+        remaining = {
+            inv: _best(live)
+            for inv, cands in by_invoice.items()
+            if (live := [c for c in cands if c.payment.id not in taken_payments])
+        }
+        # Invoices left with a single payment take it, unless another invoice is left with that same one only.
+        forced: dict[int, int] = defaultdict(int)
+        for cands in remaining.values():
+            if len(cands) == 1:
+                forced[cands[0].payment.id] += 1
+        fixed = [cands[0] for cands in remaining.values() if len(cands) == 1 and forced[cands[0].payment.id] == 1]
+        if not fixed:
+            return sorted(matched, key=lambda c: c.invoice.id), remaining
+        matched += fixed
+        taken_payments.update(c.payment.id for c in fixed)
+        for c in fixed:
+            del by_invoice[c.invoice.id]
+
+
+def _invoice_refs(db: Session, year: int, quarter: int) -> list[InvoiceRef]:
+    # Only the quarter's invoices: the line table spans every quarter.
+    first_line = (
+        select(OcrInfoClothes.invoice_id, func.min(OcrInfoClothes.date).label("first_date"))
+        .join(SupplierSpendInvoice, SupplierSpendInvoice.invoice_id == OcrInfoClothes.invoice_id)
+        .where(SupplierSpendInvoice.year == year, SupplierSpendInvoice.quarter == quarter)
+        .group_by(OcrInfoClothes.invoice_id)
+        .subquery()
+    )
+    q = (
+        select(DataOcrInvoice, first_line.c.first_date)
+        .join(SupplierSpendInvoice, SupplierSpendInvoice.invoice_id == DataOcrInvoice.id)
+        .outerjoin(first_line, first_line.c.invoice_id == DataOcrInvoice.id)
+        .where(
+            SupplierSpendInvoice.year == year,
+            SupplierSpendInvoice.quarter == quarter,
+            DataOcrInvoice.total_invoice_amount.is_not(None),
+            DataOcrInvoice.total_invoice_amount > 0,
+        )
+    )
+    return [
+        InvoiceRef(
+            id=inv.id,
+            cif_supplier=inv.cif_supplier,
+            name_supplier=inv.name_supplier,
+            num_invoice=inv.num_invoice,
+            amount=round(inv.total_invoice_amount, 2),
+            fecha=first_date or inv.created_at.date(),
+        )
+        for inv, first_date in db.execute(q)
+    ]
+
+
+def _payment_refs(db: Session, start: date, end: date) -> list[PaymentRef]:
+    markers = [m for kind in PAYMENT_KINDS.values() for m in kind]
+    # LIKE is case-sensitive on Postgres but not on SQLite; compare uppercased on both.
+    descripcion = func.upper(BankAccountMovement.descripcion)
+    q = select(BankAccountMovement).where(
+        BankAccountMovement.fecha >= start,
+        BankAccountMovement.fecha < end,
+        BankAccountMovement.importe < 0,
+        or_(*(descripcion.contains(m) for m in markers)),
+    )
+    refs = []
+    for mv in db.scalars(q):
+        kind = payment_kind(mv.descripcion)
+        if kind is not None:
+            refs.append(PaymentRef(id=mv.id, fecha=mv.fecha, descripcion=mv.descripcion, amount=-mv.importe, kind=kind))
+    return refs
+
+
+def match_quarter(db: Session, *, year: int, quarter: int) -> MatchResult:
+    """Match the quarter's invoices with payments around it; see the module docstring."""
+    settings = get_settings()
+    start = date(year, 3 * (quarter - 1) + 1, 1)
+    end = next_quarter(start)
+    invoices = _invoice_refs(db, year, quarter)
+    payments = _payment_refs(
+        db,
+        start - timedelta(days=settings.payment_match_days_before),
+        end + timedelta(days=settings.payment_match_days_after),
+    )
+    candidates = find_candidates(invoices, payments)
+    matched, remaining = resolve(candidates)
+
+    result = MatchResult(matched=matched)
+    result.ambiguous = [(cands[0].invoice, cands) for _, cands in sorted(remaining.items())]
+    linked_invoices = {c.invoice.id for c in matched} | remaining.keys()
+    linked_payments = {c.payment.id for c in chain(matched, *remaining.values())}
+    result.unmatched_invoices = sorted((i for i in invoices if i.id not in linked_invoices), key=lambda i: i.id)
+    result.unmatched_payments = sorted(
+        (p for p in payments if p.id not in linked_payments and start <= p.fecha < end), key=lambda p: p.id
+    )
+    return result
+
+
+__all__ = [
+    "Candidate",
+    "InvoiceRef",
+    "MatchResult",
+    "PAYMENT_KINDS",
+    "PaymentRef",
+    "find_candidates",
+    "match_quarter",
+    "name_tokens",
+    "payment_kind",
+    "resolve",
+]
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+"""Price observation compaction and monthly rollups.
+
+`price_observation` gains one row per priced line forever, while pricing only
+reads the latest history of one reference. `compact_price_observations()`
+moves rows older than `EMMO_PRICE_HISTORY_DAYS` into
+`price_observation_monthly` (per reference and month: count, min, max, sum and
+a quantile sketch) and deletes them, so the hot table and its indexes stay small.
+
+Quantile sketch: log-spaced buckets (DDSketch style) stored as
+`{"<bucket>": count}`. Any value is estimated within
+`SKETCH_RELATIVE_ACCURACY` (1%) of its true value, and sketches merge by
+adding counts, so months (and raw prices) combine exactly.
+
+`rollup_median()` is the pricing fallback when raw history has fewer than
+`EMMO_PRICE_HISTORY_MIN_SAMPLES` prices.
+
+The job commits one batch at a time, so it can be interrupted and re-run.
+"""
+
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.db.models import PriceObservation, PriceObservationMonthly
+from app.settings import get_settings
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_ZERO_BUCKET = "zero"
+
+
+def _bucket(value: float) -> str:
+    if value <= 0:
+        return _ZERO_BUCKET
+    return str(math.ceil(math.log(value) / _LOG_GAMMA))
+
+
+def _bucket_value(key: str) -> float:
+    if key == _ZERO_BUCKET:
+        return 0.0
+    return 2 * _GAMMA ** int(key) / (_GAMMA + 1)
+
+
+def sketch_add(sketch: dict[str, int], values: Iterable[float]) -> dict[str, int]:
+    """Add `values` to `sketch` (in place); returns it."""
+    for value in values:
+        key = _bucket(float(value))
+        sketch[key] = sketch.get(key, 0) + 1
+    return sketch
+
+
+def sketch_merge(sketch: dict[str, int], other: dict[str, int]) -> dict[str, int]:
+    """Add the counts of `other` into `sketch` (in place); returns it."""
+    for key, n in other.items():
+        sketch[key] = sketch.get(key, 0) + int(n)
+    return sketch
+
+
+def sketch_quantile(sketch: dict[str, int], q: float) -> float | None:
+    """Estimated `q`-quantile (0..1); `None` for an empty sketch."""
+    total = sum(sketch.values())
+    if total == 0:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for key in sorted(sketch, key=_bucket_value):
+        seen += sketch[key]
+        if seen > rank:
+            return _bucket_value(key)
+    return _bucket_value(max(sketch, key=_bucket_value))
+
+
+def _utcnow() -> datetime:
+    """Naive UTC timestamp (the DateTime columns are timezone-less)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _month(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+@dataclass(frozen=True)
+class CompactionResult:
+    """Rows folded into rollups by one `compact_price_observations()` run."""
+    cutoff: datetime
+    observations: int
+    rollups: int
+    batches: int
+
+
+def _fold_batch(db: Session, rows: list) -> set[tuple[str, date]]:
+    groups: dict[tuple[str, date], list[float]] = defaultdict(list)
+    for row in rows:
+        groups[(row.reference_code, _month(row.created_at))].append(float(row.observed_price))
+
+    refs = {ref for ref, _ in groups}
+    q = select(PriceObservationMonthly).where(PriceObservationMonthly.reference_code.in_(refs))
+    existing = {(r.reference_code, r.month): r for r in db.scalars(q)}
+    for (ref, month), prices in groups.items():
+        rollup = existing.get((ref, month))
+        if rollup is None:
+            db.add(
+                PriceObservationMonthly(
+                    reference_code=ref,
+                    month=month,
+                    count=len(prices),
+                    min_price=min(prices),
+                    max_price=max(prices),
+                    sum_price=sum(prices),
+                    sketch=sketch_add({}, prices),
+                )
+            )
+            continue
+        rollup.count += len(prices)
+        rollup.min_price = min(rollup.min_price, *prices)
+        rollup.max_price = max(rollup.max_price, *prices)
+        rollup.sum_price += sum(prices)
+        # New dict so the JSON column is seen as changed.
+        rollup.sketch = sketch_add(dict(rollup.sketch), prices)
+        rollup.updated_at = datetime.now(timezone.utc)
+
+    db.execute(delete(PriceObservation).where(PriceObservation.id.in_([row.id for row in rows])))
+    return set(groups)
+
+
+def compact_price_observations(
+    db: Session,
+    *,
+    older_than_days: int | None = None,
+    batch_size: int = 5000,
+    now: datetime | None = None,
+) -> CompactionResult:
+    """Fold observations older than `older_than_days` into monthly rollups.
+
+    Args:
+        db: Session without an open transaction (each batch commits).
+        older_than_days: Defaults to `EMMO_PRICE_HISTORY_DAYS`.
+        batch_size: Raw rows per transaction.
+        now: Reference time (naive UTC), for tests.
+    """
+    days = get_settings().price_history_days if older_than_days is None else older_than_days
+    cutoff = (now or _utcnow()) - timedelta(days=days)
+    q = (
+        select(
+            PriceObservation.id,
+            PriceObservation.reference_code,
+            PriceObservation.observed_price,
+            PriceObservation.created_at,
+        )
+        .where(PriceObservation.created_at < cutoff)
+        .order_by(PriceObservation.id)
+        .limit(batch_size)
+    )
+
+    observations = batches = 0
+    touched: set[tuple[str, date]] = set()
+    while True:
+        with db.begin():
+            rows = db.execute(q).all()
+            if not rows:
+                break
+            touched |= _fold_batch(db, rows)
+        observations += len(rows)
+        batches += 1
+    return CompactionResult(cutoff=cutoff, observations=observations, rollups=len(touched), batches=batches)
+
+
+def rollup_median(db: Session, reference_code: str, recent: list[float]) -> float | None:
+    """Median of `recent` raw prices plus the reference's latest monthly rollups.
+
+    Uses up to `EMMO_PRICE_ROLLUP_MONTHS` months; `None` when the combined
+    history still has fewer than `EMMO_PRICE_HISTORY_MIN_SAMPLES` prices.
+    """
+    settings = get_settings()
+    q = (
+        select(PriceObservationMonthly.count, PriceObservationMonthly.sketch)
+        .where(PriceObservationMonthly.reference_code == reference_code)
+        .order_by(PriceObservationMonthly.month.desc())
+        .limit(settings.price_rollup_months)
+    )
+    sketch = sketch_add({}, recent)
+    total = len(recent)
+    for count, month_sketch in db.execute(q).all():
+        sketch_merge(sketch, month_sketch)
+        total += count
+    if total < settings.price_history_min_samples:
+        return None
+    return sketch_quantile(sketch, 0.5)
+
+
+__all__ = [
+    "CompactionResult",
+    "SKETCH_RELATIVE_ACCURACY",
+    "compact_price_observations",
+    "rollup_median",
+    "sketch_add",
+    "sketch_merge",
+    "sketch_quantile",
+]
@@ -6,7 +6,9 @@ This module evaluates whether an OCR-extracted line price looks plausible.
 It supports two data sources:
 
 1) Master data (`importacion_articulos_montcau.coste_unitario`) when available.
-2) Historical observations (`price_observation`) as a fallback median per reference.
+2) Historical observations (`price_observation`) as a fallback median per reference;
+   when raw history is sparse (old rows compacted), the monthly rollups in
+   `price_observation_monthly` are merged in (`EMMO_PRICE_ROLLUP_FALLBACK`).
 
 The result is a `PriceDecision` which can either:
 - do nothing,
@@ -16,10 +18,11 @@ The result is a `PriceDecision` which can either:
 
 from dataclasses import dataclass
 
-from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.db.models import ImportacionArticulosMontcau, OcrInfoClothes, PriceObservation
+from app.db.models import ImportacionArticulosMontcau, OcrInfoClothes
+from app.db.statements import recent_prices
+from app.services.price_rollup import rollup_median
 from app.settings import get_settings
 
 
@@ -72,22 +75,20 @@ def evaluate_price(
         )
 
     # 2) Otherwise, fall back to a historical median per reference_code.
-    q = (
-        select(PriceObservation.observed_price)
-        .where(PriceObservation.reference_code == line.reference_code)
-        .order_by(PriceObservation.created_at.desc())
-        .limit(200)
-    )
-    prices = [float(p) for p in db.scalars(q).all() if p is not None]
-    if len(prices) < settings.price_history_min_samples:
-        return PriceDecision(flag=None, reason=None, adjusted_price=None)
-
-    prices_sorted = sorted(prices)
-    mid = len(prices_sorted) // 2
-    if len(prices_sorted) % 2 == 1:
-        median = prices_sorted[mid]
+    prices = recent_prices(db, line.reference_code)
+    if len(prices) >= settings.price_history_min_samples:
+        prices_sorted = sorted(prices)
+        mid = len(prices_sorted) // 2
+        if len(prices_sorted) % 2 == 1:
+            median = prices_sorted[mid]
+        else:
+            median = (prices_sorted[mid - 1] + prices_sorted[mid]) / 2.0
+    elif settings.price_rollup_fallback:
+        median = rollup_median(db, line.reference_code, prices)
+        if median is None:
+            return PriceDecision(flag=None, reason=None, adjusted_price=None)
     else:
-        median = (prices_sorted[mid - 1] + prices_sorted[mid]) / 2.0
+        return PriceDecision(flag=None, reason=None, adjusted_price=None)
 
     floor = median * settings.price_min_ratio
     if line.price >= floor:
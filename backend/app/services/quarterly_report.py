@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+"""Quarterly close report for the gestor, materialized per quarter.
+
+Contents (quarter of the movement date / of the invoice date, as in `supplier_spend`):
+
+- `categories`: bank movements per `identificacion` (the `IDENTIFICAR` taxonomy,
+  set on import): count, income, expenses and net;
+- `suppliers`: invoice count and total per supplier, read from the incrementally
+  maintained `supplier_spend_quarterly`;
+- `merchandise`: supplier invoices vs bank payments classified as
+  "Compra de Mercaderias (CV)".
+
+Materialization (`quarterly_report`): the first request of a quarter computes the
+report and stores it; later requests return the stored payload. Data changes
+call `invalidate_quarters()` in the same transaction (bank CSV import for the
+quarters that received new movements; `refresh_invoice_spend` for the old and new
+quarter of a changed invoice; a new or renamed supplier for its quarters; the
+spend rebuild for all), which bumps the quarter's `version` and drops the
+payload. A report computed concurrently is only stored when `version` is still
+the one read before computing, so it can never hide an invalidation.
+"""
+
+import csv
+import io
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from app.db.models import BankAccountMovement, QuarterlyReport, Supplier, SupplierSpendQuarterly
+from app.db.partitioning import next_quarter
+from app.services.bank_classifier import UNKNOWN
+
+MERCHANDISE = "Compra de Mercaderias (CV)"
+CSV_COLUMNS = ("seccion", "clave", "nombre", "numero", "ingresos", "gastos", "importe")
+
+
+def quarter_of(day: date) -> tuple[int, int]:
+    return day.year, (day.month - 1) // 3 + 1
+
+
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return None
+    return upsert
+
+
+def invalidate_quarters(db: Session, quarters: Iterable[tuple[int, int]]) -> None:
+    """Drop the stored reports of `quarters` (same transaction as the data change)."""
+    now = datetime.now(timezone.utc)
+    keys = sorted(set(quarters))
+    if not keys:
+        return
+    table = QuarterlyReport.__table__
+    upsert = _upsert(db)
+    if upsert is None:
+        for year, quarter in keys:
+            row = db.get(QuarterlyReport, (year, quarter), with_for_update=True)
+            if row is None:
+                db.add(QuarterlyReport(year=year, quarter=quarter, version=1, invalidated_at=now))
+            else:
+                row.version += 1
+                row.payload = None
+                row.generated_at = None
+                row.invalidated_at = now
+        return
+    # The row is created even without a stored report: a report being computed
+    # right now must see the version move.
+    stmt = upsert(table).values([{"year": y, "quarter": q, "version": 1, "invalidated_at": now} for y, q in keys])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["year", "quarter"],
+        set_={"version": table.c.version + 1, "payload": None, "generated_at": None, "invalidated_at": now},
+    )
+    db.execute(stmt)
+
+
+def invalidate_all(db: Session) -> None:
+    """Drop every stored report (after bulk rebuilds)."""
+    now = datetime.now(timezone.utc)
+    db.execute(
+        update(QuarterlyReport).values(
+            version=QuarterlyReport.version + 1, payload=None, generated_at=None, invalidated_at=now
+        )
+    )
+
+
+def _money(value: float | None) -> float:
+    return round(float(value or 0.0), 2)
+
+
+def build_report(db: Session, year: int, quarter: int) -> dict:
+    """Compute the report from stored movements and spend summaries (no caching)."""
+    start = date(year, 3 * (quarter - 1) + 1, 1)
+    end = next_quarter(start)
+    zero = 0.0
+    category = func.coalesce(BankAccountMovement.identificacion, UNKNOWN)
+    q = (
+        select(
+            category,
+            func.count(BankAccountMovement.id),
+            func.sum(case((BankAccountMovement.importe > 0, BankAccountMovement.importe), else_=zero)),
+            func.sum(case((BankAccountMovement.importe < 0, BankAccountMovement.importe), else_=zero)),
+        )
+        .where(BankAccountMovement.fecha >= start, BankAccountMovement.fecha < end)
+        .group_by(category)
+    )
+    categories = [
+        {
+            "identificacion": name,
+            "movements": count,
+            "income": _money(income),
+            "expenses": _money(expenses),
+            "net": _money((income or 0.0) + (expenses or 0.0)),
+        }
+        for name, count, income, expenses in db.execute(q)
+    ]
+    categories.sort(key=lambda c: c["identificacion"])
+
+    q = (
+        select(
+            SupplierSpendQuarterly.cif_supplier,
+            Supplier.name_supplier,
+            SupplierSpendQuarterly.invoice_count,
+            SupplierSpendQuarterly.total_amount,
+        )
+        .outerjoin(Supplier, Supplier.cif_supplier == SupplierSpendQuarterly.cif_supplier)
+        .where(
+            SupplierSpendQuarterly.year == year,
+            SupplierSpendQuarterly.quarter == quarter,
+            SupplierSpendQuarterly.invoice_count > 0,
+        )
+    )
+    suppliers = [
+        {"cif_supplier": cif, "name_supplier": name, "invoice_count": count, "total_amount": _money(total)}
+        for cif, name, count, total in db.execute(q)
+    ]
+    suppliers.sort(key=lambda s: (-s["total_amount"], s["cif_supplier"]))
+
+    invoiced = _money(sum(s["total_amount"] for s in suppliers))
+    paid = _money(-sum(c["net"] for c in categories if c["identificacion"] == MERCHANDISE))
+    return {
+        "year": year,
+        "quarter": quarter,
+        "date_from": start.isoformat(),
+        "date_to": (end - timedelta(days=1)).isoformat(),
+        "categories": categories,
+        "bank_totals": {
+            "movements": sum(c["movements"] for c in categories),
+            "income": _money(sum(c["income"] for c in categories)),
+            "expenses": _money(sum(c["expenses"] for c in categories)),
+            "net": _money(sum(c["net"] for c in categories)),
+        },
+        "suppliers": suppliers,
+        "invoice_totals": {
+            "suppliers": len(suppliers),
+            "invoice_count": sum(s["invoice_count"] for s in suppliers),
+            "total_amount": invoiced,
+        },
+        "merchandise": {"invoiced": invoiced, "paid": paid, "difference": _money(invoiced - paid)},
+    }
+
+
+@dataclass(frozen=True)
+class StoredReport:
+    payload: dict
+    generated_at: datetime
+    cached: bool
+
+
+def cached_report(db: Session, year: int, quarter: int) -> StoredReport | None:
+    """The stored report, if it is still valid (works on a read-only session)."""
+    row = db.get(QuarterlyReport, (year, quarter))
+    if row is None or row.payload is None:
+        return None
+    return StoredReport(row.payload, row.generated_at, cached=True)
+
+
+def materialize_report(db: Session, year: int, quarter: int) -> StoredReport:
+    """Return the stored report or compute and store it (primary session; caller commits)."""
+    row = db.get(QuarterlyReport, (year, quarter), populate_existing=True)
+    if row is not None and row.payload is not None:
+        return StoredReport(row.payload, row.generated_at, cached=True)
+    seen = row.version if row is not None else 0
+    payload = build_report(db, year, quarter)
+    now = datetime.now(timezone.utc)
+    upsert = _upsert(db)
+    if row is not None:
+        # Not stored if the quarter was invalidated while computing.
+        db.execute(
+            update(QuarterlyReport)
+            .where(QuarterlyReport.year == year, QuarterlyReport.quarter == quarter, QuarterlyReport.version == seen)
+            .values(payload=payload, generated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    elif upsert is not None:
+        stmt = upsert(QuarterlyReport.__table__).values(
+            year=year, quarter=quarter, version=0, payload=payload, generated_at=now
+        )
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["year", "quarter"]))
+    else:
+        db.add(QuarterlyReport(year=year, quarter=quarter, version=0, payload=payload, generated_at=now))
+    return StoredReport(payload, now, cached=False)
+
+
+def report_csv(payload: dict) -> str:
+    """`;`-separated CSV with Spanish decimals (`1234,56`), for the gestor's spreadsheet."""
+
+    def amount(value: float | None) -> str:
+        return "" if value is None else f"{value:.2f}".replace(".", ",")
+
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=";", lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+
+    def row(section: str, key: str, name: str | None, count, income=None, expenses=None, total=None) -> None:
+        writer.writerow((section, key, name or "", count, amount(income), amount(expenses), amount(total)))
+
+    for c in payload["categories"]:
+        row("categoria", c["identificacion"], None, c["movements"], c["income"], c["expenses"], c["net"])
+    b = payload["bank_totals"]
+    row("banco", "TOTAL", None, b["movements"], b["income"], b["expenses"], b["net"])
+    for s in payload["suppliers"]:
+        row("proveedor", s["cif_supplier"], s["name_supplier"], s["invoice_count"], total=s["total_amount"])
+    i = payload["invoice_totals"]
+    row("facturas", "TOTAL", None, i["invoice_count"], total=i["total_amount"])
+    for key, value in payload["merchandise"].items():
+        row("mercaderias", key, MERCHANDISE, "", total=value)
+    return out.getvalue()
+
+
+__all__ = [
+    "CSV_COLUMNS",
+    "MERCHANDISE",
+    "StoredReport",
+    "build_report",
+    "cached_report",
+    "invalidate_all",
+    "invalidate_quarters",
+    "materialize_report",
+    "quarter_of",
+    "report_csv",
+]
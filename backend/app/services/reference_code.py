@@ -8,16 +8,23 @@ article master. This module provides:
 - `generate_reference_code`: deterministic fallback when OCR doesn't provide one.
 - `normalize_reference_code`: canonicalize to `<SUP>_<CODE>` to avoid collisions
     across suppliers.
+- `normalize_reference_codes`: batch variant for all lines of an invoice.
+
+Prefix derivation and the canonical-pattern regex are memoized; callers that
+know the supplier (see `services/suppliers`) pass the registered `prefix`
+directly so normalization is a dictionary lookup plus a string format.
 """
 
 import base64
 import hashlib
 import re
-from typing import Optional
+from functools import lru_cache
+from typing import Iterable, Optional
 
 from app.settings import get_settings
 
 
+@lru_cache(maxsize=4096)
 def _supplier_prefix(name_supplier: str | None, prefix_len: int) -> str:
     """Derive a stable uppercase prefix from supplier name."""
     if not name_supplier:
@@ -26,6 +33,12 @@ def _supplier_prefix(name_supplier: str | None, prefix_len: int) -> str:
     return (cleaned[:prefix_len] or "SUP").ljust(prefix_len, "X")
 
 
+@lru_cache(maxsize=16)
+def _canonical_pattern(prefix_len: int) -> re.Pattern[str]:
+    """Compiled `<SUP>_<CODE>` matcher for a given prefix length."""
+    return re.compile(r"[A-Z]{%d}_.+" % prefix_len)
+
+
 def _hash64(value: str, length: int) -> str:
     """Compute a URL-safe base64 sha256 hash, truncated to `length`."""
     digest = hashlib.sha256(value.encode("utf-8")).digest()
@@ -38,17 +51,20 @@ def generate_reference_code(
     name_supplier: str | None,
     description: str | None,
     num_invoice: str | None,
+    prefix: str | None = None,
 ) -> Optional[str]:
     """Generate a deterministic reference code for human review.
 
     This is a fallback when OCR fails to provide a supplier reference.
     The output is stable for the same (supplier, description, invoice number).
+    `prefix` overrides the name-derived supplier prefix (registered suppliers).
     """
     if not description and not num_invoice:
         return None
 
     settings = get_settings()
-    prefix = _supplier_prefix(name_supplier, settings.reference_code_prefix_len)
+    if prefix is None:
+        prefix = _supplier_prefix(name_supplier, settings.reference_code_prefix_len)
     seed = "|".join([name_supplier or "", description or "", num_invoice or ""]).strip()
     if not seed:
         return None
@@ -56,11 +72,17 @@ def generate_reference_code(
     return f"{prefix}_{hashed}"
 
 
-def normalize_reference_code(*, name_supplier: str | None, reference_code: str | None) -> Optional[str]:
+def normalize_reference_code(
+    *,
+    name_supplier: str | None,
+    reference_code: str | None,
+    prefix: str | None = None,
+) -> Optional[str]:
     """Return canonical reference code.
 
-    Rule: always store as <SUP>_<CODE> where SUP is derived from supplier name.
-    If reference_code already matches that pattern, it is returned unchanged.
+    Rule: always store as <SUP>_<CODE> where SUP is derived from supplier name
+    (or given as `prefix`). If reference_code already matches that pattern, it
+    is returned unchanged.
     """
 
     if reference_code is None:
@@ -69,10 +91,35 @@ def normalize_reference_code(*, name_supplier: str | None, reference_code: str |
     if not raw:
         return None
 
-    settings = get_settings()
-    prefix = _supplier_prefix(name_supplier, settings.reference_code_prefix_len)
+    prefix_len = get_settings().reference_code_prefix_len
     # Already canonical? Keep it.
-    if re.fullmatch(r"[A-Z]{%d}_.+" % settings.reference_code_prefix_len, raw):
+    if _canonical_pattern(prefix_len).fullmatch(raw):
         return raw
+    if prefix is None:
+        prefix = _supplier_prefix(name_supplier, prefix_len)
     return f"{prefix}_{raw}"
 
+
+def normalize_reference_codes(
+    reference_codes: Iterable[str | None],
+    *,
+    name_supplier: str | None,
+    prefix: str | None = None,
+) -> list[Optional[str]]:
+    """Normalize every reference of one invoice (same supplier) in a single pass."""
+    prefix_len = get_settings().reference_code_prefix_len
+    pattern = _canonical_pattern(prefix_len)
+    if prefix is None:
+        prefix = _supplier_prefix(name_supplier, prefix_len)
+
+    out: list[Optional[str]] = []
+    for reference_code in reference_codes:
+        raw = reference_code.strip() if reference_code is not None else ""
+        if not raw:
+            out.append(None)
+        elif pattern.fullmatch(raw):
+            out.append(raw)
+        else:
+            out.append(f"{prefix}_{raw}")
+    return out
+
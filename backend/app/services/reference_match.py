@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+"""Fuzzy matching of OCR reference codes against the article master.
+
+OCR frequently garbles supplier references (`O`/`0`, `I`/`1`, dropped dashes),
+so an exact `reference_code ==` lookup misses the existing
+`importacion_articulos_montcau` row and a duplicate article is created.
+
+This module keeps a warm, in-process index over the master references:
+
+- Every reference is folded to a match key (uppercase, alphanumerics only,
+  common OCR confusables collapsed). Folded-key hits are dictionary lookups.
+- Remaining candidates come from a BK-tree per supplier prefix, queried with a
+  bounded Levenshtein distance.
+
+The index is rebuilt lazily when the bound engine changes or when it is older
+than `EMMO_REFERENCE_MATCH_INDEX_TTL_S` (other workers may have added articles).
+References created by a request are added once its transaction commits.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.models import ImportacionArticulosMontcau
+from app.db.session import call_after_commit, database_key, transaction_info
+from app.settings import get_settings
+
+# Characters OCR engines commonly confuse, folded onto a single representative.
+_CONFUSABLES = str.maketrans({"O": "0", "Q": "0", "D": "0", "I": "1", "L": "1", "Z": "2", "S": "5", "B": "8"})
+
+
+def fold_reference(value: str) -> str:
+    """Return the match key of a reference code (case/punctuation/confusable-insensitive)."""
+    return "".join(ch for ch in value.upper() if ch.isalnum()).translate(_CONFUSABLES)
+
+
+def _split_prefix(reference_code: str) -> tuple[str, str]:
+    """Split a canonical `<SUP>_<CODE>` into (prefix, code); non-canonical codes get an empty prefix."""
+    prefix, sep, code = reference_code.partition("_")
+    if not sep:
+        return "", reference_code
+    return prefix.upper(), code
+
+
+def levenshtein(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance between `a` and `b`, capped at `max_distance + 1`.
+
+    The computation stops as soon as every cell of a row exceeds the cap, which
+    keeps BK-tree queries cheap for far-away keys.
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, start=1):
+            cost = previous[j - 1] + (ca != cb)
+            insert = current[j - 1] + 1
+            delete = previous[j] + 1
+            value = min(cost, insert, delete)
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+class BKTree:
+    """Burkhard-Keller tree over folded keys using Levenshtein distance."""
+
+    def __init__(self) -> None:
+        self._root: tuple[str, dict[int, tuple]] | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: str) -> None:
+        if self._root is None:
+            self._root = (key, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            # Distances are uncapped here: the tree invariant needs the exact value.
+            d = levenshtein(key, node[0], max(len(key), len(node[0])))
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (key, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, key: str, max_distance: int) -> list[tuple[int, str]]:
+        """Return `(distance, key)` pairs within `max_distance`, closest first."""
+        if self._root is None:
+            return []
+        out: list[tuple[int, str]] = []
+        stack = [self._root]
+        while stack:
+            node_key, children = stack.pop()
+            d = levenshtein(key, node_key, max_distance + max(len(key), len(node_key)))
+            if d <= max_distance:
+                out.append((d, node_key))
+            low, high = d - max_distance, d + max_distance
+            for child_d, child in children.items():
+                if low <= child_d <= high:
+                    stack.append(child)
+        out.sort()
+        return out
+
+
+@dataclass(frozen=True)
+class ReferenceCandidate:
+    """A master reference that fuzzily matches a queried reference."""
+    reference_code: str
+    distance: int
+
+
+class ReferenceIndex:
+    """In-process fuzzy index over article master references."""
+
+    def __init__(self) -> None:
+        self._by_key: dict[str, set[str]] = {}
+        self._trees: dict[str, BKTree] = {}
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return sum(len(refs) for refs in self._by_key.values())
+
+    def __contains__(self, reference_code: str) -> bool:
+        prefix, code = _split_prefix(reference_code)
+        return reference_code in self._by_key.get(f"{prefix}_{fold_reference(code)}", ())
+
+    def add(self, reference_code: str) -> None:
+        prefix, code = _split_prefix(reference_code)
+        key = fold_reference(code)
+        if not key:
+            return
+        full_key = f"{prefix}_{key}"
+        with self._lock:
+            refs = self._by_key.setdefault(full_key, set())
+            if not refs:
+                self._trees.setdefault(prefix, BKTree()).add(key)
+            refs.add(reference_code)
+
+    def candidates(self, reference_code: str, *, max_distance: int, limit: int = 5) -> list[ReferenceCandidate]:
+        """Return master references close to `reference_code` (same supplier prefix only)."""
+        prefix, code = _split_prefix(reference_code)
+        key = fold_reference(code)
+        if not key:
+            return []
+
+        if max_distance <= 0:
+            # Folded-key hit only: a plain dictionary lookup.
+            hits = [(0, key)] if f"{prefix}_{key}" in self._by_key else []
+        else:
+            tree = self._trees.get(prefix)
+            hits = tree.search(key, max_distance) if tree is not None else []
+
+        out: list[ReferenceCandidate] = []
+        for distance, hit_key in hits:
+            for ref in sorted(self._by_key.get(f"{prefix}_{hit_key}", ())):
+                if ref == reference_code:
+                    continue
+                out.append(ReferenceCandidate(reference_code=ref, distance=distance))
+                if len(out) >= limit:
+                    return out
+        return out
+
+
+_index: ReferenceIndex | None = None
+_index_bind: object | None = None
+_index_lock = threading.Lock()
+
+# `transaction_info` key of the references created but not yet committed.
+_PENDING = "reference_index_pending"
+
+
+def get_reference_index(db: Session) -> ReferenceIndex:
+    """Return the warm index for the session's engine, building it when missing or stale."""
+    global _index, _index_bind
+    bind = database_key(db)
+    ttl = get_settings().reference_match_index_ttl_s
+    index = _index
+    if index is not None and _index_bind == bind and (ttl <= 0 or time.monotonic() - index.built_at < ttl):
+        return index
+
+    with _index_lock:
+        index = ReferenceIndex()
+        # Articles this transaction created are not committed yet; they are added on commit.
+        pending = transaction_info(db).get(_PENDING, ())
+        for ref in db.scalars(select(ImportacionArticulosMontcau.reference_code)):
+            if ref and ref not in pending:
+                index.add(ref)
+        _index, _index_bind = index, bind
+    return index
+
+
+def _publish(bind: object, reference_codes: set[str]) -> None:
+    index = _index
+    if index is not None and _index_bind == bind:
+        for reference_code in reference_codes:
+            index.add(reference_code)
+
+
+def register_reference(db: Session, reference_code: str | None) -> None:
+    """Add a newly created master reference to the warm index once `db` commits."""
+    if not reference_code:
+        return
+    info = transaction_info(db)
+    pending = info.get(_PENDING)
+    if pending is None:
+        pending = info[_PENDING] = set()
+        bind = database_key(db)
+        call_after_commit(db, lambda: _publish(bind, pending))
+    pending.add(reference_code)
+
+
+def reset_reference_index() -> None:
+    """Drop the warm index (it is rebuilt on next use)."""
+    global _index, _index_bind
+    with _index_lock:
+        _index, _index_bind = None, None
+
+
+def find_reference_candidates(db: Session, reference_code: str, *, limit: int = 5) -> list[ReferenceCandidate]:
+    """Return master references within `EMMO_REFERENCE_MATCH_MAX_DISTANCE` of `reference_code`."""
+    settings = get_settings()
+    return get_reference_index(db).candidates(
+        reference_code, max_distance=settings.reference_match_max_distance, limit=limit
+    )
+
+
+__all__ = [
+    "BKTree",
+    "ReferenceCandidate",
+    "ReferenceIndex",
+    "find_reference_candidates",
+    "fold_reference",
+    "get_reference_index",
+    "levenshtein",
+    "register_reference",
+    "reset_reference_index",
+]
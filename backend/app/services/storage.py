@@ -16,6 +16,7 @@ from datetime import date, datetime, timezone
 from pathlib import Path
 from uuid import uuid4
 
+from app.services.metrics import STORAGE_WRITE_BYTES, STORAGE_WRITE_DURATION
 from app.settings import get_settings
 
 
@@ -62,6 +63,8 @@ def save_invoice_upload(
     relative_path = Path("invoices") / str(year) / quarter / f"{file_id}{ext}"
     absolute_path = Path(settings.storage_root) / relative_path
     absolute_path.parent.mkdir(parents=True, exist_ok=True)
-    absolute_path.write_bytes(file_bytes)
+    with STORAGE_WRITE_DURATION.time():
+        absolute_path.write_bytes(file_bytes)
+    STORAGE_WRITE_BYTES.inc(len(file_bytes))
 
     return str(relative_path)
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+"""Supplier spend summaries per quarter, maintained incrementally.
+
+`supplier_spend_quarterly` answers "how much did we buy from supplier X this
+quarter" without scanning invoices and lines:
+`(cif_supplier, year, quarter) -> invoice_count, total_amount, line_count, units, flagged_lines`.
+
+How it stays current:
+- `supplier_spend_invoice` stores what each invoice currently contributes;
+- every route that changes an invoice (ingest, upload, reprocess, manual lines,
+  status) calls `refresh_invoice_spend()` inside its transaction, which recomputes
+  that invoice's contribution (one aggregate over its lines), subtracts the stored
+  one and adds the new one, so only the touched summary rows change;
+- summary rows are updated with `INSERT ... ON CONFLICT DO UPDATE SET x = x + delta`,
+  so concurrent invoices of the same supplier/quarter never lose an increment.
+
+Quarter: that of the invoice date (earliest line `date`), else the ingestion
+date (`created_at`). Invoices in `EXCLUDED_STATUSES` (linked duplicates) add nothing.
+
+`rebuild_supplier_spend()` (`python -m scripts.rebuild_supplier_spend`) recomputes
+both tables from scratch, e.g. after a bulk import or a schema change.
+
+Every change also invalidates the stored quarterly reports of the quarters it
+touches (`services/quarterly_report`).
+"""
+
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timezone
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.db.models import DataOcrInvoice, OcrInfoClothes, SupplierSpendInvoice, SupplierSpendQuarterly
+from app.db.partitioning import line_partition_filter
+from app.services.quarterly_report import invalidate_all, invalidate_quarters
+
+EXCLUDED_STATUSES = frozenset({"duplicate"})
+_MEASURES = ("total_amount", "line_count", "units", "flagged_lines")
+_KEY = ("cif_supplier", "year", "quarter")
+
+
+@dataclass(frozen=True)
+class Contribution:
+    """One invoice's share of a `(cif_supplier, year, quarter)` summary row."""
+    cif_supplier: str
+    year: int
+    quarter: int
+    total_amount: float
+    line_count: int
+    units: int
+    flagged_lines: int
+
+
+def _contribution(
+    *,
+    cif_supplier: str,
+    total_amount: float | None,
+    created_at: datetime | None,
+    first_line_date: date | None,
+    line_count: int | None,
+    units: int | None,
+    flagged_lines: int | None,
+) -> Contribution:
+    day = first_line_date or (created_at or datetime.now(timezone.utc)).date()
+    return Contribution(
+        cif_supplier=cif_supplier,
+        year=day.year,
+        quarter=(day.month - 1) // 3 + 1,
+        total_amount=float(total_amount or 0.0),
+        line_count=int(line_count or 0),
+        units=int(units or 0),
+        flagged_lines=int(flagged_lines or 0),
+    )
+
+
+def _line_aggregates(*where):
+    return select(
+        func.count(OcrInfoClothes.id),
+        func.sum(OcrInfoClothes.quantity),
+        func.count(OcrInfoClothes.price_flag),
+        func.min(OcrInfoClothes.date),
+    ).where(*where)
+
+
+def invoice_contribution(db: Session, invoice: DataOcrInvoice) -> Contribution | None:
+    """Current contribution of `invoice` (flushed state); `None` when excluded."""
+    if invoice.status in EXCLUDED_STATUSES:
+        return None
+    q = _line_aggregates(OcrInfoClothes.invoice_id == invoice.id, *line_partition_filter(invoice))
+    line_count, units, flagged, first_date = db.execute(q).one()
+    return _contribution(
+        cif_supplier=invoice.cif_supplier,
+        total_amount=invoice.total_invoice_amount,
+        created_at=invoice.created_at,
+        first_line_date=first_date,
+        line_count=line_count,
+        units=units,
+        flagged_lines=flagged,
+    )
+
+
+def _apply(db: Session, c: Contribution, sign: int) -> None:
+    table = SupplierSpendQuarterly.__table__
+    values = {
+        **{k: getattr(c, k) for k in _KEY},
+        "invoice_count": sign,
+        **{m: sign * getattr(c, m) for m in _MEASURES},
+        "updated_at": datetime.now(timezone.utc),
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        row = db.scalars(
+            select(SupplierSpendQuarterly).filter_by(**{k: values[k] for k in _KEY}).with_for_update()
+        ).first()
+        if row is None:
+            db.add(SupplierSpendQuarterly(**values))
+        else:
+            for col in ("invoice_count", *_MEASURES):
+                setattr(row, col, getattr(row, col) + values[col])
+            row.updated_at = values["updated_at"]
+        return
+
+    stmt = upsert(table).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(_KEY),
+        set_={
+            **{col: table.c[col] + stmt.excluded[col] for col in ("invoice_count", *_MEASURES)},
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.execute(stmt)
+
+
+def refresh_invoice_spend(db: Session, invoice: DataOcrInvoice) -> None:
+    """Bring the summaries in line with `invoice`'s current state (same transaction).
+
+    Flushes pending changes first; a no-op when the contribution did not change.
+    """
+    db.flush()
+    new = invoice_contribution(db, invoice)
+    stored = db.get(SupplierSpendInvoice, invoice.id)
+    old = None
+    if stored is not None:
+        old = Contribution(**{f: getattr(stored, f) for f in (*_KEY, *_MEASURES)})
+    if old == new:
+        return
+    invalidate_quarters(db, [(c.year, c.quarter) for c in (old, new) if c is not None])
+    if old is not None:
+        _apply(db, old, -1)
+    if new is None:
+        db.delete(stored)
+        return
+    _apply(db, new, 1)
+    if stored is None:
+        db.add(SupplierSpendInvoice(invoice_id=invoice.id, **asdict(new)))
+    else:
+        for field, value in asdict(new).items():
+            setattr(stored, field, value)
+
+
+def rebuild_supplier_spend(db: Session, *, batch_size: int = 5000) -> dict[str, int]:
+    """Recompute both summary tables from invoices and lines (caller commits)."""
+    lines = (
+        _line_aggregates()
+        .add_columns(OcrInfoClothes.invoice_id)
+        .group_by(OcrInfoClothes.invoice_id)
+        .subquery()
+    )
+    count_col, units_col, flagged_col, first_date_col, invoice_id_col = lines.c
+    q = (
+        select(
+            DataOcrInvoice.id,
+            DataOcrInvoice.cif_supplier,
+            DataOcrInvoice.total_invoice_amount,
+            DataOcrInvoice.created_at,
+            count_col,
+            units_col,
+            flagged_col,
+            first_date_col,
+        )
+        .outerjoin(lines, invoice_id_col == DataOcrInvoice.id)
+        .where(DataOcrInvoice.status.not_in(EXCLUDED_STATUSES))
+    )
+
+    db.execute(delete(SupplierSpendInvoice))
+    db.execute(delete(SupplierSpendQuarterly))
+    invalidate_all(db)
+    totals: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(("invoice_count", *_MEASURES), 0))
+    ledger: list[dict] = []
+    for invoice_id, cif, amount, created_at, line_count, units, flagged, first_date in db.execute(q):
+        c = _contribution(
+            cif_supplier=cif,
+            total_amount=amount,
+            created_at=created_at,
+            first_line_date=first_date,
+            line_count=line_count,
+            units=units,
+            flagged_lines=flagged,
+        )
+        total = totals[(c.cif_supplier, c.year, c.quarter)]
+        total["invoice_count"] += 1
+        for m in _MEASURES:
+            total[m] += getattr(c, m)
+        ledger.append({"invoice_id": invoice_id, **asdict(c)})
+        if len(ledger) >= batch_size:
+            db.execute(insert(SupplierSpendInvoice), ledger)
+            ledger = []
+    if ledger:
+        db.execute(insert(SupplierSpendInvoice), ledger)
+    rows = [dict(zip(_KEY, key), **values) for key, values in totals.items()]
+    if rows:
+        db.execute(insert(SupplierSpendQuarterly), rows)
+    return {"invoices": sum(int(v["invoice_count"]) for v in totals.values()), "summaries": len(rows)}
+
+
+__all__ = [
+    "Contribution",
+    "EXCLUDED_STATUSES",
+    "invoice_contribution",
+    "rebuild_supplier_spend",
+    "refresh_invoice_spend",
+]
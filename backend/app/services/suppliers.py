@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+"""Supplier registry (CIF -> canonical reference prefix).
+
+The `supplier` table pins the reference-code prefix of each supplier, plus the
+name variants seen on invoices and per-supplier settings. A warm in-process map
+mirrors the table so per-line normalization is a dictionary lookup:
+
+- `resolve_supplier_prefix`: prefix for a (CIF, name) pair; registers unknown
+  suppliers on first sight.
+- `normalize_invoice_references`: batch normalization for a whole invoice.
+
+The map is loaded lazily per engine and reloaded after
+`EMMO_SUPPLIER_REGISTRY_TTL_S` (like `services/reference_match`), so changes
+made by other workers show up. Writes made through this module are staged on
+the session and published to the map only when their transaction commits.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import Supplier, SupplierSpendQuarterly
+from app.db.session import call_after_commit, database_key, transaction_info
+from app.services.quarterly_report import invalidate_quarters
+from app.services.reference_code import _supplier_prefix, normalize_reference_codes
+from app.settings import get_settings
+
+# CIF placeholder used by the stub OCR; never registered.
+UNKNOWN_CIF = "UNKNOWN"
+
+
+@dataclass(frozen=True)
+class SupplierEntry:
+    """Warm-map snapshot of a `supplier` row."""
+    cif_supplier: str
+    canonical_prefix: str | None
+    name_supplier: str | None = None
+    name_variants: frozenset[str] = field(default_factory=frozenset)
+    settings: dict = field(default_factory=dict)
+
+
+def _entry(row: Supplier) -> SupplierEntry:
+    return SupplierEntry(
+        cif_supplier=row.cif_supplier,
+        canonical_prefix=row.canonical_prefix,
+        name_supplier=row.name_supplier,
+        name_variants=frozenset(row.name_variants or ()),
+        settings=dict(row.settings or {}),
+    )
+
+
+_registry: dict[str, SupplierEntry] | None = None
+_registry_bind: object | None = None
+_registry_built_at = 0.0
+_registry_lock = threading.Lock()
+
+# `transaction_info` key of the entries written but not yet committed.
+_PENDING = "supplier_registry_pending"
+
+
+def get_supplier_registry(db: Session) -> dict[str, SupplierEntry]:
+    """Return the warm CIF -> `SupplierEntry` map for the session's engine, reloading it when stale."""
+    global _registry, _registry_bind, _registry_built_at
+    bind = database_key(db)
+    ttl = get_settings().supplier_registry_ttl_s
+    registry = _registry
+    if registry is not None and _registry_bind == bind and (ttl <= 0 or time.monotonic() - _registry_built_at < ttl):
+        return registry
+
+    with _registry_lock:
+        registry = {row.cif_supplier: _entry(row) for row in db.scalars(select(Supplier))}
+        # Rows this transaction wrote are not committed yet; they are published on commit.
+        for cif_supplier in transaction_info(db).get(_PENDING, ()):
+            registry.pop(cif_supplier, None)
+        _registry, _registry_bind, _registry_built_at = registry, bind, time.monotonic()
+    return registry
+
+
+def reset_supplier_registry() -> None:
+    """Drop the warm map (it is reloaded on next use)."""
+    global _registry, _registry_bind
+    with _registry_lock:
+        _registry, _registry_bind = None, None
+
+
+def _publish(bind: object, entries: dict[str, SupplierEntry]) -> None:
+    registry = _registry
+    if registry is not None and _registry_bind == bind:
+        registry.update(entries)
+
+
+def _stage(db: Session, entry: SupplierEntry) -> None:
+    """Make `entry` visible to this transaction now and to the warm map once it commits."""
+    info = transaction_info(db)
+    pending = info.get(_PENDING)
+    if pending is None:
+        pending = info[_PENDING] = {}
+        bind = database_key(db)
+        call_after_commit(db, lambda: _publish(bind, pending))
+    pending[entry.cif_supplier] = entry
+
+
+def _invalidate_reports(db: Session, cif_supplier: str) -> None:
+    """Drop the stored quarterly reports that show this supplier's name."""
+    q = select(SupplierSpendQuarterly.year, SupplierSpendQuarterly.quarter).where(
+        SupplierSpendQuarterly.cif_supplier == cif_supplier
+    )
+    invalidate_quarters(db, [(year, quarter) for year, quarter in db.execute(q)])
+
+
+def _name_prefix(name_supplier: str | None) -> str | None:
+    """Prefix to pin for a supplier name; `None` until a name is known."""
+    if not name_supplier:
+        return None
+    return _supplier_prefix(name_supplier, get_settings().reference_code_prefix_len)
+
+
+def _register(db: Session, *, cif_supplier: str, name_supplier: str | None) -> SupplierEntry:
+    """Insert a new supplier row (savepoint-protected against concurrent inserts)."""
+    row = Supplier(
+        cif_supplier=cif_supplier,
+        name_supplier=name_supplier,
+        canonical_prefix=_name_prefix(name_supplier),
+        name_variants=[name_supplier] if name_supplier else [],
+        settings={},
+    )
+    try:
+        with db.begin_nested():
+            db.add(row)
+    except IntegrityError:
+        # Another worker registered it first; use theirs.
+        row = db.get(Supplier, cif_supplier)  # type: ignore[assignment]
+    else:
+        _invalidate_reports(db, cif_supplier)
+    return _entry(row)
+
+
+def _add_variant(db: Session, entry: SupplierEntry, name_supplier: str) -> SupplierEntry:
+    """Remember a new spelling of the supplier name (re-registering a row that is gone).
+
+    A supplier first seen without a name gets its prefix pinned from this one.
+    """
+    row = db.get(Supplier, entry.cif_supplier)
+    if row is None:
+        return _register(db, cif_supplier=entry.cif_supplier, name_supplier=name_supplier)
+    if row.canonical_prefix is None:
+        row.canonical_prefix = _name_prefix(name_supplier)
+    if row.name_supplier is None:
+        row.name_supplier = name_supplier
+        _invalidate_reports(db, row.cif_supplier)
+    row.name_variants = sorted(set(row.name_variants or ()) | {name_supplier})
+    return _entry(row)
+
+
+def resolve_supplier(db: Session, *, cif_supplier: str | None, name_supplier: str | None) -> SupplierEntry | None:
+    """Return the registry entry for a CIF, registering it on first sight.
+
+    Returns `None` when the CIF is missing or the stub OCR placeholder.
+    """
+    if not cif_supplier or cif_supplier == UNKNOWN_CIF:
+        return None
+    registry = get_supplier_registry(db)
+    entry = transaction_info(db).get(_PENDING, {}).get(cif_supplier) or registry.get(cif_supplier)
+    if entry is None:
+        entry = _register(db, cif_supplier=cif_supplier, name_supplier=name_supplier)
+    elif name_supplier and (entry.canonical_prefix is None or name_supplier not in entry.name_variants):
+        entry = _add_variant(db, entry, name_supplier)
+    else:
+        return entry
+    _stage(db, entry)
+    return entry
+
+
+def resolve_supplier_prefix(db: Session, *, cif_supplier: str | None, name_supplier: str | None) -> str:
+    """Return the canonical reference prefix for a supplier.
+
+    Registered suppliers use their pinned prefix; otherwise (including suppliers
+    registered before any name was seen) it is derived from the supplier name
+    (same rule as `reference_code._supplier_prefix`).
+    """
+    entry = resolve_supplier(db, cif_supplier=cif_supplier, name_supplier=name_supplier)
+    if entry is not None and entry.canonical_prefix is not None:
+        return entry.canonical_prefix
+    return _supplier_prefix(name_supplier, get_settings().reference_code_prefix_len)
+
+
+def normalize_invoice_references(
+    db: Session,
+    *,
+    cif_supplier: str | None,
+    name_supplier: str | None,
+    reference_codes: list[str | None],
+) -> list[str | None]:
+    """Normalize all references of one invoice with a single supplier lookup."""
+    prefix = resolve_supplier_prefix(db, cif_supplier=cif_supplier, name_supplier=name_supplier)
+    return normalize_reference_codes(reference_codes, name_supplier=name_supplier, prefix=prefix)
+
+
+def upsert_supplier(
+    db: Session,
+    *,
+    cif_supplier: str,
+    name_supplier: str | None,
+    canonical_prefix: str | None,
+    name_variants: list[str] | None,
+    settings: dict | None,
+) -> Supplier:
+    """Create or update a supplier row and refresh its warm-map entry.
+
+    Changing `canonical_prefix` only affects references normalized afterwards;
+    stored `reference_code` values are not rewritten. A new or renamed supplier
+    invalidates the stored quarterly reports that list it.
+    """
+    row = db.get(Supplier, cif_supplier)
+    renamed = row is None or (name_supplier is not None and name_supplier != row.name_supplier)
+    if row is None:
+        row = Supplier(cif_supplier=cif_supplier, canonical_prefix=canonical_prefix or _name_prefix(name_supplier))
+        db.add(row)
+    elif canonical_prefix:
+        row.canonical_prefix = canonical_prefix
+    elif row.canonical_prefix is None:
+        row.canonical_prefix = _name_prefix(name_supplier)
+    if name_supplier is not None:
+        row.name_supplier = name_supplier
+    variants = set(row.name_variants or ()) | set(name_variants or ())
+    if name_supplier:
+        variants.add(name_supplier)
+    row.name_variants = sorted(variants)
+    if settings is not None:
+        row.settings = settings
+    db.flush()
+    if renamed:
+        _invalidate_reports(db, cif_supplier)
+    _stage(db, _entry(row))
+    return row
+
+
+__all__ = [
+    "SupplierEntry",
+    "get_supplier_registry",
+    "normalize_invoice_references",
+    "reset_supplier_registry",
+    "resolve_supplier",
+    "resolve_supplier_prefix",
+    "upsert_supplier",
+]
@@ -24,11 +24,89 @@ class Settings(BaseSettings):
     # Pool settings apply to non-SQLite URLs.
     db_pool_size: int = 5
     db_max_overflow: int = 10
+    # Compiled SQL cached per engine (SQLAlchemy default 500). Lambda statements and
+    # per-dialect variants of every route's statements fit with room to spare.
+    db_query_cache_size: int = 1200
+    # Postgres with psycopg 3: a statement is prepared server-side once it has run
+    # db_prepare_threshold times on a connection. Disable behind PgBouncer in
+    # transaction pooling mode (prepared statements do not survive server changes).
+    db_prepared_statements: bool = True
+    db_prepare_threshold: int = 2
+    # Async engine for the async upload routes (aiosqlite / psycopg async / asyncpg).
+    # Falls back to running the sync Session in the threadpool when disabled or
+    # when the driver is not installed.
+    db_async: bool = True
+    # Override for the async URL (default: EMMO_DATABASE_URL with its async driver).
+    async_database_url: str | None = None
+    # Optional read replica for GET/HEAD requests (same pool options). Clients see
+    # their own writes for read_your_writes_s seconds after a successful write
+    # (cookie), or always with the `X-Read-Primary: true` header.
+    read_database_url: str | None = None
+    read_your_writes_s: float = 5.0
+    # SQLite production profile (file databases): WAL journal and tuned pragmas on
+    # connect, a read-only reader pool for GET requests and a single writer
+    # connection. Concurrent writers queue for it (up to sqlite_write_timeout_s)
+    # instead of failing with "database is locked". The async engine is not used
+    # with this profile, so every write goes through the same writer.
+    sqlite_profile: bool = True
+    # synchronous: OFF | NORMAL | FULL | EXTRA (NORMAL is durable in WAL mode except
+    # for the last commits on power loss).
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # Page cache per connection, in KiB.
+    sqlite_cache_size_kib: int = 16 * 1024
+    sqlite_reader_pool_size: int = 4
+    sqlite_write_timeout_s: float = 30.0
+
+    # Invoices with at least this many lines insert them with INSERT ... RETURNING
+    # (multi-row VALUES) and their price observations with COPY on Postgres.
+    # 0 disables the bulk path (always ORM unit of work).
+    bulk_insert_min_rows: int = 100
+
+    # Reprocessing an invoice: diff (update changed lines in place, re-price only
+    # lines whose price/reference changed) | replace (delete and reinsert all).
+    reprocess_mode: str = "diff"
 
     # When true, the app will create tables at startup (dev-friendly).
     # In production with Postgres + Alembic, set this to false and run `alembic upgrade head`.
     db_auto_create: bool = True
 
+    # Postgres only: none | quarter (range-partition invoice lines and price observations
+    # by quarter; convert once with `python -m scripts.partitions enable`).
+    db_partitioning: str = "none"
+    # Quarters after the current one that must always have a partition.
+    db_partitions_ahead: int = 2
+
+    # Bank / cash-register CSV imports (POST /bank-movements/import, /cash-closings/import).
+    # First data row (1-based, as in the sheet) and "field=column letter" mappings;
+    # defaults follow the exports the Apps Script copied.
+    bank_csv_first_row: int = 10
+    bank_csv_columns: str = "fecha=A,descripcion=B,importe=D,saldo=E,referencia_1=H,referencia_2=I"
+    cash_csv_first_row: int = 6
+    cash_csv_columns: str = (
+        "caja=B,numero=C,fecha=D,empleado=E,ventas_totales=F,venta_efectivo=J,entrada=K,salida=L,"
+        "calculado=N,declarado=O,descuadre=P,retirado=Q"
+    )
+    csv_import_delimiter: str = ";"
+    csv_import_encoding: str = "utf-8-sig"
+    # Rows per INSERT ... ON CONFLICT DO NOTHING statement.
+    csv_import_batch_rows: int = 2000
+
+    # Cash reconciliation (GET /cash-closings/reconciliation): a closing's discrepancy is an
+    # outlier in its register/employee when its robust z-score exceeds cash_outlier_z and it
+    # is at least cash_outlier_min_eur away from the group's median.
+    cash_outlier_z: float = 3.5
+    cash_outlier_min_eur: float = 5.0
+
+    # Invoice/payment matching (GET /bank-movements/invoice-matches): a payment matches an
+    # invoice when |importe| is within tolerance_eur + tolerance_pct % of the invoice total and
+    # it is dated from days_before days before to days_after days after the invoice.
+    payment_match_tolerance_eur: float = 0.05
+    payment_match_tolerance_pct: float = 0.0
+    payment_match_days_before: int = 7
+    payment_match_days_after: int = 90
+
     # Optional: protect the API with a simple static key.
     # If set, clients must send `X-API-Key: <value>`.
     api_key: str | None = None
@@ -45,8 +123,22 @@ class Settings(BaseSettings):
     https_redirect: bool = False
     enable_hsts: bool = False
 
-    # Basic (in-memory) rate limiting. Set to 0 to disable.
+    # Token-bucket rate limiting (requests/minute per client). Set to 0 to disable.
     rate_limit_per_minute: int = 0
+    # Bucket size (max burst); 0 = same as the per-minute limit.
+    rate_limit_burst: int = 0
+    # Limit for clients identified by X-API-Key; 0 = same as rate_limit_per_minute.
+    rate_limit_per_minute_api_key: int = 0
+    # Upper bound on tracked clients (LRU eviction).
+    rate_limit_max_keys: int = 10_000
+    # memory (per process) | sqlite (shared by all workers on the host)
+    rate_limit_store: str = "memory"
+    rate_limit_sqlite_path: str = "./rate_limit.db"
+    # Per-route token costs: "METHOD /path/glob=cost", comma-separated; first match wins, default 1.
+    rate_limit_route_costs: str = "POST /process/invoice=5,POST /invoices/*/process=5"
+
+    # Webhook idempotency: how long stored responses are replayed (0 disables the store).
+    idempotency_ttl_s: float = 24 * 3600
 
     # Optional CORS (comma-separated origins). Example: "http://localhost:5173,http://localhost:3000"
     cors_origins: str | None = None
@@ -73,17 +165,54 @@ class Settings(BaseSettings):
     # Enforce canonical reference codes (SUP_XXX) for storage/search.
     enforce_reference_code_prefix: bool = True
 
+    # Fuzzy matching of OCR references against the article master.
+    reference_match_mode: str = "suggest"  # off | suggest | auto_link
+    reference_match_max_distance: int = 2
+    # Auto-link only when the best candidate is unique and within this distance
+    # (0 = only case/punctuation/OCR-confusable differences).
+    reference_match_auto_link_max_distance: int = 0
+    # Rebuild the in-process index after this many seconds (0 = never).
+    reference_match_index_ttl_s: float = 300.0
+
+    # Reload the in-process supplier registry after this many seconds (0 = never).
+    supplier_registry_ttl_s: float = 300.0
+
+    # Duplicate supplier invoices, matched by (cif_supplier, num_invoice) or file sha256:
+    # reject (409) | merge (return the original) | link (header-only row pointing at the original)
+    duplicate_invoice_policy: str = "reject"
+
     # Pricing rules (non-AI)
     price_correction_mode: str = "flag_only"  # flag_only | floor_to_cost | floor_to_reference_median
     price_min_ratio: float = 0.7
 
     # Price history (math-only heuristics)
+    # Observations older than `price_history_days` are folded into monthly rollups by
+    # `python -m scripts.compact_price_observations`.
     price_history_days: int = 365
     price_history_min_samples: int = 3
+    # With fewer raw samples than the minimum, merge the reference's latest
+    # `price_rollup_months` monthly rollups into the median.
+    price_rollup_fallback: bool = True
+    price_rollup_months: int = 24
+
+    # Prometheus-style metrics at GET /metrics (per worker process).
+    metrics_enabled: bool = True
+    # Add X-DB-Queries / X-DB-Time (ms) response headers with the request's SQL work.
+    db_query_headers: bool = False
+    # Log statements slower than this (parameters redacted); 0 disables.
+    db_slow_query_ms: float = 500.0
 
     # Logging
     log_level: str = "INFO"
     log_json: bool = False
+    # Format/write log records on a background thread (QueueHandler/QueueListener)
+    # instead of on the request thread. Records are dropped if the queue is full.
+    log_queue: bool = True
+    log_queue_size: int = 10_000
+    # JSON encoder for EMMO_LOG_JSON: auto (orjson if installed) | orjson | json
+    log_json_encoder: str = "auto"
+    # Sampling for high-volume events: "<message>=<rate>" pairs, e.g. "price_flag=0.1".
+    log_sample_rates: str | None = None
 
 @lru_cache
 def get_settings() -> Settings:
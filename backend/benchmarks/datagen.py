@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+"""Synthetic data for benchmarks.
+
+Everything is derived from a seeded `random.Random`, so the same `DatasetSpec`
+always yields the same database and request payloads.
+
+- `seed_database()`: N suppliers (registered, with pinned prefixes), M master
+  articles, and `history_years` of monthly invoices per supplier with their
+  lines and `PriceObservation` rows (bulk Core inserts with explicit ids).
+- `ingest_payload()` / `ocr_payload()`: K invoices x L lines shaped like the
+  `/ingest/invoice` body and an OCR provider response.
+
+References in payloads are the raw supplier codes (`000123`), so requests go
+through the normal normalization to `<SUP>_<CODE>`; ~10% are unknown codes that
+create new articles.
+"""
+
+import random
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    DataOcrInvoice,
+    ImportacionArticulosMontcau,
+    OcrInfoClothes,
+    PriceObservation,
+    Supplier,
+)
+
+_CHUNK = 1000
+_DESCRIPTIONS = ("FALDA", "VESTIDO", "BLUSA", "PANTALON", "CHAQUETA", "CAMISETA", "ABRIGO", "JERSEY")
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """Size of a synthetic dataset."""
+    suppliers: int = 20
+    articles: int = 2000
+    invoices: int = 200
+    lines: int = 20
+    history_years: int = 2
+    seed: int = 42
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def supplier_code(i: int) -> str:
+    """Three-letter supplier prefix (`AAA`, `AAB`, ...)."""
+    a, rest = divmod(i, 26 * 26)
+    b, c = divmod(rest, 26)
+    return "".join(chr(ord("A") + x % 26) for x in (a, b, c))
+
+
+def supplier_cif(i: int) -> str:
+    return f"B{i:08d}"
+
+
+def supplier_name(i: int) -> str:
+    return f"{supplier_code(i)} Moda SL"
+
+
+def _article_cost(rng: random.Random) -> float:
+    return round(rng.uniform(5.0, 80.0), 2)
+
+
+def _articles_by_supplier(spec: DatasetSpec) -> list[list[int]]:
+    """Article numbers per supplier (articles are spread round-robin)."""
+    out: list[list[int]] = [[] for _ in range(spec.suppliers)]
+    for j in range(spec.articles):
+        out[j % spec.suppliers].append(j)
+    return out
+
+
+def _next_id(db: Session, model) -> int:
+    return int(db.scalar(select(func.coalesce(func.max(model.id), 0)))) + 1
+
+
+def _insert_chunks(db: Session, model, rows: list[dict]) -> None:
+    for start in range(0, len(rows), _CHUNK):
+        db.execute(insert(model), rows[start : start + _CHUNK])
+
+
+def _sync_sequences(db: Session) -> None:
+    """Advance Postgres serial sequences past the explicit ids we inserted."""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in ("data_ocr_invoice", "ocr_info_clothes", "importacion_articulos_montcau", "price_observation"):
+        db.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+        )
+
+
+def seed_database(db: Session, spec: DatasetSpec, *, today: date | None = None) -> dict[str, int]:
+    """Insert suppliers, master articles and price history; returns row counts."""
+    rng = random.Random(spec.seed)
+    today = today or date.today()
+    now = datetime.combine(today, datetime.min.time())
+
+    suppliers = [
+        {
+            "cif_supplier": supplier_cif(i),
+            "name_supplier": supplier_name(i),
+            "canonical_prefix": supplier_code(i),
+            "name_variants": [supplier_name(i)],
+            "settings": None,
+            "created_at": now,
+        }
+        for i in range(spec.suppliers)
+    ]
+
+    article_id = _next_id(db, ImportacionArticulosMontcau)
+    costs: dict[int, float] = {}
+    articles = []
+    for j in range(spec.articles):
+        costs[j] = _article_cost(rng)
+        articles.append(
+            {
+                "id": article_id + j,
+                "reference_code": f"{supplier_code(j % spec.suppliers)}_{j:06d}",
+                "descripcion": f"{rng.choice(_DESCRIPTIONS)} {j}",
+                "cantidad": rng.randint(1, 50),
+                "coste_unitario": costs[j],
+            }
+        )
+
+    invoice_id = _next_id(db, DataOcrInvoice)
+    line_id = _next_id(db, OcrInfoClothes)
+    observation_id = _next_id(db, PriceObservation)
+    invoices: list[dict] = []
+    lines: list[dict] = []
+    observations: list[dict] = []
+    per_supplier = _articles_by_supplier(spec)
+
+    for month in range(spec.history_years * 12):
+        day = today - timedelta(days=30 * month + 1)
+        created = datetime.combine(day, datetime.min.time())
+        for i in range(spec.suppliers):
+            pool = per_supplier[i]
+            if not pool:
+                continue
+            invoices.append(
+                {
+                    "id": invoice_id,
+                    "cif_supplier": supplier_cif(i),
+                    "name_supplier": supplier_name(i),
+                    "num_invoice": f"H{month:03d}-{i:05d}",
+                    "status": "processed",
+                    "created_at": created,
+                }
+            )
+            for j in rng.sample(pool, min(spec.lines, len(pool))):
+                price = round(costs[j] * rng.uniform(0.9, 1.6), 2)
+                ref = f"{supplier_code(i)}_{j:06d}"
+                lines.append(
+                    {
+                        "id": line_id,
+                        "invoice_id": invoice_id,
+                        "cif_supplier": supplier_cif(i),
+                        "name_supplier": supplier_name(i),
+                        "date": day,
+                        "reference_code_raw": f"{j:06d}",
+                        "reference_code": ref,
+                        "reference_code_origin": "ocr",
+                        "description": f"ART {j}",
+                        "quantity": rng.randint(1, 10),
+                        "price": price,
+                    }
+                )
+                observations.append(
+                    {
+                        "id": observation_id,
+                        "created_at": created,
+                        "cif_supplier": supplier_cif(i),
+                        "reference_code": ref,
+                        "observed_price": price,
+                        "invoice_id": invoice_id,
+                        "line_id": line_id,
+                    }
+                )
+                line_id += 1
+                observation_id += 1
+            invoice_id += 1
+
+    _insert_chunks(db, Supplier, suppliers)
+    _insert_chunks(db, ImportacionArticulosMontcau, articles)
+    _insert_chunks(db, DataOcrInvoice, invoices)
+    _insert_chunks(db, OcrInfoClothes, lines)
+    _insert_chunks(db, PriceObservation, observations)
+    _sync_sequences(db)
+    return {
+        "suppliers": len(suppliers),
+        "articles": len(articles),
+        "history_invoices": len(invoices),
+        "history_lines": len(lines),
+        "price_observations": len(observations),
+    }
+
+
+def _payload_lines(spec: DatasetSpec, rng: random.Random, supplier: int) -> list[dict]:
+    """L lines with distinct references (one line per reference and invoice)."""
+    pool = _articles_by_supplier(spec)[supplier]
+    known = rng.sample(pool, min(len(pool), spec.lines))
+    codes = [f"N{rng.randrange(10**8):08d}" if rng.random() < 0.1 else f"{j:06d}" for j in known]
+    codes += [f"N{rng.randrange(10**8):08d}" for _ in range(spec.lines - len(codes))]
+    return [
+        {
+            "reference_code": code,
+            "description": f"{rng.choice(_DESCRIPTIONS)} {n}",
+            "quantity": rng.randint(1, 10),
+            "price": round(rng.uniform(3.0, 120.0), 2),
+        }
+        for n, code in enumerate(dict.fromkeys(codes))
+    ]
+
+
+def ingest_payload(spec: DatasetSpec, k: int) -> dict:
+    """Body for `POST /ingest/invoice` (invoice number `k`)."""
+    rng = random.Random(spec.seed * 1_000_003 + k)
+    i = rng.randrange(spec.suppliers)
+    cif, name = supplier_cif(i), supplier_name(i)
+    return {
+        "source_channel": "bench",
+        "source_message_id": f"bench-{spec.seed}-{k}",
+        "cif_supplier": cif,
+        "name_supplier": name,
+        "num_invoice": f"BENCH-{k:07d}",
+        "lines": [{"cif_supplier": cif, "name_supplier": name, **line} for line in _payload_lines(spec, rng, i)],
+    }
+
+
+def ocr_payload(spec: DatasetSpec, k: int) -> dict:
+    """OCR provider response (`{"invoice": ..., "lines": ...}`) for upload `k`."""
+    rng = random.Random(spec.seed * 2_000_003 + k)
+    i = rng.randrange(spec.suppliers)
+    return {
+        "invoice": {
+            "cif_supplier": supplier_cif(i),
+            "name_supplier": supplier_name(i),
+            "num_invoice": f"OCR-{k:07d}",
+            "date": date.today().isoformat(),
+            "raw_text": f"BENCH OCR {k}",
+        },
+        "lines": _payload_lines(spec, rng, i),
+    }
+
+
+__all__ = [
+    "DatasetSpec",
+    "ingest_payload",
+    "ocr_payload",
+    "seed_database",
+    "supplier_cif",
+    "supplier_code",
+    "supplier_name",
+]
@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+"""Microbenchmarks for service-layer hot functions, with regression gates.
+
+Cases (each measured in isolation, no HTTP):
+- `ocr_normalize_payload_1000`: `OcrService._normalize_payload` on a 1,000-line payload.
+- `normalize_reference_code` / `generate_reference_code`: one call.
+- `evaluate_price_master`: article with `coste_unitario` (no query).
+- `evaluate_price_history_warm`: median fallback, same reference every call.
+- `evaluate_price_history_cold`: median fallback cycling over 500 references.
+- `process_invoice_result_dump_100`: `ProcessInvoiceResult` validation + JSON
+  dump with 100 lines.
+- `reconcile_cash_5y`: `reconcile_cash` over 5 years x 3 registers of daily closings.
+- `match_payments_quarter`: candidate sort-merge + resolution for 1,500
+  invoices and 2,000 payments (about a busy quarter).
+
+Timing follows `timeit`: each case is auto-calibrated to ~`--min-time` seconds
+per round; the median and the minimum over `--rounds` rounds are reported
+(µs per call). The gate compares the minimum, which is the least noisy
+estimate on a shared machine (as `timeit` recommends).
+
+Commands (from `backend/`):
+    python -m benchmarks.micro run [--output results.json]
+    python -m benchmarks.micro save-baseline      # writes benchmarks/baselines/micro.json
+    python -m benchmarks.micro compare --tolerance 0.25
+
+`compare` exits with status 1 when any case is slower than its baseline by
+more than the tolerance (0.25 = 25%). Baselines are machine-specific:
+regenerate them on the CI runner/host that runs the gate.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "micro.json"
+
+
+def _ocr_payload(lines: int) -> dict:
+    return {
+        "invoice": {
+            "cif_supplier": "B12345678",
+            "name_supplier": "Proveedor SL",
+            "num_invoice": "F-1",
+            "date": "2026-01-15",
+            "total_invoice_amount": "1234.50",
+        },
+        "lines": [
+            {
+                "reference_code": f"R{i:05d}",
+                "description": f"FALDA {i}",
+                "quantity": str(i % 7 + 1),
+                "price": f"{10 + i % 50}.95",
+                "total_no_iva": 12.5,
+            }
+            for i in range(lines)
+        ],
+    }
+
+
+def _pricing_cases() -> dict[str, Callable[[], object]]:
+    """Pricing cases against an in-memory SQLite with 500 refs x 50 observations."""
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import StaticPool
+
+    from app.db.base import Base
+    from app.db.models import DataOcrInvoice, ImportacionArticulosMontcau, OcrInfoClothes, PriceObservation
+    from app.services.pricing import evaluate_price
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    refs = [f"PRO_{i:05d}" for i in range(500)]
+    with Session(engine) as db, db.begin():
+        db.execute(insert(DataOcrInvoice), [{"id": 1, "cif_supplier": "B1", "status": "processed"}])
+        lines, observations = [], []
+        n = 0
+        for ref in refs:
+            for k in range(50):
+                n += 1
+                lines.append({"id": n, "invoice_id": 1, "cif_supplier": "B1", "reference_code": f"{ref}#{k}"})
+                observations.append(
+                    {
+                        "cif_supplier": "B1",
+                        "reference_code": ref,
+                        "observed_price": 20.0 + k % 10,
+                        "invoice_id": 1,
+                        "line_id": n,
+                    }
+                )
+        db.execute(insert(OcrInfoClothes), lines)
+        db.execute(insert(PriceObservation), observations)
+
+    db = Session(engine)
+    article = ImportacionArticulosMontcau(reference_code="PRO_00000", coste_unitario=20.0)
+    line = OcrInfoClothes(cif_supplier="B1", reference_code="PRO_00000", price=5.0, quantity=1)
+    cycle = iter(range(10**12))
+
+    def history_cold() -> object:
+        line.reference_code = refs[next(cycle) % len(refs)]
+        return evaluate_price(db=db, line=line, article=None)
+
+    def history_warm() -> object:
+        line.reference_code = "PRO_00000"
+        return evaluate_price(db=db, line=line, article=None)
+
+    return {
+        "evaluate_price_master": lambda: evaluate_price(db=db, line=line, article=article),
+        "evaluate_price_history_warm": history_warm,
+        "evaluate_price_history_cold": history_cold,
+    }
+
+
+def _serialization_case() -> Callable[[], object]:
+    from app.api.schemas import ProcessInvoiceResult
+    from app.db.models import DataOcrInvoice, OcrInfoClothes
+
+    created = datetime(2026, 1, 15, 10, 0, 0)
+    invoice = DataOcrInvoice(id=1, cif_supplier="B12345678", name_supplier="Proveedor SL", status="processed", created_at=created)
+    lines = [
+        OcrInfoClothes(
+            id=i,
+            invoice_id=1,
+            cif_supplier="B12345678",
+            name_supplier="Proveedor SL",
+            reference_code=f"PRO_R{i:05d}",
+            reference_code_raw=f"R{i:05d}",
+            reference_code_origin="ocr",
+            description=f"FALDA {i}",
+            quantity=2,
+            price=19.95,
+            total_no_iva=39.9,
+        )
+        for i in range(100)
+    ]
+
+    def dump() -> object:
+        return ProcessInvoiceResult(invoice=invoice, lines=lines, articles_upserted=3).model_dump_json()
+
+    return dump
+
+
+def _reconciliation_case() -> Callable[[], object]:
+    """`reconcile_cash` against an in-memory SQLite with ~5,500 closings."""
+    from datetime import date, timedelta
+
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import StaticPool
+
+    from app.db.base import Base
+    from app.db.models import CashClosing
+    from app.services.cash_reconciliation import reconcile_cash
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    start = date(2021, 1, 1)
+    rows = [
+        {
+            "fingerprint": f"{caja}-{day}",
+            "fecha": start + timedelta(days=day),
+            "caja": caja,
+            "numero": str(day),
+            "empleado": ("MONTSE", "YERAY", "SERGIO")[day % 3],
+            "venta_efectivo": 200.0 + day % 50,
+            "entrada": 0.0,
+            "salida": float(day % 7),
+            "calculado": 200.0 + day % 50 - day % 7,
+            "declarado": 200.0 + day % 50 - day % 7 - (day % 11 == 0) * 2.5,
+            "descuadre": -(day % 11 == 0) * 2.5,
+            "retirado": 150.0,
+        }
+        for caja in ("001", "002", "003")
+        for day in range(5 * 365)
+    ]
+    with Session(engine) as db, db.begin():
+        db.execute(insert(CashClosing), rows)
+    db = Session(engine)
+    return lambda: reconcile_cash(db)
+
+
+def _payment_matching_case() -> Callable[[], object]:
+    """`find_candidates` + `resolve` on in-memory refs (no DB)."""
+    from datetime import date, timedelta
+
+    from app.services.payment_matching import InvoiceRef, PaymentRef, find_candidates, resolve
+
+    start = date(2026, 1, 1)
+    suppliers = [(f"B{n:08d}", f"Proveedor {n} Textil SL") for n in range(60)]
+    invoices = [
+        InvoiceRef(n, *suppliers[n % 60], f"F-{n}", round(50 + (n * 37) % 4000 / 3, 2), start + timedelta(days=n % 90))
+        for n in range(1500)
+    ]
+    payments = [
+        PaymentRef(
+            n,
+            inv.fecha + timedelta(days=15 + n % 20),
+            f"TRANSFERENCIA A PROVEEDOR {inv.id % 60} TEXTIL" if n % 3 else f"ADEUDO {inv.cif_supplier}",
+            inv.amount,
+            "transfer" if n % 3 else "direct_debit",
+        )
+        for n, inv in enumerate(invoices)
+    ]
+    payments += [
+        PaymentRef(2000 + n, start + timedelta(days=n % 90), f"RECIBO VARIOS {n}", 10.0 + n % 300, "direct_debit")
+        for n in range(500)
+    ]
+    return lambda: resolve(find_candidates(invoices, payments))
+
+
+def build_cases() -> dict[str, Callable[[], object]]:
+    """Every microbenchmark case, keyed by its stable name (used in baselines)."""
+    from app.services.ocr import OcrService
+    from app.services.reference_code import generate_reference_code, normalize_reference_code
+
+    ocr = OcrService()
+    payload = _ocr_payload(1000)
+    cases: dict[str, Callable[[], object]] = {
+        "ocr_normalize_payload_1000": lambda: ocr._normalize_payload(payload, filename="bench.pdf"),
+        "normalize_reference_code": lambda: normalize_reference_code(name_supplier="Proveedor SL", reference_code="R-12345"),
+        "generate_reference_code": lambda: generate_reference_code(
+            name_supplier="Proveedor SL", description="FALDA LARGA", num_invoice="F-1"
+        ),
+    }
+    cases.update(_pricing_cases())
+    cases["process_invoice_result_dump_100"] = _serialization_case()
+    cases["reconcile_cash_5y"] = _reconciliation_case()
+    cases["match_payments_quarter"] = _payment_matching_case()
+    return cases
+
+
+def measure(fn: Callable[[], object], *, rounds: int, min_time: float) -> dict:
+    """Median/min µs per call over `rounds` rounds of an auto-calibrated loop."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= min_time or number >= 1 << 24:
+            break
+        number *= 2
+
+    per_call: list[float] = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - t0) / number * 1e6)
+    return {
+        "median_us": round(statistics.median(per_call), 3),
+        "min_us": round(min(per_call), 3),
+        "loops": number,
+        "rounds": rounds,
+    }
+
+
+def run(*, rounds: int = 5, min_time: float = 0.1, only: str | None = None) -> dict:
+    cases = build_cases()
+    results = {
+        name: measure(fn, rounds=rounds, min_time=min_time)
+        for name, fn in cases.items()
+        if only is None or only in name
+    }
+    return {
+        "benchmark": "micro",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "cases": results,
+    }
+
+
+def compare(current: dict, baseline: dict, *, tolerance: float) -> list[dict]:
+    """Compare `min_us` per case; `regressed` is set when slower than 1 + tolerance."""
+    rows = []
+    for name, cur in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            rows.append({"case": name, "current_us": cur["min_us"], "baseline_us": None, "ratio": None, "regressed": False})
+            continue
+        ratio = cur["min_us"] / base["min_us"] if base["min_us"] else float("inf")
+        rows.append(
+            {
+                "case": name,
+                "current_us": cur["min_us"],
+                "baseline_us": base["min_us"],
+                "ratio": round(ratio, 3),
+                "regressed": ratio > 1 + tolerance,
+            }
+        )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Service-layer microbenchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "save-baseline", "compare"):
+        p = sub.add_parser(name)
+        p.add_argument("--rounds", type=int, default=5)
+        p.add_argument("--min-time", type=float, default=0.1, help="Seconds per round (calibration target)")
+        p.add_argument("--only", default=None, help="Only cases whose name contains this text")
+        if name == "run":
+            p.add_argument("--output", default=None)
+        else:
+            p.add_argument("--baseline", default=str(BASELINE_PATH))
+        if name == "compare":
+            p.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    result = run(rounds=args.rounds, min_time=args.min_time, only=args.only)
+
+    if args.command == "run":
+        text = json.dumps(result, indent=2)
+        if args.output:
+            Path(args.output).write_text(text + "\n", encoding="utf-8")
+        else:
+            print(text)
+        return 0
+
+    baseline_path = Path(args.baseline)
+    if args.command == "save-baseline":
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written to {baseline_path}")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    rows = compare(result, baseline, tolerance=args.tolerance)
+    for row in rows:
+        status = "REGRESSED" if row["regressed"] else ("new" if row["baseline_us"] is None else "ok")
+        print(f"{row['case']:<36} {row['current_us']:>12.3f}us  baseline={row['baseline_us']}  ratio={row['ratio']}  {status}")
+    regressed = [r["case"] for r in rows if r["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} case(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
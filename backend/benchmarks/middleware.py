@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+"""Middleware overhead benchmark.
+
+Compares the pure-ASGI middleware stack (request id, security headers, rate
+limit) against the previous `BaseHTTPMiddleware` implementations, driving the
+app in-process through `httpx.ASGITransport` so the numbers reflect framework
+overhead rather than the network. Metrics are disabled so both stacks run the
+same three middlewares.
+
+Reports p50/p99 latency (ms) and requests/sec for:
+- `GET /health`
+- `GET /invoices/{id}` (one seeded invoice, SQLite)
+
+Usage (from `backend/`):
+    python -m benchmarks.middleware --requests 2000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import httpx
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+API_KEY = "bench-key"
+
+
+class _LegacyRequestContext(BaseHTTPMiddleware):
+    """Previous `RequestContextMiddleware` (BaseHTTPMiddleware based)."""
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        from app.middleware.request_context import request_id_ctx
+
+        incoming = request.headers.get("X-Request-ID")
+        request_id = incoming.strip() if incoming and incoming.strip() else uuid4().hex
+        token = request_id_ctx.set(request_id)
+        try:
+            response = await call_next(request)
+        finally:
+            request_id_ctx.reset(token)
+        response.headers.setdefault("X-Request-ID", request_id)
+        return response
+
+
+class _LegacySecurityHeaders(BaseHTTPMiddleware):
+    """Previous `SecurityHeadersMiddleware` (BaseHTTPMiddleware based)."""
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        response = await call_next(request)
+        response.headers.setdefault("X-Content-Type-Options", "nosniff")
+        response.headers.setdefault("X-Frame-Options", "DENY")
+        response.headers.setdefault("Referrer-Policy", "no-referrer")
+        response.headers.setdefault("Permissions-Policy", "camera=(), microphone=()")
+        return response
+
+
+class _LegacyRateLimit(BaseHTTPMiddleware):
+    """Previous `RateLimitMiddleware` dispatch around the same token buckets."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        from app.middleware.rate_limit import MemoryTokenBuckets
+
+        self._buckets = MemoryTokenBuckets(max_keys=10_000)
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        key = "ip:" + (request.client.host if request.client else "unknown")
+        decision = self._buckets.hit(key, capacity=1e9, rate=1e9, cost=1.0)
+        if not decision.allowed:
+            return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
+        return await call_next(request)
+
+
+def _bootstrap(db_path: Path) -> None:
+    os.environ["EMMO_DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["EMMO_API_KEY"] = API_KEY
+    # High enough never to reject, low enough to keep the middleware enabled.
+    os.environ["EMMO_RATE_LIMIT_PER_MINUTE"] = str(10**9)
+    # The legacy stack has no metrics middleware; keep `create_app()` like-for-like.
+    os.environ["EMMO_METRICS_ENABLED"] = "false"
+    os.environ["EMMO_DB_QUERY_HEADERS"] = "false"
+
+    import app.settings as settings_module
+
+    settings_module.get_settings.cache_clear()
+
+    import app.db.session as session_module
+
+    session_module.init_engine(settings_module.get_settings().database_url)
+
+
+def _build_app(variant: str):
+    from fastapi import FastAPI
+
+    from app.api.routes import router
+    from app.main import create_app
+
+    if variant == "asgi":
+        app = create_app()
+    else:
+        app = FastAPI()
+        app.add_middleware(_LegacyRequestContext)
+        app.add_middleware(_LegacySecurityHeaders)
+        app.add_middleware(_LegacyRateLimit)
+        app.include_router(router)
+    if len(app.user_middleware) != 3:
+        raise RuntimeError(f"{variant}: expected the 3 compared middlewares, got {app.user_middleware}")
+    return app
+
+
+async def _run(app, path: str, *, requests: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies: list[float] = []
+    headers = {"X-API-Key": API_KEY}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(min(50, requests)):  # warm-up
+            await client.get(path, headers=headers)
+
+        remaining = iter(range(requests))
+
+        async def worker() -> None:
+            for _ in remaining:
+                t0 = time.perf_counter()
+                r = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    raise RuntimeError(f"{path} -> {r.status_code}: {r.text}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Middleware overhead benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _bootstrap(Path(tmp) / "bench.db")
+
+        from app.db.init_db import init_db
+        from app.db.models import DataOcrInvoice
+        import app.db.session as session_module
+
+        init_db()
+        with session_module.SessionLocal() as db, db.begin():
+            invoice = DataOcrInvoice(cif_supplier="B00000000", name_supplier="Bench SL", num_invoice="BENCH-1")
+            db.add(invoice)
+            db.flush()
+            invoice_id = invoice.id
+
+        results: dict[str, dict] = {}
+        for variant in ("base_http", "asgi"):
+            app = _build_app(variant)
+            # `create_app()` reconfigures logging; keep per-request client logs out of the timings.
+            logging.getLogger("httpx").setLevel(logging.WARNING)
+            for path in ("/health", f"/invoices/{invoice_id}"):
+                label = path if path == "/health" else "/invoices/{id}"
+                results.setdefault(label, {})[variant] = asyncio.run(
+                    _run(app, path, requests=args.requests, concurrency=args.concurrency)
+                )
+
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
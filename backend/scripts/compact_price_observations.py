@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+"""Fold old price observations into monthly rollups.
+
+Run periodically (cron / scheduled job), from `backend/`:
+    python -m scripts.compact_price_observations [--older-than-days 365] [--batch-size 5000]
+
+Inputs:
+- `EMMO_DATABASE_URL`: database to compact.
+- `EMMO_PRICE_HISTORY_DAYS`: default retention for raw observations.
+
+Prints the result as JSON. Safe to re-run: each batch commits on its own.
+"""
+
+import argparse
+import json
+
+from app.db import session as db_session
+from app.services.price_rollup import compact_price_observations
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compact price observations into monthly rollups")
+    parser.add_argument("--older-than-days", type=int, default=None, help="Default: EMMO_PRICE_HISTORY_DAYS")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    db_session.init_engine()
+    with db_session.SessionLocal() as db:
+        result = compact_price_observations(db, older_than_days=args.older_than_days, batch_size=args.batch_size)
+    print(
+        json.dumps(
+            {
+                "cutoff": result.cutoff.isoformat(),
+                "observations": result.observations,
+                "rollups": result.rollups,
+                "batches": result.batches,
+            }
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
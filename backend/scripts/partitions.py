@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+"""Manage quarter partitions of invoice lines and price observations (Postgres).
+
+From `backend/` (see `app/db/partitioning.py`):
+    python -m scripts.partitions enable                 # one-off conversion, app stopped
+    python -m scripts.partitions ensure [--ahead 2]     # schedule (e.g. monthly cron)
+    python -m scripts.partitions list
+    python -m scripts.partitions detach --before 2024-01-01 [--archive-schema archive]
+
+Inputs:
+- `EMMO_DATABASE_URL`: Postgres SQLAlchemy URL.
+- `EMMO_DB_PARTITIONS_AHEAD`: default for `--ahead`.
+
+Prints the result as JSON.
+"""
+
+import argparse
+import json
+from datetime import date
+
+from app.db import session as db_session
+from app.db.partitioning import (
+    PARTITION_KEYS,
+    detach_partitions,
+    enable_partitioning,
+    ensure_partitions,
+    is_partitioned,
+    list_partitions,
+)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Quarter partitions (Postgres)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("enable", "ensure"):
+        p = sub.add_parser(name)
+        p.add_argument("--ahead", type=int, default=None, help="Default: EMMO_DB_PARTITIONS_AHEAD")
+    sub.add_parser("list")
+    p = sub.add_parser("detach")
+    p.add_argument("--before", type=date.fromisoformat, required=True, help="Detach quarters ending on/before this date")
+    p.add_argument("--archive-schema", default=None)
+    args = parser.parse_args(argv)
+
+    db_session.init_engine()
+    if db_session.engine.dialect.name != "postgresql":
+        raise SystemExit("partitioning requires PostgreSQL (EMMO_DATABASE_URL)")
+
+    with db_session.engine.begin() as conn:
+        if args.command == "enable":
+            converted = enable_partitioning(conn, ahead=args.ahead)
+            result = {"converted": converted, "created": ensure_partitions(conn, ahead=args.ahead)}
+        elif args.command == "ensure":
+            result = {"created": ensure_partitions(conn, ahead=args.ahead)}
+        elif args.command == "detach":
+            result = {"detached": detach_partitions(conn, before=args.before, archive_schema=args.archive_schema)}
+        else:
+            result = {
+                table: [name for name, _ in list_partitions(conn, table)] if is_partitioned(conn, table) else None
+                for table in PARTITION_KEYS
+            }
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+"""Recompute the supplier spend summaries from invoices and lines.
+
+Run once after `alembic upgrade` (the tables start empty) and whenever the
+summaries are suspected to drift (e.g. rows changed outside the API), from `backend/`:
+    python -m scripts.rebuild_supplier_spend
+
+Inputs:
+- `EMMO_DATABASE_URL`: database to rebuild.
+
+Runs in one transaction (readers keep seeing the old summaries until it commits).
+Prints the result as JSON.
+"""
+
+import json
+
+from app.db import session as db_session
+from app.services.supplier_spend import rebuild_supplier_spend
+
+
+def main() -> int:
+    db_session.init_engine()
+    with db_session.SessionLocal() as db, db.begin():
+        result = rebuild_supplier_spend(db)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
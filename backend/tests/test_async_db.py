@@ -0,0 +1,49 @@
+import pytest
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def test_async_url_mapping():
+    from app.db.session import async_database_url
+
+    assert async_database_url("sqlite:////tmp/x.db") == "sqlite+aiosqlite:////tmp/x.db"
+    assert async_database_url("postgresql://u:p@h:5432/db") == "postgresql+psycopg://u:p@h:5432/db"
+    assert async_database_url("postgresql+asyncpg://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+
+
+def test_upload_runs_on_async_session(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.db.session as session_module
+    import app.settings as settings_module
+
+    # The SQLite profile keeps every write on its single sync writer.
+    assert session_module.AsyncSessionLocal is None
+    monkeypatch.setenv("EMMO_SQLITE_PROFILE", "false")
+    settings_module.get_settings.cache_clear()
+    session_module.init_engine(settings_module.get_settings().database_url)
+    assert session_module.AsyncSessionLocal is not None
+    files = {"file": ("a.pdf", b"%PDF-1.4 async", "application/pdf")}
+    r = client.post("/process/invoice", files=files, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    invoice_id = r.json()["invoice"]["id"]
+
+    # Reprocess replaces header/lines in a single transaction.
+    files = {"file": ("b.pdf", b"%PDF-1.4 async again", "application/pdf")}
+    r = client.post(f"/invoices/{invoice_id}/process", files=files, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    assert r.json()["invoice"]["invoice_file_name"] == "b.pdf"
+    assert client.post("/invoices/999/process", files=files, headers=HEADERS).status_code == 404
+
+
+def test_threadpool_fallback(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.db.session as session_module
+    import app.settings as settings_module
+
+    monkeypatch.setenv("EMMO_DB_ASYNC", "false")
+    settings_module.get_settings.cache_clear()
+    session_module.init_engine(settings_module.get_settings().database_url)
+    assert session_module.AsyncSessionLocal is None
+
+    files = {"file": ("a.pdf", b"%PDF-1.4 sync", "application/pdf")}
+    r = client.post("/process/invoice", files=files, headers=HEADERS)
+    assert r.status_code == 200, r.text
@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from benchmarks.datagen import DatasetSpec, ingest_payload
+
+
+def test_e2e_benchmark_smoke(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from benchmarks import e2e
+
+    # run() configures the app through env vars; register them so they are restored.
+    for name in ("DATABASE_URL", "API_KEY", "OCR_API_URL", "STORAGE_ROOT", "STORE_UPLOADS", "RATE_LIMIT_PER_MINUTE", "LOG_LEVEL"):
+        monkeypatch.setenv(f"EMMO_{name}", "")
+
+    spec = DatasetSpec(suppliers=3, articles=30, invoices=3, lines=4, history_years=1)
+    result = e2e.run(spec, database_url=f"sqlite:///{tmp_path / 'b.db'}", process_requests=2, read_requests=2)
+
+    json.dumps(result)
+    assert result["seed"]["price_observations"] == 3 * 12 * 4
+    for scenario in ("ingest_invoice", "process_invoice", "list_invoices", "export_montcau"):
+        assert result["results"][scenario]["errors"] == 0
+    assert result["results"]["process_invoice"]["lines_per_s"] > 0
+
+    assert ingest_payload(spec, 1) == ingest_payload(spec, 1)
+    import app.settings as settings_module
+
+    settings_module.get_settings.cache_clear()
+
+
+def test_micro_cases_run_and_compare_gates_regressions():
+    from benchmarks import micro
+
+    for fn in micro.build_cases().values():
+        fn()
+
+    stats = micro.measure(lambda: None, rounds=2, min_time=0.001)
+    assert stats["loops"] >= 1 and stats["min_us"] <= stats["median_us"]
+
+    baseline = {"cases": {"a": {"min_us": 10.0}, "b": {"min_us": 10.0}}}
+    current = {"cases": {"a": {"min_us": 12.0}, "b": {"min_us": 14.0}, "c": {"min_us": 1.0}}}
+    rows = {r["case"]: r for r in micro.compare(current, baseline, tolerance=0.25)}
+    assert not rows["a"]["regressed"]
+    assert rows["b"]["regressed"]
+    assert rows["c"]["baseline_us"] is None and not rows["c"]["regressed"]
+
+
+def test_micro_baseline_covers_every_case():
+    from benchmarks import micro
+
+    baseline = json.loads(micro.BASELINE_PATH.read_text())
+    assert set(micro.build_cases()) <= set(baseline["cases"])
+
+
+def test_bulk_insert_benchmark_smoke(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from benchmarks import bulk_insert
+
+    monkeypatch.setenv("EMMO_DATABASE_URL", "")
+    monkeypatch.setenv("EMMO_BULK_INSERT_MIN_ROWS", "100")
+    result = bulk_insert.run(database_url=f"sqlite:///{tmp_path / 'b.db'}", lines=20, rounds=2, reset=False)
+
+    json.dumps(result)
+    assert set(result["results"]) == {"orm", "bulk", "speedup_p50"}
+    assert result["results"]["bulk"]["lines_per_s"] > 0
+    import app.settings as settings_module
+
+    settings_module.get_settings.cache_clear()
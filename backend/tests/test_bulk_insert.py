@@ -0,0 +1,60 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _payload(num_invoice: str, lines: int) -> dict:
+    return {
+        "source_channel": "email",
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": num_invoice,
+        "lines": [
+            {
+                "cif_supplier": "B12345678",
+                "name_supplier": "Proveedor SL",
+                "reference_code": f"R{i}" if i % 5 else None,
+                "description": f"FALDA {i}",
+                "quantity": 2,
+                "price": 10.0 + i,
+            }
+            for i in range(lines)
+        ],
+    }
+
+
+def _ingest(client: TestClient, monkeypatch: pytest.MonkeyPatch, num_invoice: str, *, min_rows: int) -> dict:
+    import app.settings as settings_module
+
+    monkeypatch.setenv("EMMO_BULK_INSERT_MIN_ROWS", str(min_rows))
+    settings_module.get_settings.cache_clear()
+    r = client.post("/ingest/invoice", json=_payload(num_invoice, 30), headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_bulk_path_matches_orm_path(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.db.session as session_module
+    from app.db.models import PriceObservation
+
+    orm = _ingest(client, monkeypatch, "F-ORM", min_rows=0)
+    bulk = _ingest(client, monkeypatch, "F-BULK", min_rows=1)
+
+    def strip(line: dict) -> dict:
+        return {k: v for k, v in line.items() if k not in ("id", "invoice_id", "num_invoice")}
+
+    assert [strip(ln) for ln in bulk["lines"]] == [strip(ln) for ln in orm["lines"]]
+    assert all(ln["id"] for ln in bulk["lines"])
+
+    with session_module.SessionLocal() as db:
+        counts = dict(
+            db.execute(
+                select(PriceObservation.invoice_id, func.count()).group_by(PriceObservation.invoice_id)
+            ).all()
+        )
+        q = select(PriceObservation.line_id).where(PriceObservation.invoice_id == bulk["invoice"]["id"])
+        line_ids = set(db.scalars(q))
+    assert counts[bulk["invoice"]["id"]] == counts[orm["invoice"]["id"]] == 24
+    assert line_ids == {ln["id"] for ln in bulk["lines"] if ln["reference_code"]}
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _closing(day: int, caja: str, empleado: str, *, declared: float, reported: float, calculado: float | None = 200.0):
+    from app.db.models import CashClosing
+
+    return CashClosing(
+        fingerprint=f"{caja}-{day}",
+        fecha=date(2026, 1, 1) + timedelta(days=day),
+        caja=caja,
+        numero=str(day),
+        empleado=empleado,
+        ventas_totales=500.0,
+        venta_efectivo=200.0,
+        entrada=0.0,
+        salida=0.0,
+        calculado=calculado,
+        declarado=declared,
+        descuadre=reported,
+        retirado=150.0,
+    )
+
+
+def test_reconciliation_flags_outliers_and_tracks_drawer(client: TestClient):
+    import app.db.session as session_module
+
+    closings = [_closing(d, "001", "MONTSE", declared=200.0, reported=0.0) for d in range(10)]
+    # A 40 EUR shortfall in a register that is always exact, wrongly reported as 0.
+    closings.append(_closing(10, "001", "YERAY", declared=160.0, reported=0.0))
+    # Second register: small noise, no outliers; missing `calculado` falls back to cash in - out.
+    closings += [
+        _closing(d, "002", "YERAY", declared=200.0 + (d % 3 - 1), reported=float(d % 3 - 1), calculado=None)
+        for d in range(6)
+    ]
+    with session_module.SessionLocal() as db, db.begin():
+        db.add_all(closings)
+
+    r = client.get("/cash-closings/reconciliation", headers=HEADERS)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["total_closings"] == 17
+
+    first, second = body["registers"]
+    assert (first["key"], first["closings"], first["discrepancy_total"], first["outliers"]) == ("001", 11, -40.0, 1)
+    # Each closing leaves 200 - 150 = 50 in the drawer, minus the shortfall.
+    assert first["final_balance"] == 11 * 50.0 - 40.0
+    assert (second["key"], second["outliers"], second["discrepancy_total"]) == ("002", 0, 0.0)
+    assert [e["key"] for e in body["employees"]] == ["MONTSE", "YERAY"]
+
+    [flagged] = body["closings"]
+    assert flagged["caja"] == "001" and flagged["empleado"] == "YERAY"
+    assert (flagged["expected"], flagged["declared"], flagged["discrepancy"]) == (200.0, 160.0, -40.0)
+    assert flagged["outlier_register"] and flagged["reported_mismatch"]
+    assert flagged["cumulative_discrepancy"] == -40.0
+
+    r = client.get(
+        "/cash-closings/reconciliation",
+        params={"caja": "002", "date_to": "2026-01-03", "detail": "true"},
+        headers=HEADERS,
+    )
+    rows = r.json()["closings"]
+    assert [c["running_balance"] for c in rows] == [49.0, 99.0, 150.0]
+    assert not any(c["reported_mismatch"] for c in rows)
@@ -0,0 +1,92 @@
+from datetime import date
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+HEADERS = {"X-API-Key": "test-key"}
+
+# Bank export: 9 preamble rows, then Fecha;Concepto;F. valor;Importe;Saldo;...;Ref 1;Ref 2
+BANK_PREAMBLE = "Cuenta;ES00 0000\n" + "\n" * 7 + "F. Operativa;Concepto;F. Valor;Importe;Saldo;;;Ref 1;Ref 2\n"
+
+
+def _bank_csv(rows: list[tuple[str, str, str, str]]) -> bytes:
+    body = "".join(f"{d};{concept};{d};{amount};{balance};;;R;\n" for d, concept, amount, balance in rows)
+    return (BANK_PREAMBLE + body).encode("utf-8")
+
+
+def _post(client: TestClient, path: str, content: bytes) -> dict:
+    r = client.post(path, files={"file": ("export.csv", content, "text/csv")}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_bank_import_inserts_only_new_movements(client: TestClient):
+    import app.db.session as session_module
+    from app.db.models import BankAccountMovement
+
+    january = [
+        ("02/01/2026", "ABONO TPV 0001", "1.240,50", "5.240,50"),
+        ("03/01/2026", "TRANSFERENCIA A TEXTILES GARCIA S.L.", "-300,00", "4.940,50"),
+        # Same concept and amount on the same day: the balance tells them apart.
+        ("03/01/2026", "COMISIONES KT", "-3,00", "4.937,50"),
+        ("03/01/2026", "COMISIONES KT", "-3,00", "4.934,50"),
+    ]
+    first = _post(client, "/bank-movements/import", _bank_csv(january))
+    assert first == {
+        "rows": 4,
+        "inserted": 4,
+        "skipped": 0,
+        "invalid": 0,
+        "first_date": "2026-01-02",
+        "last_date": "2026-01-03",
+    }
+
+    # The next export overlaps the previous one and ends with a totals row.
+    overlapping = _bank_csv(january[2:] + [("04/02/2026", "ADEUDO RECIBO ENDESA", "-80,10", "4.854,40")])
+    second = _post(client, "/bank-movements/import", overlapping + b"TOTAL;;;-1.000,00;;\n")
+    assert (second["rows"], second["inserted"], second["skipped"], second["invalid"]) == (4, 1, 2, 1)
+
+    with session_module.SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(BankAccountMovement)) == 5
+        endesa = db.scalars(select(BankAccountMovement).where(BankAccountMovement.fecha == date(2026, 2, 4))).one()
+        assert (endesa.importe, endesa.saldo, endesa.referencia_1) == (-80.1, 4854.4, "R")
+        assert (endesa.identificacion, endesa.especificacion) == ("Suministros (CF)", "LUZ")
+
+
+def test_bank_import_keeps_identical_movements_without_balance(client: TestClient):
+    import app.db.session as session_module
+    from app.db.models import BankAccountMovement
+
+    rows = [
+        # No usable balance: identical movements are told apart by their order in the file.
+        ("05/01/2026", "COMPRA TARJ. CAFETERIA", "-2,50", ""),
+        ("05/01/2026", "COMPRA TARJ. CAFETERIA", "-2,50", ""),
+        ("05/01/2026", "ABONO TPV 0001", "40,00", "n/d"),
+    ]
+    first = _post(client, "/bank-movements/import", _bank_csv(rows))
+    assert (first["inserted"], first["invalid"]) == (3, 0)
+    again = _post(client, "/bank-movements/import", _bank_csv(rows))
+    assert (again["inserted"], again["skipped"]) == (0, 3)
+
+    with session_module.SessionLocal() as db:
+        saldos = db.scalars(select(BankAccountMovement.saldo)).all()
+        assert saldos == [None, None, None]
+
+
+def test_cash_import_and_bad_layout(client: TestClient):
+    header = "Cierres\n\n\n\n;Caja;Numero;Fecha;Empleado;Ventas;;;;Efectivo;Entrada;Salida;;Calc;Decl;Desc;Ret\n"
+
+    def closing(number: int, day: str, declared: str) -> str:
+        return f"x;TIENDA;{number};{day};MONTSE;500,00;;;;200,00;0;75,00;;125,00;{declared};0,00;0\n"
+
+    content = header + closing(1, "02/01/2026", "125,00") + closing(2, "03/01/2026", "120,00")
+    assert _post(client, "/cash-closings/import", content.encode())["inserted"] == 2
+    again = _post(client, "/cash-closings/import", (content + closing(3, "04/01/2026", "80,00")).encode())
+    assert (again["inserted"], again["skipped"]) == (1, 2)
+
+    r = client.post(
+        "/bank-movements/import",
+        files={"file": ("export.csv", b"\xff\xfe\x00broken", "text/csv")},
+        headers=HEADERS,
+    )
+    assert r.status_code == 400
@@ -0,0 +1,128 @@
+import pytest
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _payload(message_id: str) -> dict:
+    return {
+        "source_channel": "whatsapp",
+        "source_message_id": message_id,
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": "F-100",
+        "lines": [
+            {
+                "cif_supplier": "B12345678",
+                "name_supplier": "Proveedor SL",
+                "reference_code": "R1",
+                "quantity": 1,
+                "price": 10.0,
+            }
+        ],
+    }
+
+
+def _set_policy(monkeypatch: pytest.MonkeyPatch, policy: str) -> None:
+    import app.settings as settings_module
+
+    monkeypatch.setenv("EMMO_DUPLICATE_INVOICE_POLICY", policy)
+    settings_module.get_settings.cache_clear()
+
+
+def test_duplicate_invoice_is_rejected_by_default(client: TestClient):
+    assert client.post("/ingest/invoice", json=_payload("m1"), headers=HEADERS).status_code == 200
+    r = client.post("/ingest/invoice", json=_payload("m2"), headers=HEADERS)
+    assert r.status_code == 409
+    assert "cif_num" in r.json()["detail"]
+
+
+def test_duplicate_invoice_merge_and_link(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    original = client.post("/ingest/invoice", json=_payload("m1"), headers=HEADERS).json()
+
+    _set_policy(monkeypatch, "merge")
+    merged = client.post("/ingest/invoice", json=_payload("m2"), headers=HEADERS)
+    assert merged.status_code == 200, merged.text
+    assert merged.headers["X-Duplicate-Of"] == str(original["invoice"]["id"])
+    assert merged.json()["invoice"]["id"] == original["invoice"]["id"]
+
+    _set_policy(monkeypatch, "link")
+    linked = client.post("/ingest/invoice", json=_payload("m3"), headers=HEADERS).json()
+    assert linked["invoice"]["status"] == "duplicate"
+    assert linked["invoice"]["duplicate_of_invoice_id"] == original["invoice"]["id"]
+    assert linked["lines"] == []
+
+
+def test_same_file_is_detected_before_ocr(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    files = {"file": ("invoice.pdf", b"%PDF-1.4 same", "application/pdf")}
+    first = client.post("/process/invoice", files=files, headers=HEADERS)
+    assert first.status_code == 200, first.text
+    assert client.post("/process/invoice", files=files, headers=HEADERS).status_code == 409
+
+    _set_policy(monkeypatch, "link")
+    linked = client.post("/process/invoice", files=files, headers=HEADERS).json()["invoice"]
+    assert linked["duplicate_of_invoice_id"] == first.json()["invoice"]["id"]
+    assert linked["invoice_file_path"] == first.json()["invoice"]["invoice_file_path"]
+
+
+def test_reprocess_rejects_header_of_another_invoice(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    from app.services.ocr import OcrService, ParsedInvoice
+
+    body = {"source_channel": "email", "cif_supplier": "B12345678", "num_invoice": "F-1", "lines": []}
+    original = client.post("/ingest/invoice", json=body, headers=HEADERS)
+    assert original.status_code == 200, original.text
+
+    files = {"file": ("a.pdf", b"%PDF-1.4 other", "application/pdf")}
+    upload = client.post("/process/invoice", files=files, headers=HEADERS).json()["invoice"]
+
+    parsed = ParsedInvoice(
+        cif_supplier="B12345678",
+        name_supplier=None,
+        tel_number_supplier=None,
+        email_supplier=None,
+        num_invoice="F-1",
+        invoice_date=None,
+        total_invoice_amount=None,
+        invoice_type=None,
+        optional_fields=None,
+        raw_text=None,
+    )
+    monkeypatch.setattr(OcrService, "parse", lambda self, file_bytes, filename: (parsed, []))
+    r = client.post(f"/invoices/{upload['id']}/process", files=files, headers=HEADERS)
+    assert r.status_code == 409
+    assert str(original.json()["invoice"]["id"]) in r.json()["detail"]
+    # Nothing was committed: the upload keeps its header.
+    assert client.get(f"/invoices/{upload['id']}").json()["cif_supplier"] == "UNKNOWN"
+
+
+def test_unknown_supplier_invoices_may_share_a_number(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    from app.services.ocr import OcrService, ParsedInvoice
+
+    parsed = ParsedInvoice(
+        cif_supplier="UNKNOWN",
+        name_supplier=None,
+        tel_number_supplier=None,
+        email_supplier=None,
+        num_invoice="1",
+        invoice_date=None,
+        total_invoice_amount=None,
+        invoice_type=None,
+        optional_fields=None,
+        raw_text=None,
+    )
+    monkeypatch.setattr(OcrService, "parse", lambda self, file_bytes, filename: (parsed, []))
+    for content in (b"%PDF-1.4 unknown a", b"%PDF-1.4 unknown b"):
+        files = {"file": ("a.pdf", content, "application/pdf")}
+        r = client.post("/process/invoice", files=files, headers=HEADERS)
+        assert r.status_code == 200, r.text
+
+    for message_id in ("u1", "u2"):
+        body = {
+            "source_channel": "email",
+            "source_message_id": message_id,
+            "cif_supplier": "UNKNOWN",
+            "num_invoice": "1",
+            "lines": [],
+        }
+        r = client.post("/ingest/invoice", json=body, headers=HEADERS)
+        assert r.status_code == 200, r.text
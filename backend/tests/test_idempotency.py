@@ -0,0 +1,68 @@
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _payload(message_id: str) -> dict:
+    return {
+        "source_channel": "telegram",
+        "source_message_id": message_id,
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": "F-IDEM",
+        "lines": [
+            {
+                "cif_supplier": "B12345678",
+                "name_supplier": "Proveedor SL",
+                "reference_code": "R1",
+                "description": "FALDA",
+                "quantity": 1,
+                "price": 12.0,
+            }
+        ],
+    }
+
+
+def test_ingest_invoice_retry_replays_first_response(client: TestClient):
+    first = client.post("/ingest/invoice", json=_payload("tg-1"), headers=HEADERS)
+    assert first.status_code == 200, first.text
+    assert "Idempotent-Replayed" not in first.headers
+
+    retry = client.post("/ingest/invoice", json=_payload("tg-1"), headers=HEADERS)
+    assert retry.status_code == 200, retry.text
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+
+    invoices = client.get("/invoices", params={"cif_supplier": "B12345678"}).json()
+    assert len(invoices) == 1
+
+
+def test_ingest_invoice_reference_conflict_keeps_its_detail(client: TestClient):
+    payload = _payload("tg-2")
+    payload["lines"].append(dict(payload["lines"][0]))
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 409
+    assert r.json()["detail"] == "Duplicate reference_code for this invoice"
+
+
+def test_ingest_line_and_upload_honour_idempotency_key(client: TestClient):
+    invoice = client.post("/ingest/invoice", json=_payload("tg-2"), headers=HEADERS).json()["invoice"]
+    body = {
+        "source_channel": "telegram",
+        "invoice_id": invoice["id"],
+        "line": {"cif_supplier": "B12345678", "name_supplier": "Proveedor SL", "reference_code": "R2", "price": 3.0},
+    }
+    headers = {**HEADERS, "Idempotency-Key": "line-abc"}
+    a = client.post("/ingest/line", json=body, headers=headers)
+    b = client.post("/ingest/line", json=body, headers=headers)
+    assert a.status_code == b.status_code == 200, b.text
+    assert a.json()["id"] == b.json()["id"]
+    assert len(client.get(f"/invoices/{invoice['id']}/lines").json()) == 2
+
+    headers = {**HEADERS, "Idempotency-Key": "upload-1"}
+    files = {"file": ("invoice.pdf", b"%PDF-1.4 test", "application/pdf")}
+    u1 = client.post("/process/invoice", files=files, headers=headers)
+    u2 = client.post("/process/invoice", files=files, headers=headers)
+    assert u1.status_code == u2.status_code == 200, u2.text
+    assert u2.headers["Idempotent-Replayed"] == "true"
+    assert u1.json()["invoice"]["id"] == u2.json()["invoice"]["id"]
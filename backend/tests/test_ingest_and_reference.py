@@ -86,6 +86,22 @@ def test_set_reference_upserts_article(client: TestClient):
     assert art_json["descripcion"] == "PANTALON"
 
 
+def test_line_date_round_trips(client: TestClient):
+    inv = client.post(
+        "/invoices",
+        json={"cif_supplier": "B12345678", "name_supplier": "Proveedor SL", "num_invoice": "F-3"},
+        headers={"X-API-Key": "test-key"},
+    ).json()
+
+    r = client.post(
+        f"/invoices/{inv['id']}/lines",
+        json={"cif_supplier": "B12345678", "date": "2026-03-15", "description": "FALDA", "quantity": 1},
+        headers={"X-API-Key": "test-key"},
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["date"] == "2026-03-15"
+
+
 def test_file_upload_requires_api_key_when_configured(client: TestClient):
     # Missing key => 401
     r = client.post(
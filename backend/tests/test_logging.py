@@ -0,0 +1,34 @@
+import json
+import logging
+
+import pytest
+
+import app.settings as settings_module
+from app.logging_config import configure_logging, parse_sample_rates, stop_logging
+
+
+def test_queue_logging_json_keeps_extra_and_samples(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture):
+    monkeypatch.setenv("EMMO_LOG_JSON", "true")
+    monkeypatch.setenv("EMMO_LOG_QUEUE", "true")
+    monkeypatch.setenv("EMMO_LOG_SAMPLE_RATES", "noisy=0")
+    settings_module.get_settings.cache_clear()
+    try:
+        configure_logging()
+        log = logging.getLogger("test.logging")
+        log.info("price_flag", extra={"flag": "LOW", "reference_code": "EMMO_R1"})
+        log.info("noisy")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            log.exception("failed %s", "here")
+        stop_logging()  # drains the queue
+    finally:
+        settings_module.get_settings.cache_clear()
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert [r["message"] for r in lines] == ["price_flag", "failed here"]
+    assert lines[0]["flag"] == "LOW" and lines[0]["reference_code"] == "EMMO_R1"
+    assert lines[0]["request_id"] == "-"
+    assert "ValueError: boom" in lines[1]["exc_info"]
+
+    assert parse_sample_rates("price_flag=0.1, x=3") == {"price_flag": 0.1, "x": 1.0}
@@ -0,0 +1,121 @@
+import logging
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.metrics import Counter, Histogram, Registry, redact_parameters
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def test_registry_aggregates_thread_shards():
+    registry = Registry()
+    hits = Counter("t_hits_total", "Hits.", ("kind",), registry=registry)
+    latency = Histogram("t_latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+
+    def work():
+        for _ in range(100):
+            hits.inc(kind="a")
+        latency.observe(0.05)
+        latency.observe(5.0)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert hits.value(kind="a") == 400
+    assert latency.count() == 8
+    text = registry.render()
+    assert 't_hits_total{kind="a"} 400.0' in text
+    assert 't_latency_seconds_bucket{le="0.1"} 4' in text
+    assert 't_latency_seconds_bucket{le="+Inf"} 8' in text
+    assert "t_latency_seconds_count 8" in text
+
+
+def test_registry_folds_shards_of_exited_threads():
+    registry = Registry()
+    hits = Counter("t_hits_total", "Hits.", registry=registry)
+    latency = Histogram("t_latency_seconds", "Latency.", buckets=(0.1,), registry=registry)
+
+    def work():
+        hits.inc()
+        latency.observe(0.05)
+
+    for i in range(50):
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+        assert hits.value() == i + 1
+        assert len(registry._shards) == 0
+
+    hits.inc()  # the calling thread is alive: its shard is kept
+    assert hits.value() == 51 and latency.count() == 50
+    assert len(registry._shards) == 1
+
+
+def test_metrics_endpoint_reports_routes_storage_and_db(client: TestClient):
+    client.get("/health")
+    files = {"file": ("invoice.pdf", b"%PDF-1.4 metrics", "application/pdf")}
+    assert client.post("/process/invoice", files=files, headers=HEADERS).status_code == 200
+    client.put(
+        "/articles",
+        json={"reference_code": "EMMO_M1", "descripcion": "X", "cantidad": 1, "coste_unitario": 5.0},
+        headers=HEADERS,
+    )
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    text = r.text
+    assert 'emmo_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in text
+    assert 'route="/process/invoice",status="200"' in text
+    assert "emmo_storage_write_bytes_total" in text
+    assert 'emmo_db_statements_per_request_count{route="/process/invoice"}' in text
+    assert 'emmo_article_upserts_total{source="api"}' in text
+
+
+def test_db_query_headers_and_slow_query_log(
+    tmp_path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+):
+    import app.db.session as session_module
+    import app.main as main_module
+    import app.settings as settings_module
+
+    monkeypatch.setenv("EMMO_DATABASE_URL", f"sqlite:///{tmp_path / 'q.db'}")
+    monkeypatch.setenv("EMMO_DB_QUERY_HEADERS", "true")
+    monkeypatch.setenv("EMMO_DB_SLOW_QUERY_MS", "0.000001")
+    settings_module.get_settings.cache_clear()
+    session_module.init_engine()
+
+    with TestClient(main_module.create_app()) as client:
+        caplog.clear()
+        with caplog.at_level(logging.WARNING, logger="app.db.slow_query"):
+            r = client.get("/invoices", params={"cif_supplier": "B-SECRET-CIF"})
+        assert r.status_code == 200
+        assert int(r.headers["X-DB-Queries"]) >= 1
+        assert float(r.headers["X-DB-Time"]) >= 0
+
+        slow = [rec for rec in caplog.records if rec.getMessage() == "slow_query"]
+        assert slow and all("B-SECRET-CIF" not in str(rec.parameters) for rec in slow)
+        assert any(rec.parameters and "str" in str(rec.parameters) for rec in slow)
+
+    assert redact_parameters([{"a": 1}, {"a": 2}]) == {"rows": 2, "first": {"a": "int"}}
+
+
+def test_app_errors_propagate_with_metrics_disabled(monkeypatch: pytest.MonkeyPatch):
+    import app.settings as settings_module
+    from app.middleware.metrics import MetricsMiddleware
+
+    monkeypatch.setenv("EMMO_METRICS_ENABLED", "false")
+    settings_module.get_settings.cache_clear()
+
+    async def failing_app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    client = TestClient(MetricsMiddleware(failing_app))
+    with pytest.raises(RuntimeError, match="boom"):
+        client.get("/")
+    settings_module.get_settings.cache_clear()
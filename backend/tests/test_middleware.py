@@ -0,0 +1,32 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.request_context import RequestContextMiddleware, request_id_ctx
+from app.middleware.security_headers import SecurityHeadersMiddleware
+
+
+def test_pure_asgi_middlewares_keep_headers_and_context():
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+
+    @app.get("/ctx")
+    async def ctx():
+        return {"request_id": request_id_ctx.get()}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b"]), media_type="text/plain")
+
+    with TestClient(app) as client:
+        r = client.get("/ctx", headers={"X-Request-ID": "abc"})
+        assert r.headers["X-Request-ID"] == "abc"
+        assert r.json() == {"request_id": "abc"}
+        assert r.headers["X-Content-Type-Options"] == "nosniff"
+        assert "Strict-Transport-Security" not in r.headers
+
+        r = client.get("/stream")
+        assert r.text == "ab"
+        assert len(r.headers["X-Request-ID"]) == 32
+        assert r.headers["X-Frame-Options"] == "DENY"
@@ -0,0 +1,79 @@
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def test_quarter_helpers():
+    from app.db.partitioning import next_quarter, parse_partition_name, partition_name, quarter_start
+
+    assert quarter_start(date(2026, 11, 30)) == date(2026, 10, 1)
+    assert quarter_start(date(2026, 3, 31)) == date(2026, 1, 1)
+    assert next_quarter(date(2026, 10, 1)) == date(2027, 1, 1)
+    assert partition_name("price_observation", date(2026, 4, 1)) == "price_observation_2026q2"
+    assert parse_partition_name("price_observation", "price_observation_2026q2") == date(2026, 4, 1)
+    assert parse_partition_name("price_observation", "price_observation_monthly") is None
+
+
+def test_partitioned_ddl_includes_partition_key():
+    from app.db.partitioning import partitioned_constraint, partitioned_index
+
+    key = "invoice_created_at"
+    assert partitioned_constraint("p", "PRIMARY KEY (id)", key) == "PRIMARY KEY (id, invoice_created_at)"
+    assert (
+        partitioned_constraint("u", "UNIQUE (invoice_id, reference_code)", key)
+        == "UNIQUE (invoice_id, reference_code, invoice_created_at)"
+    )
+    fk_invoice = "FOREIGN KEY (invoice_id) REFERENCES data_ocr_invoice(id) ON DELETE CASCADE"
+    assert partitioned_constraint("f", fk_invoice, key) == fk_invoice
+    fk_line = "FOREIGN KEY (line_id) REFERENCES ocr_info_clothes(id) ON DELETE CASCADE"
+    assert partitioned_constraint("f", fk_line, key) is None
+
+    index = "CREATE INDEX ix_x ON public.ocr_info_clothes USING btree (cif_supplier)"
+    assert partitioned_index(index, unique=False, key=key) == index
+    unique = "CREATE UNIQUE INDEX ux ON public.t USING btree (a, b) WHERE (c IS NULL)"
+    assert (
+        partitioned_index(unique, unique=True, key=key)
+        == "CREATE UNIQUE INDEX ux ON public.t USING btree (a, b, invoice_created_at) WHERE (c IS NULL)"
+    )
+
+
+def test_lines_carry_invoice_created_at(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.db.session as session_module
+    import app.settings as settings_module
+    from app.db.models import DataOcrInvoice, OcrInfoClothes
+
+    def ingest(num_invoice: str, lines: int) -> dict:
+        payload = {
+            "source_channel": "email",
+            "cif_supplier": "B12345678",
+            "name_supplier": "Proveedor SL",
+            "num_invoice": num_invoice,
+            "lines": [
+                {"cif_supplier": "B12345678", "reference_code": f"R{i}", "quantity": 1, "price": 10.0}
+                for i in range(lines)
+            ],
+        }
+        r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    monkeypatch.setenv("EMMO_BULK_INSERT_MIN_ROWS", "3")
+    settings_module.get_settings.cache_clear()
+    orm = ingest("F-1", 2)
+    bulk = ingest("F-2", 3)
+
+    with session_module.SessionLocal() as db:
+        for body in (orm, bulk):
+            invoice = db.get(DataOcrInvoice, body["invoice"]["id"])
+            q = select(OcrInfoClothes.invoice_created_at).where(OcrInfoClothes.invoice_id == invoice.id)
+            assert set(db.scalars(q)) == {invoice.created_at}
+
+    # The partition filter only narrows the lookup; responses are unchanged.
+    monkeypatch.setenv("EMMO_DB_PARTITIONING", "quarter")
+    settings_module.get_settings.cache_clear()
+    r = client.get(f"/invoices/{bulk['invoice']['id']}/lines", headers=HEADERS)
+    assert [ln["id"] for ln in r.json()] == [ln["id"] for ln in bulk["lines"]]
@@ -0,0 +1,103 @@
+from datetime import date
+
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _ingest(client: TestClient, cif: str, name: str, num_invoice: str, amount: float, day: str) -> int:
+    line = {
+        "cif_supplier": cif,
+        "name_supplier": name,
+        "reference_code": f"R-{num_invoice}",
+        "quantity": 1,
+        "price": amount,
+        "date": day,
+    }
+    payload = {
+        "source_channel": "email",
+        "cif_supplier": cif,
+        "name_supplier": name,
+        "num_invoice": num_invoice,
+        "total_invoice_amount": amount,
+        "lines": [line],
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()["invoice"]["id"]
+
+
+def _movement(day: date, descripcion: str, importe: float):
+    from app.db.models import BankAccountMovement
+
+    return BankAccountMovement(
+        fingerprint=f"{day}-{descripcion}-{importe}", fecha=day, descripcion=descripcion, importe=importe
+    )
+
+
+def test_quarter_matching_sets(client: TestClient):
+    import app.db.session as session_module
+
+    garcia = _ingest(client, "B11111111", "Textiles García, S.L.", "TG-1", 300.0, "2026-01-10")
+    norte = [
+        _ingest(client, "B22222222", "Moda Norte SA", "MN-1", 150.0, "2026-02-05"),
+        _ingest(client, "B22222222", "Moda Norte SA", "MN-2", 150.0, "2026-02-20"),
+    ]
+    zapatos = _ingest(client, "B44444444", "Zapatos Sur SL", "ZS-1", 99.99, "2026-03-02")
+    bolsos = _ingest(client, "B33333333", "Bolsos Este", "BE-1", 45.5, "2026-03-10")
+    _ingest(client, "B11111111", "Textiles García, S.L.", "TG-9", 300.0, "2026-05-10")  # next quarter
+
+    with session_module.SessionLocal() as db, db.begin():
+        db.add_all(
+            [
+                _movement(date(2026, 2, 1), "TRANSFERENCIA A TEXTILES GARCIA S.L.", -300.0),
+                # Same amount, no supplier evidence: never a candidate.
+                _movement(date(2026, 2, 2), "TRANSFERENCIA A DESCONOCIDO", -300.0),
+                _movement(date(2026, 3, 1), "ADEUDO RECIBO MODA NORTE", -150.0),
+                _movement(date(2026, 3, 5), "ADEUDO RECIBO MODA NORTE", -150.0),
+                # Matched by CIF, 2 cents off; paid in the next quarter, inside the window.
+                _movement(date(2026, 4, 3), "ADEUDO B33333333 REF 991", -45.52),
+                _movement(date(2026, 3, 15), "RECIBO ENDESA", -80.0),
+                # Incoming and non-payment movements are ignored.
+                _movement(date(2026, 3, 15), "TRANSFERENCIA DE ZAPATOS SUR", 99.99),
+                _movement(date(2026, 3, 16), "COMPRA TARJ. ZAPATOS SUR", -99.99),
+                # Markers match whatever the bank's casing.
+                _movement(date(2026, 3, 20), "Transferencia a Zapatos Sur", -99.99),
+            ]
+        )
+
+    r = client.get("/bank-movements/invoice-matches", params={"year": 2026, "quarter": 1}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    body = r.json()
+
+    matched = {m["invoice"]["id"]: m for m in body["matched"]}
+    assert set(matched) == {garcia, bolsos, zapatos}
+    assert matched[garcia]["payment"]["descripcion"] == "TRANSFERENCIA A TEXTILES GARCIA S.L."
+    assert matched[garcia]["payment"]["kind"] == "transfer" and matched[garcia]["days"] == 22
+    assert (matched[bolsos]["score"], matched[bolsos]["amount_diff"]) == (2, 0.02)
+
+    assert [a["invoice"]["id"] for a in body["ambiguous"]] == norte
+    assert all(len(a["candidates"]) == 2 for a in body["ambiguous"])
+
+    assert body["unmatched_invoices"] == []
+    assert sorted(p["descripcion"] for p in body["unmatched_payments"]) == [
+        "RECIBO ENDESA",
+        "TRANSFERENCIA A DESCONOCIDO",
+    ]
+
+
+def test_resolution_propagates_unique_pairs():
+    from app.services.payment_matching import InvoiceRef, PaymentRef, find_candidates, resolve
+
+    def invoice(id: int, amount: float) -> InvoiceRef:
+        return InvoiceRef(id, "B55555555", "Punto Textil", f"PT-{id}", amount, date(2026, 1, 10))
+
+    def payment(id: int, amount: float) -> PaymentRef:
+        return PaymentRef(id, date(2026, 1, 20), "TRANSFERENCIA A PUNTO TEXTIL", amount, "transfer")
+
+    # Invoice 1 can only be paid by payment 10; once it is taken, invoice 2 is left with payment 11.
+    invoices = [invoice(2, 100.02), invoice(1, 100.0), invoice(3, 500.0)]
+    payments = [payment(11, 100.06), payment(10, 99.98), payment(12, 7.0)]
+    matched, remaining = resolve(find_candidates(invoices, payments))
+    assert [(c.invoice.id, c.payment.id) for c in matched] == [(1, 10), (2, 11)]
+    assert remaining == {}
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert, select
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    from app.services.price_rollup import SKETCH_RELATIVE_ACCURACY, sketch_add, sketch_merge, sketch_quantile
+
+    values = [0.5 + i * 0.37 for i in range(2000)]
+    left = sketch_add({}, values[::2])
+    merged = sketch_merge(left, sketch_add({}, values[1::2]))
+    ordered = sorted(values)
+    for q in (0.1, 0.5, 0.9):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch_quantile(merged, q) - exact) <= exact * SKETCH_RELATIVE_ACCURACY * 1.01
+    assert sketch_quantile({}, 0.5) is None
+    assert sketch_quantile(sketch_add({}, [0.0, 0.0, 3.0]), 0.5) == 0.0
+
+
+def _seed_observations(reference_code: str, prices: list[float], *, created_at: datetime) -> None:
+    import app.db.session as session_module
+    from app.db.models import PriceObservation
+
+    with session_module.SessionLocal() as db, db.begin():
+        start = db.scalar(select(func.coalesce(func.max(PriceObservation.line_id), 0)))
+        db.execute(
+            insert(PriceObservation),
+            [
+                {
+                    "created_at": created_at,
+                    "cif_supplier": "B12345678",
+                    "reference_code": reference_code,
+                    "observed_price": price,
+                    "invoice_id": 1,
+                    "line_id": start + i + 1,
+                }
+                for i, price in enumerate(prices)
+            ],
+        )
+
+
+def test_compaction_rolls_up_and_deletes_old_rows(client: TestClient):
+    import app.db.session as session_module
+    from app.db.models import PriceObservation, PriceObservationMonthly
+    from app.services.price_rollup import compact_price_observations
+
+    now = datetime(2026, 10, 19, 12, 0, 0)
+    _seed_observations("PRO_R1", [10.0, 20.0, 30.0], created_at=datetime(2025, 3, 5))
+    _seed_observations("PRO_R1", [40.0], created_at=datetime(2025, 3, 20))
+    _seed_observations("PRO_R2", [7.0, 9.0], created_at=datetime(2025, 4, 1))
+    _seed_observations("PRO_R1", [50.0], created_at=now - timedelta(days=10))
+
+    with session_module.SessionLocal() as db:
+        result = compact_price_observations(db, older_than_days=365, batch_size=2, now=now)
+    assert (result.observations, result.rollups, result.batches) == (6, 2, 3)
+
+    with session_module.SessionLocal() as db:
+        assert db.scalars(select(PriceObservation.observed_price)).all() == [50.0]
+        rollups = {r.reference_code: r for r in db.scalars(select(PriceObservationMonthly))}
+    r1 = rollups["PRO_R1"]
+    assert (r1.month.isoformat(), r1.count, r1.min_price, r1.max_price, r1.sum_price) == ("2025-03-01", 4, 10.0, 40.0, 100.0)
+    assert sum(r1.sketch.values()) == 4
+
+    # Re-running folds new old rows into the existing month.
+    _seed_observations("PRO_R2", [11.0], created_at=datetime(2025, 4, 2))
+    with session_module.SessionLocal() as db:
+        assert compact_price_observations(db, older_than_days=365, now=now).observations == 1
+        r2 = db.scalars(select(PriceObservationMonthly).where(PriceObservationMonthly.reference_code == "PRO_R2")).one()
+    assert (r2.count, r2.min_price, r2.max_price, sum(r2.sketch.values())) == (3, 7.0, 11.0, 3)
+
+
+def test_pricing_falls_back_to_rollups(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.db.session as session_module
+    import app.settings as settings_module
+    from app.db.models import OcrInfoClothes
+    from app.services.price_rollup import compact_price_observations
+    from app.services.pricing import evaluate_price
+
+    _seed_observations("PRO_R1", [20.0, 21.0, 22.0, 23.0], created_at=datetime(2024, 6, 1))
+    _seed_observations("PRO_R1", [22.0], created_at=datetime.now())
+    line = OcrInfoClothes(cif_supplier="B12345678", reference_code="PRO_R1", price=5.0, quantity=1)
+
+    with session_module.SessionLocal() as db:
+        assert compact_price_observations(db).observations == 4
+        decision = evaluate_price(db=db, line=line, article=None)
+    assert decision.flag == "too_low"
+    assert decision.reason == "below_0.7_of_reference_median"
+
+    monkeypatch.setenv("EMMO_PRICE_ROLLUP_FALLBACK", "false")
+    settings_module.get_settings.cache_clear()
+    with session_module.SessionLocal() as db:
+        assert evaluate_price(db=db, line=line, article=None).flag is None
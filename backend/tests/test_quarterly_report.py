@@ -0,0 +1,127 @@
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+BANK_PREAMBLE = "Cuenta;ES00 0000\n" + "\n" * 8
+
+
+def _import_bank(client: TestClient, rows: list[tuple[str, str, str]]) -> None:
+    body = "".join(f"{day};{concept};{day};{amount};;;;;\n" for day, concept, amount in rows)
+    r = client.post(
+        "/bank-movements/import",
+        files={"file": ("export.csv", (BANK_PREAMBLE + body).encode(), "text/csv")},
+        headers=HEADERS,
+    )
+    assert r.status_code == 200, r.text
+
+
+def _ingest(client: TestClient, num_invoice: str, amount: float, day: str) -> None:
+    line = {
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "reference_code": f"R-{num_invoice}",
+        "quantity": 1,
+        "price": amount,
+        "date": day,
+    }
+    payload = {
+        "source_channel": "email",
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": num_invoice,
+        "total_invoice_amount": amount,
+        "lines": [line],
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+
+
+def _report(client: TestClient, quarter: int = 1) -> dict:
+    r = client.get("/reports/quarterly", params={"year": 2026, "quarter": quarter}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_report_is_materialized_and_invalidated_per_quarter(client: TestClient):
+    first_export = [
+        ("05/01/2026", "ABONO TPV 0001", "1.000,00"),
+        ("10/01/2026", "ADEUDO RECIBO ENDESA", "-80,10"),
+        ("20/02/2026", "TRANSFERENCIA A PROVEEDOR SL", "-300,00"),
+    ]
+    _import_bank(client, first_export)
+    _ingest(client, "F-1", 300.0, "2026-01-15")
+    _ingest(client, "F-2", 120.0, "2026-03-01")
+
+    report = _report(client)
+    assert not report["cached"]
+    categories = {c["identificacion"]: c for c in report["categories"]}
+    assert categories["Suministros (CF)"]["net"] == -80.1
+    assert categories["700_000_000"]["income"] == 1000.0
+    assert report["bank_totals"] == {"movements": 3, "income": 1000.0, "expenses": -380.1, "net": 619.9}
+    assert report["suppliers"] == [
+        {"cif_supplier": "B12345678", "name_supplier": "Proveedor SL", "invoice_count": 2, "total_amount": 420.0}
+    ]
+    assert report["merchandise"] == {"invoiced": 420.0, "paid": 300.0, "difference": 120.0}
+
+    again = _report(client)
+    assert again["cached"] and again["merchandise"] == report["merchandise"]
+
+    # Changes in other quarters, or re-imports adding nothing, keep the stored report.
+    _import_bank(client, first_export + [("02/04/2026", "ADEUDO RECIBO ENDESA", "-75,00")])
+    _ingest(client, "F-3", 50.0, "2026-04-10")
+    assert _report(client)["cached"]
+    assert _report(client, quarter=2)["invoice_totals"]["total_amount"] == 50.0
+
+    _import_bank(client, [("31/03/2026", "TRANSFERENCIA A PROVEEDOR SL", "-120,00")])
+    report = _report(client)
+    assert not report["cached"]
+    assert report["merchandise"]["difference"] == 0.0
+
+    _ingest(client, "F-4", 10.0, "2026-02-01")
+    assert _report(client)["invoice_totals"] == {"suppliers": 1, "invoice_count": 3, "total_amount": 430.0}
+
+    r = client.get("/reports/quarterly", params={"year": 2026, "quarter": 1, "format": "csv"}, headers=HEADERS)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/csv")
+    lines = r.text.splitlines()
+    assert lines[0] == "seccion;clave;nombre;numero;ingresos;gastos;importe"
+    assert "categoria;Suministros (CF);;1;0,00;-80,10;-80,10" in lines
+    assert "proveedor;B12345678;Proveedor SL;3;;;430,00" in lines
+
+
+def test_report_computed_during_an_invalidation_is_not_stored(client: TestClient, monkeypatch):
+    import app.db.session as session_module
+    from app.db.models import QuarterlyReport
+    from app.services import quarterly_report
+
+    build = quarterly_report.build_report
+
+    def build_then_change(db, year, quarter):
+        payload = build(db, year, quarter)
+        # The quarter changes after the report was computed, before it is stored.
+        quarterly_report.invalidate_quarters(db, [(year, quarter)])
+        return payload
+
+    with session_module.SessionLocal() as db, db.begin():
+        quarterly_report.invalidate_quarters(db, [(2026, 1)])
+    monkeypatch.setattr(quarterly_report, "build_report", build_then_change)
+    with session_module.SessionLocal() as db, db.begin():
+        assert not quarterly_report.materialize_report(db, 2026, 1).cached
+
+    with session_module.SessionLocal() as db:
+        row = db.get(QuarterlyReport, (2026, 1))
+        assert (row.version, row.payload) == (2, None)
+
+
+def test_supplier_rename_invalidates_its_quarters(client: TestClient):
+    _ingest(client, "F-1", 300.0, "2026-01-15")
+    assert not _report(client)["cached"]
+    assert _report(client)["cached"]
+
+    r = client.put("/suppliers/B12345678", json={"name_supplier": "Proveedor Nuevo SL"}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    report = _report(client)
+    assert not report["cached"]
+    assert report["suppliers"][0]["name_supplier"] == "Proveedor Nuevo SL"
+
+    # Settings-only changes keep the stored report.
+    client.put("/suppliers/B12345678", json={"settings": {"iva": 21}}, headers=HEADERS)
+    assert _report(client)["cached"]
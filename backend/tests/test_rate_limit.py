@@ -0,0 +1,111 @@
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.rate_limit import MemoryTokenBuckets, SqliteTokenBuckets, parse_route_costs
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_memory_buckets_refill_and_evict():
+    clock = FakeClock()
+    buckets = MemoryTokenBuckets(max_keys=2, clock=clock)
+    for _ in range(3):
+        assert buckets.hit("a", capacity=3, rate=1.0, cost=1).allowed
+    denied = buckets.hit("a", capacity=3, rate=1.0, cost=1)
+    assert not denied.allowed and denied.retry_after_s == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert buckets.hit("a", capacity=3, rate=1.0, cost=1).allowed
+
+    buckets.hit("b", capacity=3, rate=1.0, cost=1)
+    buckets.hit("c", capacity=3, rate=1.0, cost=1)
+    assert len(buckets) == 2
+
+
+def test_sqlite_buckets_are_shared(tmp_path: Path):
+    clock = FakeClock()
+    path = str(tmp_path / "rl.db")
+    worker_a = SqliteTokenBuckets(path, max_keys=100, clock=clock)
+    worker_b = SqliteTokenBuckets(path, max_keys=100, clock=clock)
+    assert worker_a.hit("ip:1", capacity=2, rate=0.1, cost=1).allowed
+    assert worker_b.hit("ip:1", capacity=2, rate=0.1, cost=1).allowed
+    assert not worker_a.hit("ip:1", capacity=2, rate=0.1, cost=1).allowed
+
+
+def test_middleware_applies_route_costs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    import app.settings as settings_module
+    from app.middleware.rate_limit import RateLimitMiddleware
+
+    monkeypatch.setenv("EMMO_RATE_LIMIT_PER_MINUTE", "6")
+    monkeypatch.setenv("EMMO_RATE_LIMIT_ROUTE_COSTS", "POST /upload=5")
+    monkeypatch.setenv("EMMO_API_KEY", "k")
+    settings_module.get_settings.cache_clear()
+
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.post("/upload")
+    def upload():
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        assert client.post("/upload").status_code == 200
+        assert client.get("/ping").status_code == 200
+        r = client.post("/upload")
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+        # A wrong key is still limited per IP; the configured key has its own bucket.
+        assert client.post("/upload", headers={"X-API-Key": "random-1"}).status_code == 429
+        assert client.post("/upload", headers={"X-API-Key": "k"}).status_code == 200
+
+    assert parse_route_costs("POST /a=2, GET /b/*=0.5") == [("POST", "/a", 2.0), ("GET", "/b/*", 0.5)]
+
+
+def test_sqlite_store_hits_off_the_event_loop(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    import asyncio
+
+    import app.settings as settings_module
+    from app.middleware.rate_limit import RateLimitMiddleware
+
+    monkeypatch.setenv("EMMO_RATE_LIMIT_PER_MINUTE", "1")
+    monkeypatch.setenv("EMMO_RATE_LIMIT_STORE", "sqlite")
+    monkeypatch.setenv("EMMO_RATE_LIMIT_SQLITE_PATH", str(tmp_path / "rl.db"))
+    settings_module.get_settings.cache_clear()
+
+    loops: list[bool] = []
+    hit = SqliteTokenBuckets.hit
+
+    def recording_hit(self, key, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            loops.append(True)
+        except RuntimeError:
+            loops.append(False)
+        return hit(self, key, **kwargs)
+
+    monkeypatch.setattr(SqliteTokenBuckets, "hit", recording_hit)
+
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        assert client.get("/ping").status_code == 200
+        assert client.get("/ping").status_code == 429
+    assert loops == [False, False]
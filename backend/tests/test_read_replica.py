@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+@pytest.fixture()
+def replica_client(client: TestClient, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    """A "replica" that never catches up: an empty copy of the schema."""
+    import app.db.session as session_module
+    import app.main as main_module
+    import app.settings as settings_module
+    from app.db.base import Base
+
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    Base.metadata.create_all(create_engine(replica_url))
+    monkeypatch.setenv("EMMO_READ_DATABASE_URL", replica_url)
+    settings_module.get_settings.cache_clear()
+    session_module.init_engine(settings_module.get_settings().database_url)
+
+    with TestClient(main_module.create_app()) as replica_test_client:
+        yield replica_test_client
+
+
+def _ingest(c: TestClient) -> int:
+    body = {"source_channel": "email", "cif_supplier": "B12345678", "num_invoice": "F-1", "lines": []}
+    r = c.post("/ingest/invoice", json=body, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    assert "emmo_read_primary_until" in r.headers["set-cookie"]
+    return r.json()["invoice"]["id"]
+
+
+def test_reads_go_to_replica_except_right_after_a_write(replica_client: TestClient):
+    invoice_id = _ingest(replica_client)
+
+    # Same client session (cookie) reads its own write from the primary.
+    assert replica_client.get(f"/invoices/{invoice_id}").status_code == 200
+
+    replica_client.cookies.clear()
+    assert replica_client.get(f"/invoices/{invoice_id}").status_code == 404
+    fresh = replica_client.get(f"/invoices/{invoice_id}", headers={"X-Read-Primary": "true"})
+    assert fresh.status_code == 200
+
+
+def test_pool_stats_per_engine(replica_client: TestClient):
+    replica_client.get("/invoices")
+    stats = replica_client.get("/health/db/pools").json()
+    assert {"primary", "read"} <= set(stats)
+    assert stats["read"]["checked_in"] >= 1
+
+    text = replica_client.get("/metrics").text
+    assert 'emmo_db_pool_connections{engine="read",state="checked_in"}' in text
@@ -0,0 +1,95 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.reference_match import BKTree, ReferenceIndex, fold_reference, levenshtein
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def test_fold_and_distance():
+    assert fold_reference("abc-1O0") == fold_reference("A8C 100")
+    assert levenshtein("ABC123", "ABC124", 2) == 1
+    assert levenshtein("ABC123", "XYZ999", 2) == 3
+
+    tree = BKTree()
+    for key in ["A8C100", "A8C101", "ZZZ999", "A8C1000"]:
+        tree.add(key)
+    assert [k for _, k in tree.search("A8C100", 1)] == ["A8C100", "A8C1000", "A8C101"]
+
+
+def test_index_keeps_supplier_prefixes_apart():
+    index = ReferenceIndex()
+    index.add("PRO_ABC100")
+    index.add("OTR_ABC100")
+    assert "PRO_ABC100" in index
+
+    candidates = index.candidates("PRO_A8C-1OO", max_distance=0)
+    assert [c.reference_code for c in candidates] == ["PRO_ABC100"]
+
+
+def _ingest(client: TestClient, reference_code: str, message_id: str):
+    payload = {
+        "source_channel": "whatsapp",
+        "source_message_id": message_id,
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": f"F-{message_id}",
+        "lines": [
+            {
+                "cif_supplier": "B12345678",
+                "name_supplier": "Proveedor SL",
+                "reference_code": reference_code,
+                "description": "PANTALON",
+                "quantity": 1,
+                "price": 10.0,
+            }
+        ],
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_ingest_suggests_close_master_reference(client: TestClient):
+    r = client.put("/articles", json={"reference_code": "PRO_ABC-100", "coste_unitario": 10.0}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+
+    data = _ingest(client, "ABC-1OO", "m1")
+    line = data["lines"][0]
+    assert line["reference_code"] == "PRO_ABC-1OO"
+    assert line["reference_code_suggestion"] == "PRO_ABC-100"
+
+    r = client.get("/articles/match", params={"reference_code": "A8C1O0", "name_supplier": "Proveedor SL"})
+    assert r.status_code == 200, r.text
+    assert {"reference_code": "PRO_ABC-100", "distance": 0} in r.json()
+
+
+def test_ingest_auto_links_confusable_reference(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.settings as settings_module
+
+    monkeypatch.setenv("EMMO_REFERENCE_MATCH_MODE", "auto_link")
+    settings_module.get_settings.cache_clear()
+
+    client.put("/articles", json={"reference_code": "PRO_ABC-100", "coste_unitario": 10.0}, headers=HEADERS)
+
+    data = _ingest(client, "abc 1O0", "m2")
+    line = data["lines"][0]
+    assert line["reference_code"] == "PRO_ABC-100"
+    assert line["reference_code_origin"] == "fuzzy"
+    assert data["articles_upserted"] == 0
+
+
+def test_index_only_gets_committed_references(client: TestClient):
+    import app.db.session as session_module
+    from app.services.reference_match import get_reference_index, register_reference
+
+    with session_module.SessionLocal() as db:
+        index = get_reference_index(db)
+        register_reference(db, "PRO_GHOST1")
+        db.rollback()
+        assert "PRO_GHOST1" not in index
+
+        register_reference(db, "PRO_REAL1")
+        assert "PRO_REAL1" not in index
+        db.commit()
+        assert "PRO_REAL1" in index
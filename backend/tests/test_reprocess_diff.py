@@ -0,0 +1,125 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _use_ocr(monkeypatch: pytest.MonkeyPatch, lines: list[tuple]) -> None:
+    from app.services.ocr import OcrService, ParsedInvoice, ParsedLine
+
+    parsed = ParsedInvoice(
+        cif_supplier="B12345678",
+        name_supplier="Proveedor SL",
+        tel_number_supplier=None,
+        email_supplier=None,
+        num_invoice="F-9",
+        invoice_date=None,
+        total_invoice_amount=None,
+        invoice_type=None,
+        optional_fields=None,
+        raw_text=None,
+    )
+    parsed_lines = [ParsedLine(ref, desc, 1, price, price) for ref, desc, price in lines]
+    monkeypatch.setattr(OcrService, "parse", lambda self, file_bytes, filename: (parsed, parsed_lines))
+
+
+def _observations(invoice_id: int) -> dict[int, tuple[int, float]]:
+    import app.db.session as session_module
+    from app.db.models import PriceObservation
+
+    with session_module.SessionLocal() as db:
+        q = select(PriceObservation).where(PriceObservation.invoice_id == invoice_id)
+        return {o.line_id: (o.id, o.observed_price) for o in db.scalars(q)}
+
+
+def test_reprocess_diff_touches_only_changed_lines(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    _use_ocr(
+        monkeypatch,
+        [("R1", "FALDA", 10.0), ("R2", "BLUSA", 20.0), ("R3", "ABRIGO", 30.0), ("R5", "GORRO", 8.0), (None, "CINTURON", 5.0)],
+    )
+    files = {"file": ("a.pdf", b"%PDF-1.4 diff", "application/pdf")}
+    first = client.post("/process/invoice", files=files, headers=HEADERS).json()
+    invoice_id = first["invoice"]["id"]
+    before = {ln["reference_code"]: ln for ln in first["lines"]}
+    obs_before = _observations(invoice_id)
+
+    _use_ocr(monkeypatch, [("R1", "FALDA", 10.0), ("R2", "BLUSA", 25.0), ("R4", "JERSEY", 40.0), (None, "CINTURON PIEL", 5.0)])
+    files = {"file": ("b.pdf", b"%PDF-1.4 diff 2", "application/pdf")}
+    r = client.post(f"/invoices/{invoice_id}/process", files=files, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    after = {ln["reference_code"]: ln for ln in r.json()["lines"]}
+    obs_after = _observations(invoice_id)
+
+    r1, r2 = before["PRO_R1"]["id"], before["PRO_R2"]["id"]
+    assert after["PRO_R1"]["id"] == r1 and obs_after[r1] == obs_before[r1]  # untouched
+    assert after["PRO_R2"]["id"] == r2 and obs_after[r2][1] == 25.0  # repriced in place
+    # R4 takes R3's row (unmatched references are paired by position) and is repriced.
+    assert after["PRO_R4"]["id"] == before["PRO_R3"]["id"] and obs_after[after["PRO_R4"]["id"]][1] == 40.0
+    assert "PRO_R5" not in after and before["PRO_R5"]["id"] not in obs_after  # removed with its observation
+    assert after[None]["id"] == before[None]["id"]  # paired by position
+    assert after[None]["description"] == "CINTURON PIEL"
+
+
+def test_reprocess_replace_mode_reinserts(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.settings as settings_module
+
+    monkeypatch.setenv("EMMO_REPROCESS_MODE", "replace")
+    settings_module.get_settings.cache_clear()
+    _use_ocr(monkeypatch, [("R1", "FALDA", 10.0)])
+    files = {"file": ("a.pdf", b"%PDF-1.4 replace", "application/pdf")}
+    first = client.post("/process/invoice", files=files, headers=HEADERS).json()
+    invoice_id = first["invoice"]["id"]
+
+    r = client.post(f"/invoices/{invoice_id}/process", files=files, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    assert len(r.json()["lines"]) == 1
+    assert list(_observations(invoice_id)) == [r.json()["lines"][0]["id"]]
+
+
+def test_reprocess_does_not_keep_a_corrected_price(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    import app.db.session as session_module
+    import app.settings as settings_module
+    from app.db.models import ImportacionArticulosMontcau, PriceObservation
+
+    monkeypatch.setenv("EMMO_PRICE_CORRECTION_MODE", "floor_to_cost")
+    settings_module.get_settings.cache_clear()
+    with session_module.SessionLocal() as db:
+        db.add(ImportacionArticulosMontcau(reference_code="PRO_R1", descripcion="FALDA", coste_unitario=10.0))
+        db.commit()
+
+    _use_ocr(monkeypatch, [])
+    files = {"file": ("a.pdf", b"%PDF-1.4 corrected", "application/pdf")}
+    invoice_id = client.post("/process/invoice", files=files, headers=HEADERS).json()["invoice"]["id"]
+    line = client.post(
+        f"/invoices/{invoice_id}/lines",
+        json={
+            "cif_supplier": "B12345678",
+            "name_supplier": "Proveedor SL",
+            "num_invoice": "F-9",
+            "reference_code": "R1",
+            "description": "FALDA",
+            "quantity": 1,
+            "price": 2.0,
+            "total_no_iva": 2.0,
+        },
+        headers=HEADERS,
+    ).json()
+    assert line["reference_code"] == "PRO_R1"
+    assert line["price"] == 10.0 and line["price_flag"] == "corrected_to_cost"
+
+    _use_ocr(monkeypatch, [("R9", "FALDA", 2.0)])
+    files = {"file": ("b.pdf", b"%PDF-1.4 corrected 2", "application/pdf")}
+    r = client.post(f"/invoices/{invoice_id}/process", files=files, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    line = r.json()["lines"][0]
+    assert line["reference_code"] == "PRO_R9"
+    assert line["price"] == 2.0 and line["price_flag"] is None
+
+    with session_module.SessionLocal() as db:
+        q = select(PriceObservation.observed_price).where(PriceObservation.invoice_id == invoice_id)
+        assert list(db.scalars(q)) == [2.0]
+        article = db.scalars(
+            select(ImportacionArticulosMontcau).where(ImportacionArticulosMontcau.reference_code == "PRO_R9")
+        ).one()
+        assert article.coste_unitario == 2.0
@@ -0,0 +1,50 @@
+import threading
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, text
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def test_writer_and_reader_pragmas(client: TestClient):
+    import app.db.session as session_module
+
+    assert session_module.engine.pool.size() == 1
+    with session_module.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    with session_module.read_engine.connect() as conn:
+        assert conn.execute(text("PRAGMA query_only")).scalar() == 1
+
+
+def test_get_requests_use_the_reader_pool(client: TestClient):
+    import app.db.session as session_module
+
+    assert client.get("/invoices").status_code == 200
+    assert session_module.read_engine.pool.checkedin() >= 1
+
+
+def test_concurrent_writers_are_serialized(client: TestClient):
+    import app.db.session as session_module
+    from app.db.models import DataOcrInvoice
+
+    errors: list[Exception] = []
+
+    def write(n: int) -> None:
+        try:
+            for k in range(10):
+                with session_module.SessionLocal() as db, db.begin():
+                    db.add(DataOcrInvoice(cif_supplier=f"B{n}", num_invoice=f"T-{n}-{k}", status="draft"))
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with session_module.ReadSessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(DataOcrInvoice)) == 80
@@ -0,0 +1,78 @@
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _ingest(client: TestClient) -> int:
+    lines = [
+        {
+            "cif_supplier": "B12345678",
+            "name_supplier": "Proveedor SL",
+            "reference_code": f"R{n}",
+            "quantity": 1,
+            "price": 10.0 + n,
+            "date": "2026-02-10",
+        }
+        for n in range(3)
+    ]
+    payload = {
+        "source_channel": "email",
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": "F-1",
+        "lines": lines,
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()["invoice"]["id"]
+
+
+def _cache(client: TestClient) -> dict:
+    r = client.get("/health/db/statement-cache", headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_hot_statements_hit_the_compiled_cache(client: TestClient):
+    invoice_id = _ingest(client)
+    reference = client.get(f"/invoices/{invoice_id}/lines", headers=HEADERS).json()[0]["reference_code"]
+    client.get(f"/articles/{reference}", headers=HEADERS)
+
+    before = _cache(client)
+    assert before["engines"]["primary"]["capacity"] == 1200
+    for _ in range(5):
+        lines = client.get(f"/invoices/{invoice_id}/lines", headers=HEADERS).json()
+        assert client.get(f"/articles/{reference}", headers=HEADERS).status_code == 200
+    assert [ln["id"] for ln in lines] == sorted(ln["id"] for ln in lines)
+
+    after = _cache(client)
+    # Invoice + lines + article per iteration, all served from the cache.
+    assert after["results"]["hit"] - before["results"].get("hit", 0) >= 15
+    assert after["results"].get("miss", 0) == before["results"].get("miss", 0)
+
+
+def test_invoice_lines_with_partition_key(client: TestClient, monkeypatch):
+    import app.db.session as session_module
+    from app.db.models import DataOcrInvoice
+    from app.db.statements import invoice_lines
+    from app.settings import get_settings
+
+    invoice_id = _ingest(client)
+    monkeypatch.setenv("EMMO_DB_PARTITIONING", "quarter")
+    get_settings.cache_clear()
+    with session_module.SessionLocal() as db:
+        invoice = db.get(DataOcrInvoice, invoice_id)
+        assert [ln.reference_code for ln in invoice_lines(db, invoice)] == ["PRO_R0", "PRO_R1", "PRO_R2"]
+
+
+def test_psycopg_prepared_statements(monkeypatch):
+    from app.db.session import _prepare_connect_args
+    from app.settings import get_settings
+
+    get_settings.cache_clear()
+    assert _prepare_connect_args("postgresql+psycopg://u:p@db/emmo") == {"prepare_threshold": 2}
+    assert _prepare_connect_args("postgresql+psycopg2://u:p@db/emmo") == {}
+    monkeypatch.setenv("EMMO_DB_PREPARED_STATEMENTS", "false")
+    get_settings.cache_clear()
+    assert _prepare_connect_args("postgresql+psycopg://u:p@db/emmo") == {"prepare_threshold": None}
+    get_settings.cache_clear()
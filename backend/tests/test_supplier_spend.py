@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _line(reference_code: str, *, quantity: int, price: float, day: str) -> dict:
+    return {
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "reference_code": reference_code,
+        "quantity": quantity,
+        "price": price,
+        "date": day,
+    }
+
+
+def _ingest(client: TestClient, num_invoice: str, amount: float, lines: list[dict]) -> int:
+    payload = {
+        "source_channel": "email",
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "num_invoice": num_invoice,
+        "total_invoice_amount": amount,
+        "lines": lines,
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return r.json()["invoice"]["id"]
+
+
+def _spend(client: TestClient, **params) -> list[dict]:
+    r = client.get("/analytics/supplier-spend", params=params, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    return [{k: v for k, v in row.items() if k != "updated_at"} for row in r.json()]
+
+
+def test_spend_summary_follows_invoice_changes(client: TestClient):
+    import app.db.session as session_module
+    from app.services.supplier_spend import rebuild_supplier_spend
+
+    _ingest(
+        client,
+        "F-1",
+        100.0,
+        [_line("R1", quantity=2, price=10.0, day="2026-02-10"), _line("R2", quantity=3, price=10.0, day="2026-02-10")],
+    )
+    second = _ingest(client, "F-2", 50.0, [])
+    # No lines yet: counted in the ingestion quarter.
+    today = datetime.now(timezone.utc).date()
+    assert (today.year, (today.month - 1) // 3 + 1) in {(r["year"], r["quarter"]) for r in _spend(client)}
+
+    # A dated line moves the invoice to its quarter; below the article cost it is flagged.
+    r = client.post(
+        f"/invoices/{second}/lines",
+        json=_line("R1", quantity=1, price=1.0, day="2026-03-01"),
+        headers=HEADERS,
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["price_flag"] == "too_low"
+    q1 = {
+        "cif_supplier": "B12345678",
+        "year": 2026,
+        "quarter": 1,
+        "invoice_count": 2,
+        "total_amount": 150.0,
+        "line_count": 3,
+        "units": 6,
+        "flagged_lines": 1,
+    }
+    assert _spend(client) == [q1]
+
+    r = client.put(f"/invoices/{second}/status", json={"status": "duplicate"}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    incremental = _spend(client, cif_supplier="B12345678", year=2026, quarter=1)
+    assert incremental == [
+        {**q1, "invoice_count": 1, "total_amount": 100.0, "line_count": 2, "units": 5, "flagged_lines": 0}
+    ]
+
+    with session_module.SessionLocal() as db, db.begin():
+        assert rebuild_supplier_spend(db) == {"invoices": 1, "summaries": 1}
+    assert _spend(client) == incremental
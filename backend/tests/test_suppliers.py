@@ -0,0 +1,108 @@
+from fastapi.testclient import TestClient
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+def _line(name_supplier: str | None, reference_code: str) -> dict:
+    return {
+        "cif_supplier": "B12345678",
+        "name_supplier": name_supplier,
+        "reference_code": reference_code,
+        "description": "CAMISETA",
+        "quantity": 1,
+        "price": 5.0,
+    }
+
+
+def test_supplier_prefix_is_pinned_by_cif(client: TestClient):
+    payload = {
+        "source_channel": "whatsapp",
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "lines": [_line("Proveedor SL", "A1"), _line("Textiles Proveedor", "A2")],
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    assert [ln["reference_code"] for ln in r.json()["lines"]] == ["PRO_A1", "PRO_A2"]
+
+    supplier = client.get("/suppliers/B12345678").json()
+    assert supplier["canonical_prefix"] == "PRO"
+    assert supplier["name_variants"] == ["Proveedor SL", "Textiles Proveedor"]
+
+
+def test_supplier_first_seen_without_name_gets_prefix_from_first_name(client: TestClient):
+    body = {"source_channel": "email", "cif_supplier": "B00000001", "lines": []}
+    invoice = client.post("/ingest/invoice", json=body, headers=HEADERS).json()["invoice"]
+    line = {**_line(None, "A0"), "num_invoice": None}
+    r = client.post(f"/invoices/{invoice['id']}/lines", json=line, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    assert client.get("/suppliers/B12345678").json()["canonical_prefix"] is None
+
+    payload = {
+        "source_channel": "whatsapp",
+        "cif_supplier": "B12345678",
+        "name_supplier": "Proveedor SL",
+        "lines": [_line("Proveedor SL", "A1")],
+    }
+    r = client.post("/ingest/invoice", json=payload, headers=HEADERS)
+    assert r.status_code == 200, r.text
+    assert [ln["reference_code"] for ln in r.json()["lines"]] == ["PRO_A1"]
+    supplier = client.get("/suppliers/B12345678").json()
+    assert supplier["canonical_prefix"] == "PRO" and supplier["name_supplier"] == "Proveedor SL"
+
+
+def test_put_supplier_and_batch_normalize(client: TestClient):
+    r = client.put("/suppliers/B87654321", json={"name_supplier": "Moda SA", "canonical_prefix": "MDS"}, headers=HEADERS)
+    assert r.status_code == 200, r.text
+
+    r = client.post(
+        "/suppliers/B87654321/normalize",
+        json={"reference_codes": ["X1", " ", "MDS_X2", None]},
+        headers=HEADERS,
+    )
+    assert r.status_code == 200, r.text
+    assert r.json() == {"canonical_prefix": "MDS", "reference_codes": ["MDS_X1", None, "MDS_X2", None]}
+
+    r = client.put("/suppliers/B87654321", json={"canonical_prefix": "TOOLONG"}, headers=HEADERS)
+    assert r.status_code == 422
+
+
+def test_registry_publishes_only_committed_suppliers(client: TestClient):
+    import app.db.session as session_module
+    from app.db.models import Supplier
+    from app.services.suppliers import get_supplier_registry, resolve_supplier, resolve_supplier_prefix
+
+    with session_module.SessionLocal() as db:
+        assert resolve_supplier_prefix(db, cif_supplier="B99999999", name_supplier="Nuevo SL") == "NUE"
+        db.rollback()
+        assert "B99999999" not in get_supplier_registry(db)
+        assert db.get(Supplier, "B99999999") is None
+
+        resolve_supplier(db, cif_supplier="B99999999", name_supplier="Nuevo SL")
+        db.commit()
+        assert "B99999999" in get_supplier_registry(db)
+
+    with session_module.SessionLocal() as db:
+        assert db.get(Supplier, "B99999999").canonical_prefix == "NUE"
+
+
+def test_registry_reloads_after_ttl(client: TestClient, monkeypatch):
+    import time
+
+    import app.db.session as session_module
+    import app.settings as settings_module
+    from app.db.models import Supplier
+    from app.services.suppliers import resolve_supplier_prefix
+
+    assert client.put("/suppliers/B55555555", json={"name_supplier": "Moda SA"}, headers=HEADERS).status_code == 200
+    with session_module.SessionLocal() as db:
+        assert resolve_supplier_prefix(db, cif_supplier="B55555555", name_supplier="Moda SA") == "MOD"
+        # Another worker changes the prefix.
+        db.get(Supplier, "B55555555").canonical_prefix = "MDS"
+        db.commit()
+
+    monkeypatch.setenv("EMMO_SUPPLIER_REGISTRY_TTL_S", "0.01")
+    settings_module.get_settings.cache_clear()
+    time.sleep(0.02)
+    with session_module.SessionLocal() as db:
+        assert resolve_supplier_prefix(db, cif_supplier="B55555555", name_supplier="Moda SA") == "MDS"